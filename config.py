@@ -5,6 +5,7 @@
 import atexit
 import json
 import logging
+import multiprocessing
 import os
 from openai import OpenAI
 
@@ -73,6 +74,28 @@ class UserSettings:
             "Upgrade-Insecure-Requests": "1",
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/135.0.0.0 Safari/537.36 Edg/135.0.0.0"
         }
+        self.http_pool_size = 64  # 每个host的keep-alive连接池大小
+        self.http_max_retries = 3  # 连接错误及5xx的自动重试次数
+        self.crawl_adaptive_concurrency = True  # 是否使用AIMD控制器根据限流与延迟自动调整并发
+        self.crawl_min_concurrency = 1
+        self.crawl_journal_path = './results/crawl_journal.sqlite3'  # 记录各阶段每个项目的状态，用于崩溃后恢复
+        self.project_manifest_path = './results/project_manifest.sqlite3'  # 项目状态索引，扫描时查询索引代替遍历项目文件夹
+        self.image_download_validate = True  # 下载图片时检查Content-Length及JPEG结束标记
+        # 图片按内容保存在image_blob_dir中，项目文件夹中为硬链接（与blob共享inode，不要原地修改图片）
+        # image_blob_dir需与项目文件夹位于同一文件系统，否则不会去重
+        self.image_blob_store_enabled = False
+        self.image_blob_dir = './results/blobs'
+        # 新下载图片的保存方式: files（image_gallery/<variant>/中的单独文件）或shards（打包追加到<projects_dir>旁的image_shards/*.tar中）
+        self.image_storage_format = 'files'
+        self.image_shard_max_bytes = 1024 ** 3  # 单个shard的大小上限
+        # image gallery中各尺寸(url_<variant>)图片的标称长边像素，用于按目标分辨率选择下载的尺寸，可根据CDN的实际尺寸调整
+        self.image_variant_sizes = {"medium": 640, "slideshow": 1200, "large": 2048}
+        # 解析html使用的BeautifulSoup tree builder: html.parser（纯python，最慢）或lxml，切换前可用dev/benchmark_parsers.py对比结果
+        self.html_parser_backend = 'html.parser'
+        self.json_pretty = False  # content.json等文件默认紧凑输出，调试时可设为True输出缩进格式
+        self.parse_executor = 'process'  # 解析html的执行方式: process（多进程，随CPU核数扩展）或thread
+        self.parse_num_processes = 0  # 0表示使用全部CPU核
+        self.parse_chunk_size = 32  # 每次交给worker进程的项目数量
         # endregion
 
         # region archdaily
@@ -85,6 +108,11 @@ class UserSettings:
             "Benefits", "Archive", "Content", "Maps", "Audio",
             "Check the latest Chairs", "Check the latest Counters"
         }
+        self.archdaily_max_concurrency = 512  # asyncio抓取引擎的最大在途请求数
+        # content.html的存储格式: none, gzip, zstd；压缩后的html为content.html.gz/.zst，直接打开content.html的外部脚本需要改用io_utils.read_html
+        self.archdaily_html_compression = 'none'
+        self.archdaily_search_api_url = "https://www.archdaily.com/search/api/v1/us/projects"
+        self.archdaily_discover_window = 8  # 增量发现时同时在途的搜索页数量
         # endregion
 
 
@@ -92,6 +120,8 @@ class UserSettings:
         self.gooood_base_url = "https://dashboard.gooood.cn/api/wp/v2/fetch-posts?page=<page>&per_page=18&post_type%5B0%5D=post&post_type%5B1%5D=jobs"
         self.gooood_results_dir = "./results/gooood"
         self.gooood_projects_dir = "./results/gooood/projects"
+        self.gooood_per_page = 18  # 每页的项目数量，会替换gooood_base_url中的per_page，WordPress接口一般最大为100
+        self.gooood_page_window = 8  # 同时在途的页面数量
 
         # endregion
 
@@ -141,4 +171,12 @@ def save_user_settings(_user_settings: UserSettings) -> None:
 user_settings: UserSettings = UserSettings()
 load_user_settings(user_settings)  # load user settings on start
 
-atexit.register(save_user_settings, user_settings)
\ No newline at end of file
+
+def _save_user_settings_on_exit(_user_settings: UserSettings) -> None:
+    # spawn方式启动的子进程（如解析进程池的worker）也会导入config，退出时不能用自己的副本覆盖user_settings.json
+    # 子进程导入主模块时parent_process()尚未设置，因此在退出时而不是注册时判断
+    if multiprocessing.parent_process() is None:
+        save_user_settings(_user_settings)
+
+
+atexit.register(_save_user_settings_on_exit, user_settings)
\ No newline at end of file
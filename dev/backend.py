@@ -3,7 +3,6 @@
 # @Time    : 4/21/2025 3:40 PM
 # @Function:
 import atexit
-import json
 import logging
 import os
 import random
@@ -14,18 +13,21 @@ import warnings
 import math
 from datetime import datetime
 from abc import abstractmethod
-from collections import deque
+from collections import OrderedDict, deque
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Callable, Optional, Any
 
 import cv2
 import numpy as np
-import requests
 import streamlit as st
 from PIL import Image, ImageDraw
 from tqdm import tqdm
 
 from utils import db_utils
+from utils.blob_utils import load_blob_index
+from utils.io_utils import html_exists, list_gallery_image_paths
+from utils.json_utils import dump_json, load_json, loads
+from utils.shard_utils import get_gallery_image_sha256, open_gallery_image
 
 logging.info("Backend Reloaded ============================================================")
 
@@ -301,6 +303,13 @@ def create_global_app_state():
 g = create_global_app_state()  # this g is shared by all users and only be loaded once
 
 
+@st.cache_resource
+def get_invalid_project_id_store():
+    # 无效id在所有任务之间共享，只加载一次
+    from utils.invalid_id_utils import InvalidProjectIdStore
+    return InvalidProjectIdStore(user_settings.archdaily_invalid_projects_ids_path)
+
+
 # region UI Templates
 def template_flags(flag_type):
     if flag_type not in g.flag_states:
@@ -339,6 +348,7 @@ def template_start_work_with_progress(label, ctx_name, working_content: Callable
                                       *args,
                                       ctx_singleton=True, ctx_enable_ctx_scope_check=False,
                                       st_show_detail_number=False, st_show_detail_project_id=False,
+                                      st_show_rate_controllers=False,
                                       st_button_type='primary', st_button_icon=None) -> dict:
     disabled = False
     suffix = ""
@@ -367,6 +377,7 @@ def template_start_work_with_progress(label, ctx_name, working_content: Callable
     # region placeholders
     stop_placeholder = st.empty()
     progress_placeholder = st.empty()
+    rate_controllers_placeholder = st.empty() if st_show_rate_controllers else None
     running_projects_placeholder, success_projects_placeholder, failed_projects_placeholder = None, None, None
     running_projects_detail_placeholder, success_projects_detail_placeholder, failed_projects_detail_placeholder = None, None, None
 
@@ -394,6 +405,10 @@ def template_start_work_with_progress(label, ctx_name, working_content: Callable
         should_stop = status['should_stop']
         # region these components update every 0.5 seconds
         progress_placeholder.progress(status['curr'] / status['total'], text=f"{status['curr']}/{status['total']}")
+        if st_show_rate_controllers:
+            from utils.rate_utils import get_all_controllers
+            rate_controllers_placeholder.text(
+                '\n'.join([controller.get_status_str() for controller in get_all_controllers()]))
         if st_show_detail_number:
             running_projects_placeholder.text(f"运行中: {len(ctx.running_projects)}")
             success_projects_placeholder.text(f"成功: {len(ctx.success_projects)}")
@@ -413,6 +428,8 @@ def template_start_work_with_progress(label, ctx_name, working_content: Callable
     # clear placeholders
     stop_placeholder.empty()
     progress_placeholder.empty()
+    if rate_controllers_placeholder is not None:
+        rate_controllers_placeholder.empty()
     if status['success']:
         st.success(f"{status['msg']}")
     else:
@@ -461,138 +478,416 @@ def template_mongodb_connection_region(db_name, db_name_setter: Callable[[str],
 # region Archdaily Functions
 def archdaily__scan_projects_with_no_content_html(ctx: WorkingContext, *args):
     _ = args
-    _all_projects = os.listdir(user_settings.archdaily_projects_dir)
-    ctx.set_total(len(_all_projects))
-    g.project_id_queue = []
-    for project_id in _all_projects:
-        ctx.report_project_start(project_id)
-        if ctx.should_stop:
-            break
-        ctx.update(1)
-        folder_path = os.path.join(user_settings.archdaily_projects_dir, project_id)
-        if os.path.isdir(folder_path):
-            html_file_path = os.path.join(folder_path, f'content.html')  # 扫描是否有content.html
-            if not os.path.exists(html_file_path):
-                g.project_id_queue.append(project_id)
-        ctx.report_project_success(project_id)
+    manifest = _get_built_project_manifest(ctx, user_settings.archdaily_projects_dir)
+    if manifest is None:
+        return
+    g.project_id_queue = manifest.query('archdaily', 'has_html = 0')  # 没有content.html（任意存储格式）的项目
+    ctx.custom_data['final_msg'] = f"{len(g.project_id_queue)}个项目没有content.html，已添加到队列"
+
+
+def archdaily__scan_projects_with_content_html(ctx: WorkingContext, *args):
+    """扫描已有content.html的项目，用于条件请求刷新"""
+    _ = args
+    manifest = _get_built_project_manifest(ctx, user_settings.archdaily_projects_dir)
+    if manifest is None:
+        return
+    g.project_id_queue = manifest.query('archdaily', 'has_html = 1')
 
 
 def archdaily__scan_valid_project_id_in_range(ctx: WorkingContext, start_id: int, end_id: int):
     ctx.set_total(4)
 
-    # 从本地文件加载invalid_project_ids
-    if os.path.exists(user_settings.archdaily_invalid_projects_ids_path):
-        with open(user_settings.archdaily_invalid_projects_ids_path, 'r', encoding='utf-8') as f:
-            invalid_project_ids = set(json.load(f))
-    else:
-        invalid_project_ids = set()
+    # 加载invalid_project_ids（有序数组 + 追加日志）
+    invalid_project_ids = get_invalid_project_id_store()
     ctx.set_curr(1)
-    id_range = list(range(start_id, end_id + 1)) if start_id <= end_id else list(range(end_id, start_id + 1))
+    project_ids = np.arange(min(start_id, end_id), max(start_id, end_id) + 1, dtype=np.int64)
     if start_id > end_id:
-        id_range.reverse()
-    project_id_queue_full: list[str] = [str(project_id) for project_id in id_range]
+        project_ids = project_ids[::-1]
     ctx.set_curr(2)
     # 扣除all_projects已经存在的项目
-    all_projects_set = set(os.listdir(user_settings.archdaily_projects_dir))
-    project_id_queue = [project_id for project_id in project_id_queue_full if
-                        project_id not in all_projects_set]
+    existing_project_ids = np.array([int(name) for name in os.listdir(user_settings.archdaily_projects_dir)
+                                     if name.isdigit()], dtype=np.int64)
+    project_ids = project_ids[~np.isin(project_ids, existing_project_ids)]
     ctx.set_curr(3)
     # 扣除invalid_project_ids
-    project_id_queue = [project_id for project_id in project_id_queue if
-                        project_id not in invalid_project_ids]
+    project_ids = invalid_project_ids.filter_ids(project_ids)
     ctx.set_curr(4)
-    g.project_id_queue = project_id_queue
+    g.project_id_queue = project_ids.astype(str).tolist()
 
 
-def archdaily__scan_projects_folder_for_parsing_content(ctx: WorkingContext, skip_exist=False, *args):
+def archdaily__probe_project_ids(ctx: WorkingContext, *args):
+    """
+    对队列中的project id发送HEAD请求进行探测，只保留有效的项目，404和非项目的重定向记录到invalid_project_ids
+    探测结果无法确定的项目（超时、5xx等）同样保留，交给后续的完整下载处理
+    """
     _ = args
-    _all_projects = os.listdir(user_settings.archdaily_projects_dir)
-    ctx.set_total(len(_all_projects))
+    from utils.html_utils import probe_project_url_archdaily_async
+    from utils.crawl_utils import run_async_crawl
+    from utils.rate_utils import get_controller
 
-    if _all_projects == 0:
-        raise Exception("没有找到任何项目")
+    invalid_project_ids = get_invalid_project_id_store()
+    _total = len(g.project_id_queue)
+    assert _total > 0, "没有项目需要探测"
+    ctx.set_total(_total)
+    saving_gap = 100
 
-    ctx.report_msg("正在扫描本地文件...")
-    g.project_id_queue = []
-    num_projects_with_no_content_html = 0
-    for project_id in _all_projects:
-        ctx.update(1)
-        if ctx.should_stop:
-            break
-        if skip_exist:
-            json_file_path = os.path.join(user_settings.archdaily_projects_dir, project_id, 'content.json')
-            if os.path.exists(json_file_path):
-                continue
+    controller = get_controller(user_settings.archdaily_base_url, user_settings.archdaily_max_concurrency)
+    probe_results: dict[str, Optional[bool]] = {}
+
+    async def _probe(session, project_id: str, i: int):
         ctx.report_project_start(project_id)
-        html_file_path = os.path.join(user_settings.archdaily_projects_dir, project_id, 'content.html')
+        return await probe_project_url_archdaily_async(session, project_id, i, _total, invalid_project_ids,
+                                                       controller=controller)
 
-        if os.path.exists(html_file_path):
-            g.project_id_queue.append(project_id)
+    def _on_result(project_id: str, i: int, result):
+        probe_results[project_id] = result
+        if result is True:
+            ctx.report_project_success(project_id)
+        elif result is False:
+            ctx.report_project_failed(project_id)
         else:
-            num_projects_with_no_content_html += 1
-        ctx.report_project_success(project_id)
-    ctx.custom_data['num_projects_with_no_content_html'] = num_projects_with_no_content_html
-    ctx.custom_data['final_msg'] = f"共计{len(_all_projects)}个项目，其中{len(g.project_id_queue)}个项目已添加到队列"
+            ctx.report_project_complete(project_id)
+        ctx.update(1)
+        if i % saving_gap == 0:
+            invalid_project_ids.flush()
+
+    run_async_crawl(g.project_id_queue, _probe,
+                    max_concurrency=user_settings.archdaily_max_concurrency,
+                    should_stop=lambda: ctx.should_stop,
+                    on_result=_on_result)
+    invalid_project_ids.flush()
+
+    # 未探测的项目（中途停止）保持在队列中
+    num_valid = sum(1 for result in probe_results.values() if result is True)
+    num_uncertain = sum(1 for result in probe_results.values() if result is False)
+    g.project_id_queue = [project_id for project_id in g.project_id_queue
+                          if probe_results.get(project_id, False) is not None]
+    ctx.custom_data['final_msg'] = f"共探测{len(probe_results)}个项目，其中{num_valid}个有效，" \
+                                   f"{num_uncertain}个无法确定，队列中剩余{len(g.project_id_queue)}个项目"
+
+
+def archdaily__discover_new_projects(ctx: WorkingContext, max_pages: int = 500, *args):
+    """
+    增量发现新项目：从最新的一页开始并发翻阅搜索API，遇到第一页完全已知的项目时停止
+    新项目的搜索结果保存为projects/<id>/<id>.json（与step2相同），并将新项目id加入队列
+    """
+    _ = args
+    import asyncio
+    from utils.crawl_utils import run_windowed_pager
+    from utils.manifest_utils import get_project_manifest
+
+    api_url = user_settings.archdaily_search_api_url
+    known_project_ids = set(os.listdir(user_settings.archdaily_projects_dir))
+    new_project_ids: list[str] = []
+    manifest = get_project_manifest()
+    ctx.set_total(max_pages)
+
+    async def _fetch_page(session, page: int):
+        ctx.report_project_start(page)
+        for attempt in range(user_settings.http_max_retries + 1):
+            try:
+                async with session.get(api_url, params={'page': page}) as response:
+                    if response.status == 200:
+                        data = await response.json(content_type=None)
+                        return data.get('results', []), None
+                    logging.warning(f"搜索页{page}请求失败，状态码: {response.status}")
+            except Exception as e:
+                logging.warning(f"搜索页{page}请求失败, error: {str(e)}")
+            await asyncio.sleep(0.5 * 2 ** attempt)
+        ctx.report_project_failed(page)
+        raise Exception(f"搜索页{page}请求失败")
+
+    def _on_page(page: int, results: list) -> bool:
+        num_new = 0
+        for result in results:
+            project_id = str(result.get('document_id', ''))
+            if not project_id or project_id in known_project_ids:
+                continue
+            known_project_ids.add(project_id)
+            project_dir = os.path.join(user_settings.archdaily_projects_dir, project_id)
+            os.makedirs(project_dir, exist_ok=True)
+            dump_json(result, os.path.join(project_dir, f'{project_id}.json'))
+            manifest.update('archdaily', project_id, has_html=False)  # 下载失败时仍能被扫描到
+            new_project_ids.append(project_id)
+            num_new += 1
+        ctx.report_project_success(page)
+        ctx.update(1)
+        if num_new == 0:
+            logging.info(f"搜索页{page}中的项目均已存在，停止翻页")
+            return True
+        return False
+
+    try:
+        num_pages = run_windowed_pager(_fetch_page, _on_page,
+                                       window=user_settings.archdaily_discover_window,
+                                       max_page=max_pages,
+                                       should_stop=lambda: ctx.should_stop)
+    except Exception as e:
+        # 已保存的新项目仍然加入队列，避免下次发现时因项目文件夹已存在而被跳过
+        logging.error(f"翻页中断, error: {str(e)}")
+        g.project_id_queue = new_project_ids
+        ctx.custom_data['final_msg'] = f"翻页中断（{str(e)}），已发现的{len(new_project_ids)}个新项目已添加到队列"
+        return
+    finally:
+        manifest.flush()
+    g.project_id_queue = new_project_ids
+    ctx.custom_data['final_msg'] = f"共翻阅{num_pages}页，发现{len(new_project_ids)}个新项目，已添加到队列"
+
+
+def archdaily__scan_projects_folder_for_parsing_content(ctx: WorkingContext, skip_exist=False, *args):
+    _ = args
+    manifest = _get_built_project_manifest(ctx, user_settings.archdaily_projects_dir)
+    if manifest is None:
+        return
+    num_projects = manifest.count('archdaily')
+    if num_projects == 0:
+        raise Exception("没有找到任何项目")
+
+    g.project_id_queue = manifest.query('archdaily', 'has_html = 1 AND has_json = 0' if skip_exist else 'has_html = 1')
+    ctx.custom_data['num_projects_with_no_content_html'] = manifest.count('archdaily', 'has_html = 0')
+    ctx.custom_data['final_msg'] = f"共计{num_projects}个项目，其中{len(g.project_id_queue)}个项目已添加到队列"
 
 
 def archdaily__scan_projects_folder_for_downloading_images(ctx: WorkingContext, *args):
     return common__scan_projects_folder_for_downloading_images(ctx, user_settings.archdaily_projects_dir, *args)
 
 
-def archdaily__download_projects_html_to_local(ctx: WorkingContext, *args):
-    from utils.html_utils import request_project_html_archdaily, flush_success_queue
-    from concurrent.futures import ThreadPoolExecutor, as_completed
+def archdaily__scan_projects_folder_for_repairing_images(ctx: WorkingContext, *args):
+    return common__scan_projects_folder_for_repairing_images(ctx, user_settings.archdaily_projects_dir, *args)
 
-    # 从本地文件加载invalid_project_ids
-    if os.path.exists(user_settings.archdaily_invalid_projects_ids_path):
-        with open(user_settings.archdaily_invalid_projects_ids_path, 'r', encoding='utf-8') as f:
-            invalid_project_ids = set(json.load(f))
-    else:
-        invalid_project_ids = set()
+
+def archdaily__rebuild_project_manifest(ctx: WorkingContext, *args):
+    return common__rebuild_project_manifest(ctx, user_settings.archdaily_projects_dir, *args)
+
+
+def archdaily__download_projects_html_to_local(ctx: WorkingContext, refresh: bool = False, *args):
+    """
+    :param refresh: 刷新模式，对已有的content.html发送条件请求，未修改(304或内容哈希相同)的项目不会重写文件
+    """
+    from utils.html_utils import request_project_html_archdaily_async, flush_success_queue, pop_project_error
+    from utils.crawl_utils import run_async_crawl
+    from utils.journal_utils import get_crawl_journal
+    from utils.manifest_utils import get_project_manifest
+    from utils.rate_utils import get_controller
+
+    invalid_project_ids = get_invalid_project_id_store()
     _total = len(g.project_id_queue)
     assert _total > 0, "没有项目需要下载"
     ctx.set_total(_total)
-    saving_gap = max(_total // 20, 100)  # 总数平均分20份，但是最小每100轮保存一次
+    saving_gap = 100  # 新增的无效id只追加写入日志，代价很小，可以频繁保存
+    journal = get_crawl_journal()
+    journal_stage = 'archdaily_html'
+    journal.enqueue(journal_stage, g.project_id_queue)
 
-    def save_invalid_project_ids():
-        with open(user_settings.archdaily_invalid_projects_ids_path, 'w', encoding='utf-8') as f:
-            logging.info("保存invalid_project_ids")
-            json.dump(list(invalid_project_ids), f, ensure_ascii=False, indent=4)
+    # 启用自适应并发时，由AIMD控制器在max_concurrency以内决定实际在途请求数
+    controller = get_controller(user_settings.archdaily_base_url, user_settings.archdaily_max_concurrency)
 
-    def _get_html_content(project_id: str, i: int):
-        if ctx.should_stop:
-            return
+    changed_project_ids = []
+
+    async def _get_html_content(session, project_id: str, i: int):
         ctx.report_project_start(project_id)
-        success = request_project_html_archdaily(project_id, i, _total, invalid_project_ids,
-                                                 force_update=False)
+        journal.mark_in_flight(journal_stage, project_id)
+        return await request_project_html_archdaily_async(session, project_id, i, _total, invalid_project_ids,
+                                                          force_update=False, controller=controller,
+                                                          refresh=refresh)
+
+    def _on_result(project_id: str, i: int, success):
         if success is True:
+            changed_project_ids.append(project_id)
             ctx.report_project_success(project_id)
         elif success is False:
             ctx.report_project_failed(project_id)
         else:
             ctx.report_project_complete(project_id)
+        if success is False:
+            journal.mark_failed(journal_stage, project_id, pop_project_error(project_id))
+        else:
+            journal.mark_done(journal_stage, project_id)
         ctx.update(1)
         if i % saving_gap == 0:
-            save_invalid_project_ids()
+            invalid_project_ids.flush()
 
-    with ThreadPoolExecutor(max_workers=32) as executor:
-        futures = (executor.submit(_get_html_content, project_id, i) for i, project_id in
-                   enumerate(g.project_id_queue))
-        for future in as_completed(futures):
-            future.result()
+    # 单线程事件循环维持大量在途请求，代替原先32线程的ThreadPoolExecutor
+    run_async_crawl(g.project_id_queue, _get_html_content,
+                    max_concurrency=user_settings.archdaily_max_concurrency,
+                    should_stop=lambda: ctx.should_stop,
+                    on_result=_on_result)
 
     flush_success_queue('content_html')
-    save_invalid_project_ids()
+    invalid_project_ids.flush()
+    journal.flush()
+    get_project_manifest().flush()  # 保存html时已更新has_html，提交后其他页面才能立即查询到
+    if refresh:
+        ctx.custom_data['final_msg'] = f"共刷新{_total}个项目，其中{len(changed_project_ids)}个项目的html有更新"
+
+
+def archdaily__download_and_parse_htmls(ctx: WorkingContext, *args):
+    """
+    下载html后直接将内存中的html交给解析线程池生成content.json，content.html仍然保存
+    一次完成下载和解析，不需要再扫描项目文件夹及重新读取content.html
+    """
+    _ = args
+    from utils.html_utils import request_project_html_archdaily_async, parse_project_content_archdaily, \
+        flush_success_queue, pop_project_error, ArchdailyFlags
+    from utils.crawl_utils import run_async_crawl
+    from utils.journal_utils import get_crawl_journal
+    from utils.manifest_utils import get_project_manifest
+    from utils.rate_utils import get_controller
+
+    invalid_project_ids = get_invalid_project_id_store()
+    _total = len(g.project_id_queue)
+    assert _total > 0, "没有项目需要下载"
+    ctx.set_total(_total)
+    journal = get_crawl_journal()
+    journal.enqueue('archdaily_html', g.project_id_queue)
+
+    # html刚刚下载，所有字段都需要重新提取
+    combined_flags = ArchdailyFlags.NONE
+    for flag in ArchdailyFlags:
+        combined_flags |= flag
+
+    controller = get_controller(user_settings.archdaily_base_url, user_settings.archdaily_max_concurrency)
+    num_parse_workers = min(8, os.cpu_count() or 1)
+    parse_slots = threading.BoundedSemaphore(num_parse_workers * 4)  # 解析跟不上时阻塞下载，限制内存中的html数量
+    parse_executor = ThreadPoolExecutor(max_workers=num_parse_workers)
+    project_index = {project_id: i for i, project_id in enumerate(g.project_id_queue)}
+    num_parsed, num_parse_failed = 0, 0
+    counter_lock = threading.Lock()
+
+    def _parse(project_id: str, html_content: str):
+        nonlocal num_parsed, num_parse_failed
+        try:
+            journal.mark_in_flight('archdaily_parse', project_id)
+            changed = parse_project_content_archdaily(project_id, project_index[project_id], _total,
+                                                      flags=combined_flags, html_content=html_content)
+            if changed is False:
+                journal.mark_failed('archdaily_parse', project_id, pop_project_error(project_id))
+                ctx.report_project_failed(project_id)
+            else:
+                journal.mark_done('archdaily_parse', project_id)
+                ctx.report_project_success(project_id)
+            with counter_lock:
+                if changed is False:
+                    num_parse_failed += 1
+                else:
+                    num_parsed += 1
+        finally:
+            parse_slots.release()
+            ctx.update(1)
+
+    def _on_parse_done(project_id: str, future):
+        """解析线程中出现未捕获的异常时立即记录，不等到下载全部结束"""
+        nonlocal num_parse_failed
+        error = future.exception()
+        if error is None:
+            return
+        logging.error(f"project: {project_id} 解析出现意外情况, error: {str(error)}")
+        journal.mark_failed('archdaily_parse', project_id, str(error))
+        ctx.report_project_failed(project_id)
+        with counter_lock:
+            num_parse_failed += 1
+
+    def _on_html(project_id: str, html_content: str):
+        parse_slots.acquire()
+        journal.enqueue('archdaily_parse', [project_id])
+        future = parse_executor.submit(_parse, project_id, html_content)
+        future.add_done_callback(lambda f: _on_parse_done(project_id, f))
+
+    async def _get_html_content(session, project_id: str, i: int):
+        ctx.report_project_start(project_id)
+        journal.mark_in_flight('archdaily_html', project_id)
+        return await request_project_html_archdaily_async(session, project_id, i, _total, invalid_project_ids,
+                                                          force_update=False, controller=controller,
+                                                          on_html=_on_html)
+
+    def _on_result(project_id: str, i: int, success):
+        if success is False:
+            journal.mark_failed('archdaily_html', project_id, pop_project_error(project_id))
+            ctx.report_project_failed(project_id)
+        else:
+            journal.mark_done('archdaily_html', project_id)
+        if success is not True:  # 下载成功的项目在解析完成后更新进度
+            if success is None:
+                ctx.report_project_complete(project_id)
+            ctx.update(1)
+        if i % 100 == 0:
+            invalid_project_ids.flush()
+
+    try:
+        run_async_crawl(g.project_id_queue, _get_html_content,
+                        max_concurrency=user_settings.archdaily_max_concurrency,
+                        should_stop=lambda: ctx.should_stop,
+                        on_result=_on_result)
+    finally:
+        parse_executor.shutdown(wait=True)
+        flush_success_queue('content_html')
+        flush_success_queue('content_json')
+        invalid_project_ids.flush()
+        journal.flush()
+        get_project_manifest().flush()
+    ctx.custom_data['final_msg'] = f"共{_total}个项目，下载并解析{num_parsed}个，解析失败{num_parse_failed}个"
+
+
+def archdaily__download_missing_gallery_json(ctx: WorkingContext, *args):
+    """为已有content.html但缺少gallery.json的项目补充下载gallery（旧版本下载的项目）"""
+    _ = args
+    import asyncio
+    from utils.html_utils import fetch_gallery_archdaily_async
+    from utils.crawl_utils import run_async_crawl
+    from utils.io_utils import read_html
+    from utils.rate_utils import get_controller
+
+    ctx.report_msg("正在扫描本地文件...")
+    project_ids = []
+    for project_id in os.listdir(user_settings.archdaily_projects_dir):
+        project_dir = os.path.join(user_settings.archdaily_projects_dir, project_id)
+        if html_exists(project_dir) and not os.path.isfile(os.path.join(project_dir, 'gallery.json')):
+            project_ids.append(project_id)
+    _total = len(project_ids)
+    assert _total > 0, "所有项目的gallery.json均已存在"
+    ctx.set_total(_total)
+
+    controller = get_controller(user_settings.archdaily_base_url, user_settings.archdaily_max_concurrency)
+
+    async def _fetch_gallery(session, project_id: str, i: int):
+        ctx.report_project_start(project_id)
+        html_content = await asyncio.to_thread(read_html,
+                                               os.path.join(user_settings.archdaily_projects_dir, project_id))
+        if html_content is None:
+            return False
+        return await fetch_gallery_archdaily_async(session, project_id, html_content, controller)
+
+    num_success = 0
+
+    def _on_result(project_id: str, i: int, success):
+        nonlocal num_success
+        if success:
+            num_success += 1
+            ctx.report_project_success(project_id)
+        else:
+            ctx.report_project_failed(project_id)
+        ctx.update(1)
+
+    run_async_crawl(project_ids, _fetch_gallery,
+                    max_concurrency=user_settings.archdaily_max_concurrency,
+                    should_stop=lambda: ctx.should_stop,
+                    on_result=_on_result)
+    ctx.custom_data['final_msg'] = f"共{_total}个项目缺少gallery.json，其中{num_success}个已补充"
 
 
 def archdaily__parse_htmls(ctx: WorkingContext, flags_state, *args):
-    from utils.html_utils import parse_project_content_archdaily, flush_success_queue, ArchdailyFlags
+    from utils.html_utils import parse_project_content_archdaily, flush_success_queue, pop_project_error, \
+        ArchdailyFlags
+    from utils.journal_utils import get_crawl_journal
     from concurrent.futures import ThreadPoolExecutor, as_completed
 
     _total = len(g.project_id_queue)
     assert _total > 0, "没有项目需要解析"
 
     ctx.set_total(_total)
+    journal = get_crawl_journal()
+    journal_stage = 'archdaily_parse'
+    journal.enqueue(journal_stage, g.project_id_queue)
 
     # get flags
     combined_flags = ArchdailyFlags.NONE
@@ -602,35 +897,111 @@ def archdaily__parse_htmls(ctx: WorkingContext, flags_state, *args):
             flag = g.flag_name_to_flag['archdaily'][flag_name]
             combined_flags |= flag
 
+    def _report_result(project_id: str, changed: Optional[bool]):
+        if changed is True:
+            ctx.report_project_success(project_id)
+        elif changed is False:
+            ctx.report_project_failed(project_id)
+        else:
+            ctx.report_project_complete(project_id)
+        if changed is False:
+            journal.mark_failed(journal_stage, project_id, pop_project_error(project_id))
+        else:
+            journal.mark_done(journal_stage, project_id)
+        ctx.update(1)
+
     def _parse_project_content(project_id: str, i: int):
         if ctx.should_stop:
             return
         time.sleep(0.02)
 
         ctx.report_project_start(project_id)
+        journal.mark_in_flight(journal_stage, project_id)
 
         changed = parse_project_content_archdaily(project_id, i, _total, flags=combined_flags)
-        if changed is True:
+        _report_result(project_id, changed)
+
+    # gallery已在下载阶段缓存为gallery.json，解析过程不再访问网络
+    logging.info("开始解析页面内容...")
+    if user_settings.parse_executor == 'process':
+        _run_parse_pool('archdaily', g.project_id_queue, combined_flags, ctx, journal, journal_stage,
+                        _report_result)
+    else:
+        with ThreadPoolExecutor(max_workers=64) as executor:
+            futures = (executor.submit(_parse_project_content, project_id, i) for i, project_id in
+                       enumerate(g.project_id_queue))
+            for future in tqdm(as_completed(futures), total=len(g.project_id_queue)):
+                future.result()
+
+    flush_success_queue('content_json')
+    journal.flush()
+
+
+def _run_parse_pool(site: str, project_ids: list[str], flags, ctx: WorkingContext, journal, journal_stage: Optional[str],
+                    report_result: Callable[[str, Optional[bool]], None], skip_exist: bool = False):
+    """
+    使用多进程解析，worker只返回每个项目的结果，进度、抓取日志及成功日志都在主进程中按批次汇总
+    """
+    from utils.parse_pool_utils import run_parse_pool
+
+    def _on_chunk_start(chunk: list[str]):
+        for project_id in chunk:
+            ctx.report_project_start(project_id)
+            if journal_stage is not None:
+                journal.mark_in_flight(journal_stage, project_id)
+
+    def _on_chunk_result(results: list[tuple[str, Optional[bool]]]):
+        for project_id, changed in results:
+            report_result(project_id, changed)
+        changed_project_ids = [project_id for project_id, changed in results if changed is True]
+        if changed_project_ids:
+            logging.info(f"project: {','.join(changed_project_ids)} success")
+
+    run_parse_pool(site, project_ids, flags,
+                   num_workers=user_settings.parse_num_processes,
+                   chunk_size=user_settings.parse_chunk_size,
+                   skip_exist=skip_exist,
+                   should_stop=lambda: ctx.should_stop,
+                   on_chunk_start=_on_chunk_start,
+                   on_chunk_result=_on_chunk_result)
+
+
+def archdaily__download_gallery_images(ctx: WorkingContext, *args):
+    return common__download_gallery_images(ctx, user_settings.archdaily_projects_dir, *args)
+
+
+def archdaily__convert_html_storage(ctx: WorkingContext, compression: str, *args):
+    """将已有的content.html批量转换为指定的存储格式(none/gzip/zstd)"""
+    from utils.io_utils import convert_html_storage
+    _all_projects = os.listdir(user_settings.archdaily_projects_dir)
+    assert len(_all_projects) > 0, "没有找到任何项目"
+    ctx.set_total(len(_all_projects))
+
+    def _convert(project_id: str):
+        if ctx.should_stop:
+            return
+        ctx.report_project_start(project_id)
+        converted = convert_html_storage(os.path.join(user_settings.archdaily_projects_dir, project_id), compression)
+        if converted is True:
             ctx.report_project_success(project_id)
-        elif changed is False:
+        elif converted is False:
             ctx.report_project_failed(project_id)
         else:
             ctx.report_project_complete(project_id)
-
         ctx.update(1)
 
-    with ThreadPoolExecutor(max_workers=64) as executor:
-        futures = (executor.submit(_parse_project_content, project_id, i) for i, project_id in
-                   enumerate(g.project_id_queue))
-        logging.info("开始解析页面内容... 如果遇到image_gallery为空的情况，可能需要等待返回image_gallery结果")
-        for future in tqdm(as_completed(futures), total=len(g.project_id_queue)):
+    # gzip/zstd压缩时会释放GIL，线程池即可利用多核
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 8) as executor:
+        futures = (executor.submit(_convert, project_id) for project_id in _all_projects)
+        for future in as_completed(futures):
             future.result()
-
-    flush_success_queue('content_json')
+    user_settings.archdaily_html_compression = compression
+    config.save_user_settings(user_settings)
+    ctx.custom_data['final_msg'] = f"共{len(_all_projects)}个项目，{len(ctx.success_projects)}个项目已转换为{compression}格式"
 
 
-def archdaily__download_gallery_images(ctx: WorkingContext, *args):
-    return common__download_gallery_images(ctx, user_settings.archdaily_projects_dir, *args)
+def archdaily__convert_gallery_images_to_shards(ctx: WorkingContext, remove_source: bool = False, *args):
+    return common__convert_gallery_images_to_shards(ctx, user_settings.archdaily_projects_dir, remove_source, *args)
 
 
 def archdaily__upload_content(ctx: WorkingContext, skip_exist: bool = True, *args):
@@ -643,6 +1014,15 @@ def archdaily__upload_content(ctx: WorkingContext, skip_exist: bool = True, *arg
 
 # region gooood
 def gooood__scrap_pages(ctx: WorkingContext, scrap_all=False, start_page=1, end_page=1, skip_exist=False, *args):
+    """
+    窗口式并发爬取gooood的页面，同时保持gooood_page_window个页面在途
+    根据空页或X-WP-TotalPages响应头判断数据结束，并取消超出末尾的请求
+    注意：修改gooood_per_page后页码含义会改变，已有的page文件与新页码不再对应
+    """
+    import asyncio
+    import re
+    from utils.crawl_utils import run_windowed_pager
+    from utils.rate_utils import acquire_async, get_controller
     if start_page > end_page:
         start_page, end_page = end_page, start_page
     if scrap_all:
@@ -651,52 +1031,75 @@ def gooood__scrap_pages(ctx: WorkingContext, scrap_all=False, start_page=1, end_
         ctx.set_total(end_page - start_page + 1)
     else:
         ctx.set_total(1)
-    page = start_page - 1
-    page_count = 0
     pages_folder = os.path.join(user_settings.gooood_results_dir, "pages")
     os.makedirs(pages_folder, exist_ok=True)
-    while True:
-        page += 1
+    base_url = re.sub(r'per_page=\d+', f'per_page={user_settings.gooood_per_page}', user_settings.gooood_base_url)
+    window = user_settings.gooood_page_window
+    controller = get_controller(base_url, window)
+    failed = object()  # 请求失败的页面，不终止翻页
 
-        if ctx.should_stop:
-            break
-        if not scrap_all and page > end_page:
-            ctx.report_msg("已到达指定页数")
-            logging.info(f"已到达指定页数")
-            break
-        page_count += 1
-        ctx.update(1)
-        if scrap_all:
-            ctx.set_total(page_count + 1)
+    async def _fetch_page(session, page: int):
         json_path = os.path.join(pages_folder, f"page_{str(page).zfill(5)}.json")
         if skip_exist and os.path.exists(json_path):
-            continue
-
+            return load_json(json_path), None
         ctx.report_project_start(page)
+        url = base_url.replace("<page>", str(page))
+        await acquire_async(controller)
+        start_time = time.time()
+        status_code, retry_after, cancelled = None, None, False
         try:
-            # Send a GET request to the website
-            url = user_settings.gooood_base_url.replace("<page>", str(page))
-            response = requests.get(url, headers=user_settings.headers)
-            if response.status_code != 200:
-                ctx.report_project_failed(page)
-                continue
-            data = json.loads(response.text)
-            if len(data) == 0:
-                logging.info(f"已到达最后一页")
-                ctx.report_project_complete(page)
-                break
-            with open(json_path, "w", encoding="utf-8") as f:
-                f.write(json.dumps(data, ensure_ascii=False, indent=4))
-            ctx.report_project_success(page)
-        except requests.exceptions.RequestException as e:
-            print(f"Error accessing the website: {e}")
-            ctx.report_project_failed(page)
+            async with session.get(url) as response:
+                status_code, retry_after = response.status, response.headers.get('Retry-After')
+                total_pages = response.headers.get('X-WP-TotalPages')
+                total_pages = int(total_pages) if total_pages and total_pages.isdigit() else None
+                if response.status == 400 and page > 1:
+                    # WordPress接口在页码超出范围时返回400
+                    return [], total_pages
+                if response.status != 200:
+                    logging.error(f"page {page} 请求失败，状态码: {response.status}")
+                    return failed, total_pages
+                data = loads(await response.read())
+        except asyncio.CancelledError:
+            cancelled = True  # 超出数据末尾被取消的请求，不应视为错误
+            raise
         except Exception as e:
-            print(f"An error occurred: {e}")
+            logging.error(f"page {page} 请求失败, error: {str(e)}")
+            return failed, None
+        finally:
+            if controller is not None:
+                if cancelled:
+                    controller.cancel()
+                else:
+                    controller.release(status_code, time.time() - start_time, retry_after)
+        if len(data) > 0:
+            dump_json(data, json_path)
+        return data, total_pages
+
+    page_count = 0
+
+    def _on_page(page: int, data) -> bool:
+        nonlocal page_count
+        page_count += 1
+        ctx.update(1)
+        if scrap_all:
+            ctx.set_total(page_count + 1)
+        if data is failed:
             ctx.report_project_failed(page)
+        else:
+            ctx.report_project_success(page)
+        return False
+
+    num_pages = run_windowed_pager(_fetch_page, _on_page,
+                                   start_page=start_page,
+                                   window=window,
+                                   max_page=None if scrap_all else end_page,
+                                   should_stop=lambda: ctx.should_stop)
+    ctx.report_msg("已到达最后一页" if scrap_all else "已到达指定页数")
+    logging.info(f"共爬取{num_pages}页")
 
 
 def gooood__init_projects(ctx: WorkingContext, skip_exist=True, *args):
+    from utils.manifest_utils import get_project_manifest
     pages_folder = os.path.join(user_settings.gooood_results_dir, "pages")
     if not os.path.exists(pages_folder):
         raise Exception("pages文件夹不存在")
@@ -704,11 +1107,11 @@ def gooood__init_projects(ctx: WorkingContext, skip_exist=True, *args):
     if not all_pages:
         raise Exception("pages文件夹为空")
     ctx.set_total(len(all_pages))
+    manifest = get_project_manifest()
     for page in tqdm(all_pages):
         ctx.update(1)
         page_path = os.path.join(pages_folder, page)
-        with open(page_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        data = load_json(page_path)
         for project_data in data:
             project_id = str(project_data['id'])
             project_folder = os.path.join(user_settings.gooood_projects_dir, project_id)
@@ -716,8 +1119,9 @@ def gooood__init_projects(ctx: WorkingContext, skip_exist=True, *args):
             if skip_exist and os.path.exists(project_data_path):
                 continue
             os.makedirs(project_folder, exist_ok=True)
-            with open(project_data_path, "w", encoding="utf-8") as f:
-                f.write(json.dumps(project_data, ensure_ascii=False, indent=4))
+            dump_json(project_data, project_data_path)
+            manifest.update('gooood', project_id, has_data=True)
+    manifest.flush()
 
 
 def gooood__parse_projects(ctx: WorkingContext, flags_state, skip_exist=False, *args):
@@ -734,11 +1138,16 @@ def gooood__parse_projects(ctx: WorkingContext, flags_state, skip_exist=False, *
     if not os.path.exists(user_settings.gooood_projects_dir):
         raise Exception("projects文件夹不存在")
 
-    all_projects = os.listdir(user_settings.gooood_projects_dir)
-    if not all_projects:
+    manifest = _get_built_project_manifest(ctx, user_settings.gooood_projects_dir)
+    if manifest is None:
+        return
+    if manifest.count('gooood') == 0:
         raise Exception("projects文件夹为空")
+    # 只需解析有<project_id>.json的项目
+    all_projects = manifest.query('gooood', 'has_data = 1 AND has_json = 0' if skip_exist else 'has_data = 1')
     _total = len(all_projects)
     ctx.set_total(_total)
+    ctx.set_curr(0)
 
     def _parse_project_content(project_id: str, i: int):
         if ctx.should_stop:
@@ -751,6 +1160,9 @@ def gooood__parse_projects(ctx: WorkingContext, flags_state, skip_exist=False, *
             return
         ctx.report_project_start(project_id)
         changed = parse_project_content_gooood(project_id, i, _total, flags=combined_flags)
+        _report_result(project_id, changed)
+
+    def _report_result(project_id: str, changed: Optional[bool]):
         if changed is True:
             ctx.report_project_success(project_id)
         elif changed is False:
@@ -758,23 +1170,107 @@ def gooood__parse_projects(ctx: WorkingContext, flags_state, skip_exist=False, *
         else:
             ctx.report_project_complete(project_id)
 
-    with ThreadPoolExecutor(max_workers=64) as executor:
-        futures = (executor.submit(_parse_project_content, project_id, i) for i, project_id in
-                   enumerate(all_projects))
-        for future in tqdm(as_completed(futures), total=len(all_projects)):
-            future.result()
+    def _report_result_with_progress(project_id: str, changed: Optional[bool]):
+        _report_result(project_id, changed)
+        ctx.update(1)
+
+    if user_settings.parse_executor == 'process':
+        _run_parse_pool('gooood', all_projects, combined_flags, ctx, None, None, _report_result_with_progress,
+                        skip_exist=skip_exist)
+    else:
+        with ThreadPoolExecutor(max_workers=64) as executor:
+            futures = (executor.submit(_parse_project_content, project_id, i) for i, project_id in
+                       enumerate(all_projects))
+            for future in tqdm(as_completed(futures), total=len(all_projects)):
+                future.result()
 
     flush_success_queue('content_json')
 
 
+def gooood__parse_projects_from_pages(ctx: WorkingContext, flags_state, skip_exist=False, *args):
+    """
+    直接从pages/page_XXXXX.json中逐个取出项目解析，只写入content.json，跳过初始化<project_id>.json的步骤
+    每个page文件作为一个任务交给worker，worker内以内存映射方式读取page
+    """
+    _ = args
+    from utils.html_utils import parse_gooood_page_file, flush_success_queue, GoooodFlags
+
+    combined_flags = GoooodFlags.NONE
+    for flag_name, value in flags_state.items():
+        if value:
+            logging.info(f"{flag_name} is On")
+            combined_flags |= g.flag_name_to_flag['gooood'][flag_name]
+    pages_folder = os.path.join(user_settings.gooood_results_dir, "pages")
+    if not os.path.exists(pages_folder):
+        raise Exception("pages文件夹不存在")
+    all_pages = sorted(page for page in os.listdir(pages_folder) if page.endswith('.json'))
+    if not all_pages:
+        raise Exception("pages文件夹为空")
+    ctx.set_total(len(all_pages))
+    num_projects, num_changed, num_failed = 0, 0, 0
+
+    def _on_page_result(results: list[tuple[str, Optional[bool]]]):
+        nonlocal num_projects, num_changed, num_failed
+        for project_id, changed in results:
+            num_projects += 1
+            if changed is True:
+                num_changed += 1
+                ctx.report_project_success(project_id)
+            elif changed is False:
+                num_failed += 1
+                ctx.report_project_failed(project_id)
+            else:
+                ctx.report_project_complete(project_id)
+        changed_project_ids = [project_id for project_id, changed in results if changed is True]
+        if changed_project_ids:
+            logging.info(f"project: {','.join(changed_project_ids)} success")
+        ctx.update(1)
+
+    if user_settings.parse_executor == 'process':
+        from utils.parse_pool_utils import run_parse_pool
+        run_parse_pool('gooood_pages', all_pages, combined_flags,
+                       num_workers=user_settings.parse_num_processes,
+                       chunk_size=1,
+                       skip_exist=skip_exist,
+                       should_stop=lambda: ctx.should_stop,
+                       on_chunk_result=_on_page_result)
+    else:
+        lock = threading.Lock()
+
+        def _parse_page(page: str):
+            if ctx.should_stop:
+                return
+            results = parse_gooood_page_file(os.path.join(pages_folder, page), combined_flags, skip_exist)
+            with lock:
+                _on_page_result(results)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(_parse_page, all_pages))
+
+    flush_success_queue('content_json')
+    ctx.custom_data['final_msg'] = f"共{len(all_pages)}页，{num_projects}个项目，更新{num_changed}个，失败{num_failed}个"
+
+
 def gooood__scan_projects_folder_for_downloading_images(ctx: WorkingContext, *args):
     return common__scan_projects_folder_for_downloading_images(ctx, user_settings.gooood_projects_dir, *args)
 
 
+def gooood__scan_projects_folder_for_repairing_images(ctx: WorkingContext, *args):
+    return common__scan_projects_folder_for_repairing_images(ctx, user_settings.gooood_projects_dir, *args)
+
+
+def gooood__rebuild_project_manifest(ctx: WorkingContext, *args):
+    return common__rebuild_project_manifest(ctx, user_settings.gooood_projects_dir, *args)
+
+
 def gooood__download_gallery_images(ctx: WorkingContext, *args):
     return common__download_gallery_images(ctx, user_settings.gooood_projects_dir, *args)
 
 
+def gooood__convert_gallery_images_to_shards(ctx: WorkingContext, remove_source: bool = False, *args):
+    return common__convert_gallery_images_to_shards(ctx, user_settings.gooood_projects_dir, remove_source, *args)
+
+
 def gooood__upload_content(ctx: WorkingContext, skip_exist: bool = True, *args):
     return common__upload_content(ctx, user_settings.mongodb_gooood_db_name, user_settings.gooood_projects_dir,
                                   skip_exist, *args)
@@ -784,79 +1280,304 @@ def gooood__upload_content(ctx: WorkingContext, skip_exist: bool = True, *args):
 
 
 # region common
-def common__scan_projects_folder_for_downloading_images(ctx: WorkingContext, projects_dir, *args):
-    _all_projects = os.listdir(projects_dir)
-    if _all_projects == 0:
+def _get_site_name(projects_dir: str) -> str:
+    """根据projects_dir判断所属网站，用作抓取日志的stage前缀"""
+    if os.path.normpath(projects_dir) == os.path.normpath(user_settings.gooood_projects_dir):
+        return 'gooood'
+    return 'archdaily'
+
+
+def _get_built_project_manifest(ctx: WorkingContext, projects_dir: str):
+    """
+    返回项目状态索引，该网站的索引尚未建立时先遍历一次projects_dir建立索引，之后的扫描只需查询索引
+    建立索引时被停止返回None
+    """
+    from utils.manifest_utils import get_project_manifest
+    site = _get_site_name(projects_dir)
+    manifest = get_project_manifest()
+    if manifest.is_built(site):
+        return manifest
+    ctx.report_msg(f"{site}项目状态索引尚未建立，正在遍历项目文件夹...")
+    ctx.set_total(len(os.listdir(projects_dir)))
+    ctx.set_curr(0)
+    if not manifest.rebuild(site, projects_dir, should_stop=lambda: ctx.should_stop, on_progress=ctx.update):
+        return None
+    return manifest
+
+
+def common__rebuild_project_manifest(ctx: WorkingContext, projects_dir, *args):
+    """重新遍历项目文件夹建立项目状态索引，在流水线之外增删或修改了项目文件后使用"""
+    _ = args
+    from utils.manifest_utils import get_project_manifest
+    site = _get_site_name(projects_dir)
+    manifest = get_project_manifest()
+    ctx.set_total(len(os.listdir(projects_dir)))
+    if not manifest.rebuild(site, projects_dir, should_stop=lambda: ctx.should_stop, on_progress=ctx.update):
+        ctx.custom_data['final_msg'] = f"{site}项目状态索引重建被停止，扫描时将重新建立"
+        return
+    summary = manifest.get_summary(site)
+    ctx.custom_data['final_msg'] = f"{site}项目状态索引已重建: " + "，".join(f"{k}: {v}" for k, v in summary.items())
+
+
+def common__resume_from_journal(ctx: WorkingContext, journal_stage: str, *args):
+    """从抓取日志恢复上次未完成（排队中、执行中断或失败）的项目到队列，不扫描项目文件夹"""
+    _ = args
+    from utils.journal_utils import get_crawl_journal
+    ctx.set_total(1)
+    journal = get_crawl_journal()
+    g.project_id_queue = journal.get_pending(journal_stage)
+    counts = journal.get_counts(journal_stage)
+    ctx.update(1)
+    counts_str = "，".join(f"{state}: {count}" for state, count in counts.items()) or "无记录"
+    ctx.custom_data['final_msg'] = f"{journal_stage} ({counts_str})，{len(g.project_id_queue)}个未完成的项目已添加到队列"
+
+
+def common__scan_projects_folder_for_downloading_images(ctx: WorkingContext, projects_dir, target_resolution=0, *args):
+    """:param target_resolution: 目标分辨率，已有满足该分辨率的图片（任意尺寸文件夹中）视为已下载，0表示只检查large"""
+    from utils.io_utils import get_min_variant, list_gallery_image_paths
+    manifest = _get_built_project_manifest(ctx, projects_dir)
+    if manifest is None:
+        return
+    site = _get_site_name(projects_dir)
+    num_projects = manifest.count(site)
+    if num_projects == 0:
         raise Exception("没有找到任何项目")
 
-    ctx.set_total(len(_all_projects))
+    content_not_exist_count = manifest.count(site, 'has_json = 0')
+    # 索引中的downloaded_count只统计large及更大尺寸，已满足large的项目一定满足更低的目标分辨率
+    candidates = manifest.query_states(site, 'has_json = 1 AND gallery_size > 0 AND downloaded_count < gallery_size')
+    min_variant = get_min_variant(target_resolution)
+    if min_variant == 'large':
+        g.project_id_queue = list(candidates)
+    else:
+        # 候选项目的图片可能保存在较小的尺寸中，只检查这些项目的文件夹
+        ctx.set_total(len(candidates))
+        ctx.set_curr(0)
+        g.project_id_queue = []
+        for project_id, state in candidates.items():
+            if ctx.should_stop:
+                break
+            ctx.update(1)
+            image_gallery_names = list_gallery_image_paths(os.path.join(projects_dir, project_id),
+                                                           f'image_gallery/{min_variant}', allow_smaller=False)
+            if len(image_gallery_names) < state['gallery_size']:
+                g.project_id_queue.append(project_id)
+
+    ctx.custom_data[
+        'final_msg'] = f"已扫描{num_projects}个项目，其中{content_not_exist_count}个项目没有content.json文件，{len(g.project_id_queue)}个项目需要下载图像"
 
-    content_not_exist_count = 0
-    g.project_id_queue = []
 
-    # 遍历项目目录下的所有子文件夹
-    for folder_name in tqdm(_all_projects):
+def common__scan_projects_folder_for_repairing_images(ctx: WorkingContext, projects_dir, *args):
+    """检查已下载的图片是否完整，删除被截断的图片及残留的.part文件，并将这些项目加入队列重新下载"""
+    _ = args
+    from utils.io_utils import PART_SUFFIX, is_image_complete
+    from utils.manifest_utils import count_downloaded_images
+    manifest = _get_built_project_manifest(ctx, projects_dir)
+    if manifest is None:
+        return
+    site = _get_site_name(projects_dir)
+    _all_projects = manifest.query(site, 'downloaded_count > 0')  # 只检查已下载过图片的项目
+    ctx.set_total(len(_all_projects))
+    ctx.set_curr(0)
+    g.project_id_queue = []
+    num_broken_images = 0
+    for folder_name in _all_projects:
         if ctx.should_stop:
             break
         ctx.update(1)
-        folder_path = os.path.join(projects_dir, folder_name)
-        if not os.path.isdir(folder_path):
-            continue
-        json_file_path = os.path.join(folder_path, 'content.json')
-        if not os.path.exists(json_file_path):
-            content_not_exist_count += 1  # content.json does not exist, add to content_not_exist_count
-            continue
-        image_gallery_folder = os.path.join(folder_path, 'image_gallery', 'large')
-        with open(json_file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        image_gallery_images = data.get('image_gallery', [])
-        if not image_gallery_images:
-            continue
-        if not os.path.exists(image_gallery_folder):
-            g.project_id_queue.append(folder_name)
-            continue
-        image_gallery_names = os.listdir(image_gallery_folder)
-        if len(image_gallery_names) < len(image_gallery_images):
+        need_repair = False
+        # 按目标分辨率下载的图片保存在image_gallery/<variant>中，需要检查所有尺寸的文件夹
+        for variant in dict.fromkeys(['large', *user_settings.image_variant_sizes]):
+            image_gallery_folder = os.path.join(projects_dir, folder_name, 'image_gallery', variant)
+            if not os.path.isdir(image_gallery_folder):
+                continue
+            for name in os.listdir(image_gallery_folder):
+                img_path = os.path.join(image_gallery_folder, name)
+                if name.endswith(PART_SUFFIX) or (name.endswith('.jpg') and not is_image_complete(img_path)):
+                    logging.info(f"project {folder_name} 图片{variant}/{name}不完整，已删除")
+                    os.remove(img_path)
+                    num_broken_images += 1
+                    need_repair = True
+        if need_repair:
+            manifest.update(site, folder_name,
+                            downloaded_count=count_downloaded_images(os.path.join(projects_dir, folder_name)))
             g.project_id_queue.append(folder_name)
-
-    ctx.custom_data[
-        'final_msg'] = f"已扫描{len(_all_projects)}个项目，其中{content_not_exist_count}个项目没有content.json文件，{len(g.project_id_queue)}个项目需要下载图像"
+    ctx.custom_data['final_msg'] = f"已检查{len(_all_projects)}个项目，删除了{num_broken_images}个不完整的图片，" \
+                                   f"{len(g.project_id_queue)}个项目需要重新下载图像"
 
 
-def common__download_gallery_images(ctx: WorkingContext, projects_dir, *args):
-    from utils.html_utils import download_images_common
-    from concurrent.futures import ThreadPoolExecutor, as_completed
+def common__download_gallery_images(ctx: WorkingContext, projects_dir, target_resolution=0, *args):
+    """
+    图片级调度：将所有项目待下载的图片展开为一个(项目, 图片)任务队列，由worker共同消费
+    大型gallery的图片会分散到多个worker上，不会长时间占用单个worker；每个项目的进度单独汇总
+    :param target_resolution: 大于0时为每张图片选择满足该分辨率的最小尺寸，保存在image_gallery/<variant>中
+    """
+    from utils.blob_utils import save_blob_index
+    from utils.html_utils import list_pending_gallery_images, download_gallery_image
+    from utils.http_utils import set_pool_size
+    from utils.journal_utils import get_crawl_journal
+    from utils.manifest_utils import count_downloaded_images, get_project_manifest
+    from utils.shard_utils import get_shard_store
+    from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
     _total = len(g.project_id_queue)
     assert _total > 0, "没有需要下载图像的项目"
     ctx.set_total(_total)
-
-    def _on_img_index_change(project_id, img_index, img_total):
-        ctx.report_project_sub_curr(project_id, img_index)
-        ctx.report_project_sub_total(project_id, img_total)
-
-    def _download_images(project_id: str, i: int):
-        if ctx.should_stop:
-            return
-
-        ctx.report_project_start(project_id)
-        success = download_images_common(projects_dir, project_id, i, _total, 'large',
-                                         img_index_change_callback=_on_img_index_change)
-        if success is True:
-            ctx.report_project_success(project_id)
-        elif success is False:
+    journal = get_crawl_journal()
+    site = _get_site_name(projects_dir)
+    journal_stage = f'{site}_gallery'
+    journal.enqueue(journal_stage, g.project_id_queue)
+    manifest = get_project_manifest()
+    num_workers = 48
+    lock = threading.Lock()
+    project_states: dict[str, dict] = {}
+
+    def _iter_image_tasks():
+        # 按项目顺序展开，按需读取content.json，避免一次性加载所有项目
+        for i, project_id in enumerate(g.project_id_queue):
+            if ctx.should_stop:
+                return
+            pending_images = list_pending_gallery_images(projects_dir, project_id, i, _total, 'large',
+                                                         target_resolution=target_resolution)
+            if not pending_images:
+                if pending_images is None:
+                    ctx.report_project_failed(project_id)
+                    journal.mark_failed(journal_stage, project_id, "content.json不存在或无法读取")
+                else:
+                    ctx.report_project_complete(project_id)
+                    journal.mark_done(journal_stage, project_id)
+                    manifest.update(site, project_id,
+                                    downloaded_count=count_downloaded_images(os.path.join(projects_dir, project_id)))
+                ctx.update(1)
+                continue
+            ctx.report_project_start(project_id)
+            journal.mark_in_flight(journal_stage, project_id)
+            ctx.report_project_sub_curr(project_id, 0)
+            ctx.report_project_sub_total(project_id, len(pending_images))
+            project_states[project_id] = {'remaining': len(pending_images), 'success': 0, 'failed': 0, 'skipped': 0,
+                                          'blob_entries': {}}
+            for pending_image in pending_images:
+                yield project_id, pending_image
+
+    def _finish_project(project_id: str, state: dict):
+        project_dir = os.path.join(projects_dir, project_id)
+        if state['blob_entries']:
+            blob_index = load_blob_index(project_dir)
+            blob_index.update(state['blob_entries'])
+            save_blob_index(project_dir, blob_index)
+        manifest.update(site, project_id, downloaded_count=count_downloaded_images(project_dir))
+        if state['failed'] > 0:
             ctx.report_project_failed(project_id)
-        else:
+            journal.mark_failed(journal_stage, project_id, f"{state['failed']}张图片下载失败")
+        elif state['skipped'] > 0 or state['success'] == 0:
+            # 中途停止，部分图片未下载，在日志中保持in_flight，恢复时重新下载剩余的图片
             ctx.report_project_complete(project_id)
+        else:
+            ctx.report_project_success(project_id)
+            journal.mark_done(journal_stage, project_id)
         ctx.update(1)
 
-    with ThreadPoolExecutor(max_workers=48) as executor:
-        futures = (executor.submit(_download_images, project_id, i) for i, project_id in enumerate(g.project_id_queue))
+    def _download_image(project_id: str, pending_image: dict):
+        state = project_states[project_id]
+        success, blob_entry, skipped = False, None, ctx.should_stop
+        if not skipped:
+            try:
+                success, blob_entry = download_gallery_image(pending_image['img_url'], pending_image['img_path'],
+                                                             adaptive_concurrency=num_workers)
+            except Exception as e:
+                logging.error(f"project {project_id} [{pending_image['img_index']}] error: {str(e)}")
+        with lock:
+            state['remaining'] -= 1
+            if success:
+                state['success'] += 1
+            elif skipped:
+                state['skipped'] += 1
+            else:
+                state['failed'] += 1
+            if blob_entry is not None:
+                state['blob_entries'][f"{pending_image['variant']}/{os.path.basename(pending_image['img_path'])}"] = \
+                    blob_entry
+            ctx.report_project_sub_curr(project_id, state['success'] + state['failed'])
+            finished = state['remaining'] == 0
+        if finished:
+            _finish_project(project_id, state)
+
+    set_pool_size(num_workers)  # 连接池与worker数量保持一致
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        futures = set()
+        for project_id, pending_image in _iter_image_tasks():
+            if len(futures) >= num_workers * 4:  # 限制排队的任务数量
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            futures.add(executor.submit(_download_image, project_id, pending_image))
         for future in as_completed(futures):
             future.result()
 
+    journal.flush()
+    manifest.flush()
+    shard_store = get_shard_store(projects_dir)
+    if shard_store is not None:
+        shard_store.flush()
     logging.info('complete')
 
 
+def common__convert_gallery_images_to_shards(ctx: WorkingContext, projects_dir, remove_source: bool = False, *args):
+    """
+    将项目文件夹中已下载的gallery图片（各尺寸）打包追加到shard中，已在shard中的图片跳过
+    :param remove_source: 打包后删除原图片文件，之后读取时自动从shard中读取
+    """
+    _ = args
+    from utils.io_utils import is_image_complete
+    from utils.shard_utils import get_shard_store
+    manifest = _get_built_project_manifest(ctx, projects_dir)
+    if manifest is None:
+        return
+    project_ids = manifest.query(_get_site_name(projects_dir), 'downloaded_count > 0')
+    shard_store = get_shard_store(projects_dir, create=True)
+    ctx.set_total(len(project_ids))
+    ctx.set_curr(0)
+    num_projects, num_packed, num_removed = 0, 0, 0
+    for project_id in project_ids:
+        if ctx.should_stop:
+            break
+        ctx.update(1)
+        ctx.report_project_start(project_id)
+        project_dir = os.path.join(projects_dir, project_id)
+        blob_index = load_blob_index(project_dir)
+        packed_images = shard_store.list_project_images(project_id)
+        packed_paths = []
+        for variant in user_settings.image_variant_sizes:
+            variant_dir = os.path.join(project_dir, 'image_gallery', variant)
+            if not os.path.isdir(variant_dir):
+                continue
+            for name in sorted(os.listdir(variant_dir)):
+                img_path = os.path.join(variant_dir, name)
+                if not name.endswith('.jpg'):
+                    continue
+                if name not in packed_images.get(variant, []):
+                    if not is_image_complete(img_path):
+                        logging.warning(f"project {project_id} 图片{variant}/{name}不完整，跳过")
+                        continue
+                    with open(img_path, 'rb') as f:
+                        data = f.read()
+                    shard_store.append(project_id, variant, name, data,
+                                       blob_index.get(f'{variant}/{name}', {}).get('url'))
+                    num_packed += 1
+                packed_paths.append(img_path)
+        if remove_source and packed_paths:
+            shard_store.flush(sync=True)  # 确认数据及索引已经写入后再删除原文件
+            for img_path in packed_paths:
+                os.remove(img_path)
+                num_removed += 1
+            for variant_dir in {os.path.dirname(img_path) for img_path in packed_paths}:
+                if not os.listdir(variant_dir):
+                    os.rmdir(variant_dir)
+        num_projects += 1
+        ctx.report_project_success(project_id)
+    shard_store.flush()
+    ctx.custom_data['final_msg'] = f"已处理{num_projects}个项目，打包了{num_packed}张图片，删除了{num_removed}个原文件"
+
+
 def common__upload_canny_images(ctx: WorkingContext,
                                db_name: str,
                                projects_dir: str,
@@ -974,17 +1695,19 @@ def common__generate_canny_for_real_photos(ctx: WorkingContext,
     if not os.path.isdir(projects_dir):
         raise Exception(f"projects_dir 不存在: {projects_dir}")
 
-    # 1) 预扫描，统计总图片数（large目录下）
-    project_ids = [pid for pid in os.listdir(projects_dir)
-                   if os.path.isdir(os.path.join(projects_dir, pid))]
+    # 1) 预扫描，统计总图片数（large目录下），只需检查索引中已下载过图片的项目
+    from utils.manifest_utils import count_canny_images
+    manifest = _get_built_project_manifest(ctx, projects_dir)
+    if manifest is None:
+        return
+    site = _get_site_name(projects_dir)
+    project_ids = manifest.query(site, 'downloaded_count > 0')
     total_images = 0
     project_to_images = {}
     for pid in project_ids:
-        large_dir = os.path.join(projects_dir, pid, 'image_gallery', 'large')
-        if not os.path.isdir(large_dir):
-            continue
-        image_names = [n for n in os.listdir(large_dir)
-                       if n.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp'))]
+        # 包括保存在shard中的图片
+        image_names = list(list_gallery_image_paths(os.path.join(projects_dir, pid), 'image_gallery/large',
+                                                    allow_smaller=False))
         if len(image_names) == 0:
             continue
         project_to_images[pid] = image_names
@@ -1026,7 +1749,7 @@ def common__generate_canny_for_real_photos(ctx: WorkingContext,
                 break
             try:
                 img_path = os.path.join(large_dir, img_name)
-                img = Image.open(img_path)
+                img = open_gallery_image(img_path)
 
                 # 分类：判定是否为真实照片
                 _ = classifier.apply(img)
@@ -1042,6 +1765,7 @@ def common__generate_canny_for_real_photos(ctx: WorkingContext,
                 logging.warning(f"生成Canny失败 pid={pid}, img={img_name}, err={e}")
             finally:
                 ctx.update(1)  # 全局进度按图片累计
+        manifest.update(site, pid, canny_count=count_canny_images(os.path.join(projects_dir, pid)))
 
     total_secs = time.time() - start_ts
     ctx.report_msg(f"Canny生成完成: 真实照片 {processed_real_photos}/{total_images} 用时 {int(total_secs)}s")
@@ -1049,6 +1773,7 @@ def common__generate_canny_for_real_photos(ctx: WorkingContext,
     ctx.custom_data['total_images_scanned'] = total_images
     ctx.custom_data['real_photos_processed'] = processed_real_photos
     ctx.custom_data['projects_scanned'] = scanned_projects
+    manifest.flush()
 
 def common__upload_content(ctx: WorkingContext, db_name, projects_dir, skip_exist: bool = True, *args):
     if g.mongo_client is None:
@@ -1056,6 +1781,9 @@ def common__upload_content(ctx: WorkingContext, db_name, projects_dir, skip_exis
     db = g.mongo_client[db_name]
 
     content_collection = db['content_collection']
+    from utils.manifest_utils import get_project_manifest
+    manifest = get_project_manifest()
+    site = _get_site_name(projects_dir)
 
     all_projects = os.listdir(projects_dir)
     ctx.set_total(len(all_projects))
@@ -1072,6 +1800,7 @@ def common__upload_content(ctx: WorkingContext, db_name, projects_dir, skip_exis
             existing_doc = content_collection.find_one({'_id': project_id})
             if existing_doc:
                 # logging.info(f"project: {project_id} 已存在于数据库中，跳过处理")
+                manifest.update(site, project_id, uploaded=True)
                 ctx.report_project_complete(project_id)
                 return
 
@@ -1083,8 +1812,7 @@ def common__upload_content(ctx: WorkingContext, db_name, projects_dir, skip_exis
             return
 
         try:
-            with open(content_json_path, 'r', encoding='utf-8') as f:
-                content_data = json.load(f)
+            content_data = load_json(content_json_path)
         except Exception as e:
             logging.error(f"project: {project_id} content.json文件读取失败，错误信息：{str(e)}")
             os.remove(content_json_path)
@@ -1103,12 +1831,14 @@ def common__upload_content(ctx: WorkingContext, db_name, projects_dir, skip_exis
         #     logging.info(f"project: {project_id} 插入成功")
         # else:
         #     logging.info(f"project: {project_id} 更新成功，修改计数: {content_result.modified_count}")
+        manifest.update(site, project_id, uploaded=True)
         ctx.report_project_success(project_id)
 
     with ThreadPoolExecutor(max_workers=16) as executor:
         futures = (executor.submit(_handle_project, project_id) for project_id in all_projects)
         for future in tqdm(as_completed(futures), total=len(all_projects)):
             future.result()
+    manifest.flush()
     logging.info('complete')
 
 
@@ -1611,6 +2341,65 @@ def get_image_processors(processor_type):
     return []
 
 
+class EmbeddingLruCache:
+    """(sha256, chunk_idx) -> 嵌入向量的LRU缓存，容量有限，内存占用不随图片总数增长"""
+
+    def __init__(self, max_size: int = 4096):
+        self.max_size = max_size
+        self._vectors: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._vectors.get(key)
+            if vector is not None:
+                self._vectors.move_to_end(key)
+            return vector
+
+    def put(self, key, vector: np.ndarray):
+        with self._lock:
+            self._vectors[key] = vector
+            self._vectors.move_to_end(key)
+            while len(self._vectors) > self.max_size:
+                self._vectors.popitem(last=False)
+
+
+def _get_image_embeddings_dedup(chunks: list[dict], get_image_embeddings,
+                                blob_embedding_cache: EmbeddingLruCache) -> np.ndarray:
+    """
+    计算chunks的嵌入向量，内容相同(sha256相同)的图片块只计算一次
+    :param blob_embedding_cache: 在同一个任务中共享，只保留最近使用的向量
+    """
+    keys = [(chunk['sha256'], chunk['chunk_idx']) if chunk.get('sha256') else None for chunk in chunks]
+    vectors = [None] * len(chunks)
+    compute_idxes = []
+    first_idx_of_key = {}
+    for i, key in enumerate(keys):
+        cached_vector = blob_embedding_cache.get(key) if key is not None else None
+        if cached_vector is not None:
+            vectors[i] = cached_vector
+        elif key is None or key not in first_idx_of_key:
+            compute_idxes.append(i)
+            if key is not None:
+                first_idx_of_key[key] = i
+    if compute_idxes:
+        computed_vectors = get_image_embeddings(
+            [chunks[i]['image'] for i in compute_idxes],
+            batch_size=min(len(compute_idxes), 32),
+            show_progress_bar=True
+        )
+        for vector, i in zip(computed_vectors, compute_idxes):
+            vectors[i] = vector
+            if keys[i] is not None and not np.isnan(vector).any():
+                blob_embedding_cache.put(keys[i], vector)
+    for i, key in enumerate(keys):
+        if vectors[i] is None:
+            vectors[i] = vectors[first_idx_of_key[key]]
+    if len(chunks) - len(compute_idxes) > 0:
+        logging.info(f"{len(chunks) - len(compute_idxes)}个图片块与已计算的图片内容相同，复用嵌入向量")
+    return np.stack(vectors)
+
+
 def common__calculate_image_embedding_using_gme_Qwen2_VL_2B_api(ctx: WorkingContext,
                                                                 db_name,
                                                                 collection_name,
@@ -1631,6 +2420,9 @@ def common__calculate_image_embedding_using_gme_Qwen2_VL_2B_api(ctx: WorkingCont
         raise Exception("MongoDB连接失败")
     db = g.mongo_client[db_name]
     content_embedding_collection = db[collection_name]
+    from utils.manifest_utils import get_project_manifest
+    manifest = get_project_manifest()
+    site = _get_site_name(projects_dir)
 
     ctx.report_msg("正在加载模型...")
     from apis.qwen2_vl_32b_api import get_image_embeddings
@@ -1650,6 +2442,7 @@ def common__calculate_image_embedding_using_gme_Qwen2_VL_2B_api(ctx: WorkingCont
 
     _img_chunks_queue = deque()
     _doc_buffer_queue = deque()
+    blob_embedding_cache = EmbeddingLruCache()  # 内容相同的图片只计算一次嵌入向量
 
     def _img_processing_thread():
         while len(project_id_queue) > 0:
@@ -1668,14 +2461,20 @@ def common__calculate_image_embedding_using_gme_Qwen2_VL_2B_api(ctx: WorkingCont
             ctx.update(1)
             ctx.report_project_start(project_id)
 
-            image_folder = os.path.join(projects_dir, project_id, img_dir)
-            if not os.path.isdir(image_folder):
+            # 下载时回退到更大尺寸的图片也会被包含在内
+            image_path_by_name = list_gallery_image_paths(os.path.join(projects_dir, project_id), img_dir)
+            if not image_path_by_name:
                 ctx.report_project_failed(project_id)
                 logging.warning(f"project: {project_id} 没有图像内容")
                 continue
-            image_names: list[str] = os.listdir(image_folder)
-            image_paths = [os.path.join(image_folder, image_name) for image_name in image_names]
+            image_names: list[str] = list(image_path_by_name.keys())
+            image_paths = list(image_path_by_name.values())
             image_idxes = [int(image_name.split('.')[0]) for image_name in image_names]
+            blob_index = load_blob_index(os.path.join(projects_dir, project_id))
+            gallery_dir = os.path.join(projects_dir, project_id, 'image_gallery')
+            # 单独文件的sha256记录在blob_index.json中，保存在shard中的图片从shard索引中读取
+            image_sha256s = [blob_index.get(os.path.relpath(image_path, gallery_dir).replace('\\', '/'), {}).get('sha256')
+                             or get_gallery_image_sha256(image_path) for image_path in image_paths]
             ctx.report_project_sub_curr(project_id, "PCS")
             ctx.report_project_sub_total(project_id, len(image_paths))
 
@@ -1683,7 +2482,7 @@ def common__calculate_image_embedding_using_gme_Qwen2_VL_2B_api(ctx: WorkingCont
             # 可以像文本分割一样，对image也进行切割
             for i, img_path in enumerate(image_paths):
                 ctx.report_project_sub_curr(project_id, f"PCS[{i}]")
-                img = Image.open(img_path)
+                img = open_gallery_image(img_path)
                 imgs = img_processor.apply(img)
                 if not isinstance(imgs, list):
                     imgs = [imgs]
@@ -1701,6 +2500,7 @@ def common__calculate_image_embedding_using_gme_Qwen2_VL_2B_api(ctx: WorkingCont
                             'image': img,
                             'image_idx': image_idxes[i],
                             'chunk_idx': chunk_idx,
+                            'sha256': image_sha256s[i],
                         }
                     )
             if len(chunks) == 0:
@@ -1727,12 +2527,7 @@ def common__calculate_image_embedding_using_gme_Qwen2_VL_2B_api(ctx: WorkingCont
             project_id = chunks[0]['project_id']
             ctx.report_project_sub_curr(project_id, f"EBD")
             ctx.report_project_sub_total(project_id, len(chunks))
-            input_images = [chunk['image'] for chunk in chunks]
-            embedding_vectors = get_image_embeddings(
-                input_images,
-                batch_size=min(len(input_images), 32),
-                show_progress_bar=True
-            )
+            embedding_vectors = _get_image_embeddings_dedup(chunks, get_image_embeddings, blob_embedding_cache)
             # 判断是否有NaN
             if np.isnan(embedding_vectors).any():
                 ctx.report_project_failed(project_id)
@@ -1771,6 +2566,7 @@ def common__calculate_image_embedding_using_gme_Qwen2_VL_2B_api(ctx: WorkingCont
             project_id = buffer[0]['project_id']
             ctx.report_project_sub_curr(project_id, f"WDB")
             result = content_embedding_collection.insert_many(buffer)
+            manifest.update(site, project_id, embedded=True)
             ctx.report_project_success(project_id)
 
     process_thread1 = threading.Thread(target=_img_processing_thread)
@@ -1787,6 +2583,7 @@ def common__calculate_image_embedding_using_gme_Qwen2_VL_2B_api(ctx: WorkingCont
     process_thread2.join()
     embedding_thread.join()
     upload_thread.join()
+    manifest.flush()
 
     import torch
     if torch.cuda.is_available():
@@ -1990,6 +2787,9 @@ def common__calculate_image_embedding_using_qwen2_5_VL_32B_Instruct(ctx: Working
         raise Exception("MongoDB连接失败")
     db = g.mongo_client[db_name]
     content_embedding_collection = db[collection_name]
+    from utils.manifest_utils import get_project_manifest
+    manifest = get_project_manifest()
+    site = _get_site_name(projects_dir)
 
     ctx.report_msg("正在加载模型...")
     from apis.qwen2_5_VL_32B_api import get_image_embeddings
@@ -2009,6 +2809,7 @@ def common__calculate_image_embedding_using_qwen2_5_VL_32B_Instruct(ctx: Working
 
     _img_chunks_queue = deque()
     _doc_buffer_queue = deque()
+    blob_embedding_cache = EmbeddingLruCache()  # 内容相同的图片只计算一次嵌入向量
 
     def _img_processing_thread():
         while len(project_id_queue) > 0:
@@ -2027,14 +2828,20 @@ def common__calculate_image_embedding_using_qwen2_5_VL_32B_Instruct(ctx: Working
             ctx.update(1)
             ctx.report_project_start(project_id)
 
-            image_folder = os.path.join(projects_dir, project_id, img_dir)
-            if not os.path.isdir(image_folder):
+            # 下载时回退到更大尺寸的图片也会被包含在内
+            image_path_by_name = list_gallery_image_paths(os.path.join(projects_dir, project_id), img_dir)
+            if not image_path_by_name:
                 ctx.report_project_failed(project_id)
                 logging.warning(f"project: {project_id} 没有图像内容")
                 continue
-            image_names: list[str] = os.listdir(image_folder)
-            image_paths = [os.path.join(image_folder, image_name) for image_name in image_names]
+            image_names: list[str] = list(image_path_by_name.keys())
+            image_paths = list(image_path_by_name.values())
             image_idxes = [int(image_name.split('.')[0]) for image_name in image_names]
+            blob_index = load_blob_index(os.path.join(projects_dir, project_id))
+            gallery_dir = os.path.join(projects_dir, project_id, 'image_gallery')
+            # 单独文件的sha256记录在blob_index.json中，保存在shard中的图片从shard索引中读取
+            image_sha256s = [blob_index.get(os.path.relpath(image_path, gallery_dir).replace('\\', '/'), {}).get('sha256')
+                             or get_gallery_image_sha256(image_path) for image_path in image_paths]
             ctx.report_project_sub_curr(project_id, "PCS")
             ctx.report_project_sub_total(project_id, len(image_paths))
 
@@ -2042,7 +2849,7 @@ def common__calculate_image_embedding_using_qwen2_5_VL_32B_Instruct(ctx: Working
             # 可以像文本分割一样，对image也进行切割
             for i, img_path in enumerate(image_paths):
                 ctx.report_project_sub_curr(project_id, f"PCS[{i}]")
-                img = Image.open(img_path)
+                img = open_gallery_image(img_path)
                 imgs = img_processor.apply(img)
                 if not isinstance(imgs, list):
                     imgs = [imgs]
@@ -2054,6 +2861,7 @@ def common__calculate_image_embedding_using_qwen2_5_VL_32B_Instruct(ctx: Working
                             'image': img,
                             'image_idx': image_idxes[i],
                             'chunk_idx': chunk_idx,
+                            'sha256': image_sha256s[i],
                         }
                     )
             if len(chunks) == 0:
@@ -2080,12 +2888,7 @@ def common__calculate_image_embedding_using_qwen2_5_VL_32B_Instruct(ctx: Working
             project_id = chunks[0]['project_id']
             ctx.report_project_sub_curr(project_id, f"EBD")
             ctx.report_project_sub_total(project_id, len(chunks))
-            input_images = [chunk['image'] for chunk in chunks]
-            embedding_vectors = get_image_embeddings(
-                input_images,
-                batch_size=min(len(input_images), 32),
-                show_progress_bar=True
-            )
+            embedding_vectors = _get_image_embeddings_dedup(chunks, get_image_embeddings, blob_embedding_cache)
             # 判断是否有NaN
             if np.isnan(embedding_vectors).any():
                 ctx.report_project_failed(project_id)
@@ -2124,6 +2927,7 @@ def common__calculate_image_embedding_using_qwen2_5_VL_32B_Instruct(ctx: Working
             project_id = buffer[0]['project_id']
             ctx.report_project_sub_curr(project_id, f"WDB")
             result = content_embedding_collection.insert_many(buffer)
+            manifest.update(site, project_id, embedded=True)
             ctx.report_project_success(project_id)
 
     process_thread1 = threading.Thread(target=_img_processing_thread)
@@ -2140,6 +2944,7 @@ def common__calculate_image_embedding_using_qwen2_5_VL_32B_Instruct(ctx: Working
     process_thread2.join()
     embedding_thread.join()
     upload_thread.join()
+    manifest.flush()
 
     import torch
     if torch.cuda.is_available():
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+# @Author  : Yiheng Feng
+# @Time    : 10/20/2026 11:30 AM
+# @Function: 在本地模拟服务器上测试各爬虫阶段的吞吐量，输出requests/s、bytes/s及p50/p99延迟
+"""
+示例：
+    python -m dev.benchmark_crawlers --scenarios html_async,html_threads --workers 16,64,256 --latency-ms 80
+    python -m dev.benchmark_crawlers --scenarios images --workers 8,32,48 --error-rate 0.02
+    python -m dev.benchmark_crawlers --scenarios gooood --workers 1,4,8 --burst-every 10 --burst-duration 2
+
+所有设置都被临时指向模拟服务器和临时目录，不会修改results文件夹及user_settings.json
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import user_settings
+from dev.mock_server import MockConfig, MockServer
+
+
+def _prepare_settings(base_url: str, work_dir: str, adaptive: bool):
+    user_settings.archdaily_base_url = base_url
+    user_settings.archdaily_projects_dir = os.path.join(work_dir, 'archdaily', 'projects')
+    user_settings.archdaily_invalid_projects_ids_path = os.path.join(work_dir, 'invalid_project_ids.json')
+    user_settings.gooood_base_url = f"{base_url}wp/v2/fetch-posts?page=<page>&per_page=18"
+    user_settings.gooood_results_dir = os.path.join(work_dir, 'gooood')
+    user_settings.gooood_projects_dir = os.path.join(work_dir, 'gooood', 'projects')
+    user_settings.image_blob_dir = os.path.join(work_dir, 'blobs')
+    user_settings.crawl_journal_path = os.path.join(work_dir, 'crawl_journal.sqlite3')
+    user_settings.project_manifest_path = os.path.join(work_dir, 'project_manifest.sqlite3')
+    user_settings.image_storage_format = 'files'
+    user_settings.crawl_adaptive_concurrency = adaptive
+    os.makedirs(user_settings.archdaily_projects_dir, exist_ok=True)
+
+    from utils import rate_utils
+    with rate_utils._controllers_lock:
+        rate_utils._controllers.clear()  # 每个配置重新学习并发
+
+    from utils import manifest_utils
+    with manifest_utils._manifest_lock:
+        manifest_utils._manifest = None  # 下次使用时打开临时目录中的项目状态索引
+
+
+def _bench_html_async(workers: int, num_items: int, start_id: int):
+    from utils.crawl_utils import run_async_crawl
+    from utils.html_utils import request_project_html_archdaily_async
+    from utils.rate_utils import get_controller
+    project_ids = [str(project_id) for project_id in range(start_id, start_id + num_items)]
+    invalid_project_ids = set()
+    controller = get_controller(user_settings.archdaily_base_url, workers)
+
+    async def _fetch(session, project_id, i):
+        return await request_project_html_archdaily_async(session, project_id, i, num_items, invalid_project_ids,
+                                                          controller=controller)
+
+    run_async_crawl(project_ids, _fetch, max_concurrency=workers)
+    return num_items
+
+
+def _bench_html_threads(workers: int, num_items: int, start_id: int):
+    from utils.html_utils import request_project_html_archdaily
+    from utils.http_utils import set_pool_size
+    from utils.rate_utils import get_controller
+    project_ids = [str(project_id) for project_id in range(start_id, start_id + num_items)]
+    invalid_project_ids = set()
+    controller = get_controller(user_settings.archdaily_base_url, workers)
+    set_pool_size(workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda item: request_project_html_archdaily(item[1], item[0], num_items,
+                                                                      invalid_project_ids, controller=controller),
+                          enumerate(project_ids)))
+    return num_items
+
+
+def _bench_images(workers: int, num_items: int, start_id: int, images_per_project: int):
+    from utils.html_utils import download_images_common
+    from utils.http_utils import set_pool_size
+    projects_dir = user_settings.archdaily_projects_dir
+    project_ids = []
+    for project_id in range(start_id, start_id + num_items):
+        project_dir = os.path.join(projects_dir, str(project_id))
+        os.makedirs(project_dir, exist_ok=True)
+        image_gallery = [{'url_large': f"{user_settings.archdaily_base_url}images/{project_id}/{index}/large.jpg"}
+                         for index in range(images_per_project)]
+        with open(os.path.join(project_dir, 'content.json'), 'w', encoding='utf-8') as f:
+            json.dump({'image_gallery': image_gallery}, f)
+        project_ids.append(str(project_id))
+    set_pool_size(workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda item: download_images_common(projects_dir, item[1], item[0], num_items, 'large',
+                                                              adaptive_concurrency=workers),
+                          enumerate(project_ids)))
+    return num_items * images_per_project
+
+
+def _bench_gooood(workers: int, num_items: int, start_id: int):
+    _ = start_id
+    from dev import backend as b  # 需要streamlit等完整环境
+    user_settings.gooood_page_window = workers
+    ctx = b.WorkingContext('benchmark-gooood', b.gooood__scrap_pages)
+    end_page = max(1, num_items // 18)
+    b.gooood__scrap_pages(ctx, False, 1, end_page, False)
+    return end_page
+
+
+SCENARIOS = {
+    'html_async': _bench_html_async,
+    'html_threads': _bench_html_threads,
+    'images': _bench_images,
+    'gooood': _bench_gooood,
+}
+
+
+def run_benchmark(scenario: str, workers: int, mock_config: MockConfig, num_items: int, adaptive: bool,
+                  port: int) -> dict:
+    server = MockServer(mock_config, port=port).start()
+    work_dir = tempfile.mkdtemp(prefix='crawler_benchmark_')
+    saved_settings = dict(user_settings.__dict__)  # 退出时config会保存user_settings，测试结束后必须还原
+    try:
+        _prepare_settings(server.base_url, work_dir, adaptive)
+        server.reset_stats()
+        start_time = time.time()
+        if scenario == 'images':
+            num_done = _bench_images(workers, num_items, 1, mock_config.images_per_project)
+        else:
+            num_done = SCENARIOS[scenario](workers, num_items, 1)
+        elapsed = time.time() - start_time
+        summary = server.stats.summary()
+        summary.update({'scenario': scenario, 'workers': workers, 'adaptive': adaptive,
+                        'items': num_done, 'elapsed_s': elapsed, 'items_per_s': num_done / max(elapsed, 1e-6)})
+        return summary
+    finally:
+        user_settings.__dict__.clear()
+        user_settings.__dict__.update(saved_settings)
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def print_results(results: list[dict]):
+    header = f"{'scenario':<14}{'workers':>8}{'adaptive':>10}{'items/s':>10}{'req/s':>10}{'MB/s':>9}" \
+             f"{'p50(ms)':>10}{'p99(ms)':>10}  status"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print(f"{r['scenario']:<14}{r['workers']:>8}{str(r['adaptive']):>10}{r['items_per_s']:>10.1f}"
+              f"{r['requests_per_s']:>10.1f}{r['bytes_per_s'] / 1024 / 1024:>9.2f}"
+              f"{r['p50_ms']:>10.1f}{r['p99_ms']:>10.1f}  {r['status_counts']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="爬虫吞吐量测试")
+    parser.add_argument('--scenarios', default='html_async,html_threads,images',
+                        help=f"逗号分隔，可选: {','.join(SCENARIOS)}")
+    parser.add_argument('--workers', default='16,64', help="逗号分隔的并发数量")
+    parser.add_argument('--num-items', type=int, default=300, help="项目数量（gooood为项目数/18页）")
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--burst-every', type=float, default=0)
+    parser.add_argument('--burst-duration', type=float, default=0)
+    parser.add_argument('--images-per-project', type=int, default=12)
+    parser.add_argument('--no-adaptive', action='store_true', help="关闭AIMD自适应并发")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--output', default=None, help="将结果保存为json")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)  # 避免逐个项目的日志影响测试
+
+    mock_config = MockConfig(latency_ms=args.latency_ms, error_rate=args.error_rate,
+                             burst_every=args.burst_every, burst_duration=args.burst_duration,
+                             images_per_project=args.images_per_project)
+    results = []
+    for scenario in args.scenarios.split(','):
+        for workers in [int(w) for w in args.workers.split(',')]:
+            print(f"running {scenario} workers={workers} ...")
+            results.append(run_benchmark(scenario, workers, mock_config, args.num_items,
+                                         not args.no_adaptive, args.port))
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+# @Author  : Yiheng Feng
+# @Time    : 10/21/2026 2:10 PM
+# @Function: 对比不同html解析器的extract_*结果是否与html.parser一致，并测试解析速度
+"""
+示例：
+    python -m dev.benchmark_parsers --site archdaily --sample 500 --backends html.parser,lxml
+    python -m dev.benchmark_parsers --site archdaily --backends html.parser+strainer,lxml+strainer
+    python -m dev.benchmark_parsers --site gooood --sample 1000
+    python -m dev.benchmark_parsers --mock 200   # 没有本地数据时使用模拟服务器的合成页面
+    python -m dev.benchmark_parsers --fixtures   # 使用dev/fixtures/archdaily中保存的页面检查一致性，不一致时返回非0
+
+以html.parser的结果为标准(golden)，其余解析器的结果出现差异时输出项目id和字段，全部一致时才建议切换html_parser_backend
+backend后加上+strainer表示使用ArchdailyFieldStrainer只解析需要的标签（与parse_project_content_archdaily相同）
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+from config import user_settings
+from utils.html_utils import ARCHDAILY_FIELD_TAGS, HTML_PARSER_BACKENDS, ArchdailyFieldStrainer, make_soup, \
+    extract_main_content_archdaily, extract_title_archdaily, extract_tags_archdaily, extract_specs_archdaily, \
+    extract_main_content_gooood, is_parser_backend_available
+from utils.io_utils import read_html
+
+GOLDEN_BACKEND = 'html.parser'
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'archdaily')
+
+
+def _extract_archdaily(project_id: str, html_content: str, backend: str) -> dict:
+    backend, _, option = backend.partition('+')
+    parse_only = ArchdailyFieldStrainer(list(ARCHDAILY_FIELD_TAGS)) if option == 'strainer' else None
+    soup = make_soup(html_content, backend, parse_only=parse_only)
+    return {'main_content': extract_main_content_archdaily(project_id, soup),
+            'title': extract_title_archdaily(project_id, soup),
+            'tags': extract_tags_archdaily(project_id, soup),
+            'specs': extract_specs_archdaily(project_id, soup)}
+
+
+def _extract_gooood(project_id: str, html_content: str, backend: str) -> dict:
+    return {'main_content': extract_main_content_gooood(project_id, make_soup(html_content, backend))}
+
+
+def load_sample(site: str, sample: int, seed: int) -> list[tuple[str, str]]:
+    """返回[(project_id, html_content), ...]"""
+    projects_dir = user_settings.archdaily_projects_dir if site == 'archdaily' else user_settings.gooood_projects_dir
+    project_ids = sorted(os.listdir(projects_dir))
+    random.Random(seed).shuffle(project_ids)
+    corpus = []
+    for project_id in project_ids:
+        if len(corpus) >= sample:
+            break
+        project_dir = os.path.join(projects_dir, project_id)
+        if site == 'archdaily':
+            html_content = read_html(project_dir)
+        else:
+            data_file_path = os.path.join(project_dir, f'{project_id}.json')
+            if not os.path.isfile(data_file_path):
+                continue
+            with open(data_file_path, 'r', encoding='utf-8') as f:
+                html_content = json.load(f)['content']['rendered']
+        if html_content:
+            corpus.append((project_id, html_content))
+    return corpus
+
+
+def load_mock_sample(sample: int) -> list[tuple[str, str]]:
+    from dev.mock_server import MockConfig, _is_valid_project, _make_project_html
+    config = MockConfig()
+    project_ids = [project_id for project_id in range(1, sample * 2) if _is_valid_project(project_id, config)]
+    return [(str(project_id), _make_project_html(project_id, config)) for project_id in project_ids[:sample]]
+
+
+def load_fixture_sample() -> list[tuple[str, str]]:
+    """dev/fixtures/archdaily/<project_id>.html"""
+    corpus = []
+    for file_name in sorted(os.listdir(FIXTURES_DIR)):
+        if file_name.endswith('.html'):
+            with open(os.path.join(FIXTURES_DIR, file_name), 'r', encoding='utf-8') as f:
+                corpus.append((os.path.splitext(file_name)[0], f.read()))
+    return corpus
+
+
+def run(corpus: list[tuple[str, str]], site: str, backends: list[str]) -> dict:
+    extract = _extract_archdaily if site == 'archdaily' else _extract_gooood
+    golden = {project_id: extract(project_id, html_content, GOLDEN_BACKEND) for project_id, html_content in corpus}
+    results = {}
+    for backend in backends:
+        mismatches = []
+        start_time = time.time()
+        outputs = {project_id: extract(project_id, html_content, backend) for project_id, html_content in corpus}
+        elapsed = time.time() - start_time
+        for project_id, output in outputs.items():
+            for field, value in output.items():
+                if value != golden[project_id][field]:
+                    mismatches.append((project_id, field))
+        results[backend] = {'elapsed_s': elapsed, 'pages_per_s': len(corpus) / max(elapsed, 1e-6),
+                            'mismatches': mismatches}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="html解析器对比测试")
+    parser.add_argument('--site', default='archdaily', choices=['archdaily', 'gooood'])
+    parser.add_argument('--sample', type=int, default=500, help="抽样的项目数量")
+    parser.add_argument('--backends', default=','.join(list(HTML_PARSER_BACKENDS) +
+                                                       [f'{backend}+strainer' for backend in HTML_PARSER_BACKENDS]))
+    parser.add_argument('--mock', type=int, default=0, help="使用指定数量的合成页面代替本地项目（仅archdaily）")
+    parser.add_argument('--fixtures', action='store_true', help="使用dev/fixtures中保存的页面（仅archdaily），出现差异时返回1")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)  # extract_*对缺失字段的警告会刷屏
+
+    if args.fixtures:
+        corpus, site = load_fixture_sample(), 'archdaily'
+    elif args.mock:
+        corpus, site = load_mock_sample(args.mock), 'archdaily'
+    else:
+        corpus, site = load_sample(args.site, args.sample, args.seed), args.site
+    assert corpus, "没有找到可用的html"
+    total_kb = sum(len(html_content) for _, html_content in corpus) / 1024
+    print(f"{site}: {len(corpus)}个页面, 共{total_kb:.0f}KB")
+
+    backends = []
+    for backend in args.backends.split(','):
+        if is_parser_backend_available(backend.partition('+')[0]):
+            backends.append(backend)
+        else:
+            print(f"{backend}未安装，跳过")  # 否则make_soup会退回到html.parser，对比没有意义
+    results = run(corpus, site, backends)
+    print(f"{'backend':<22}{'pages/s':>10}{'elapsed(s)':>12}{'mismatches':>12}")
+    for backend, result in results.items():
+        print(f"{backend:<22}{result['pages_per_s']:>10.1f}{result['elapsed_s']:>12.2f}{len(result['mismatches']):>12}")
+    for backend, result in results.items():
+        for project_id, field in result['mismatches'][:20]:
+            print(f"  {backend} 与{GOLDEN_BACKEND}不一致: project {project_id} {field}")
+    if args.fixtures and any(result['mismatches'] for result in results.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+# @Author  : Yiheng Feng
+# @Time    : 10/20/2026 10:15 AM
+# @Function: 本地模拟的ArchDaily/gooood服务器，用于离线测试爬虫吞吐量，支持配置延迟、错误率及429限流
+"""
+路由：
+    GET/HEAD /{id}                          项目页面（有效id返回html，无效id返回404，支持ETag条件请求）
+    GET      /{id}/gallery                  gallery页面，包含data-images
+    GET      /images/{id}/{index}/{variant}.jpg   图片（large/slideshow/medium三种尺寸）
+    GET      /search/api/v1/us/projects?page=N    ArchDaily搜索API
+    GET      /wp/v2/fetch-posts?page=N&per_page=M gooood页面API，包含X-WP-TotalPages响应头
+
+单独运行：
+    python -m dev.mock_server --port 8765 --latency-ms 80 --error-rate 0.01 --burst-every 30 --burst-duration 3
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+from aiohttp import web
+
+IMAGE_VARIANT_BYTES = {'large': 400 * 1024, 'slideshow': 150 * 1024, 'medium': 50 * 1024}
+
+
+@dataclass
+class MockConfig:
+    latency_ms: float = 50  # 平均响应延迟
+    latency_jitter_ms: float = 20
+    error_rate: float = 0.0  # 返回500的概率
+    burst_every: float = 0  # 每隔多少秒进入一次429限流期，0表示不限流
+    burst_duration: float = 0  # 每次限流期持续的秒数
+    invalid_id_modulo: int = 3  # id能被该值整除时视为无效项目(404)
+    images_per_project: int = 12
+    page_kb: int = 120  # 合成项目页面的大小
+    num_projects: int = 2000  # 搜索API及gooood API中的项目总数
+    record_dir: Optional[str] = None  # 不为None时优先返回该目录中录制的<id>/content.html
+    seed: int = 0
+
+
+@dataclass
+class MockStats:
+    latencies: list = field(default_factory=list)
+    bytes_sent: int = 0
+    status_counts: dict = field(default_factory=dict)
+    start_time: float = field(default_factory=time.time)
+
+    def reset(self):
+        self.latencies.clear()
+        self.bytes_sent = 0
+        self.status_counts.clear()
+        self.start_time = time.time()
+
+    def record(self, status: int, latency: float, num_bytes: int):
+        self.latencies.append(latency)
+        self.bytes_sent += num_bytes
+        self.status_counts[status] = self.status_counts.get(status, 0) + 1
+
+    def summary(self) -> dict:
+        elapsed = max(time.time() - self.start_time, 1e-6)
+        latencies = sorted(self.latencies)
+
+        def _percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0.0
+
+        return {
+            'requests': len(latencies),
+            'requests_per_s': len(latencies) / elapsed,
+            'bytes_per_s': self.bytes_sent / elapsed,
+            'p50_ms': _percentile(0.5),
+            'p99_ms': _percentile(0.99),
+            'status_counts': dict(sorted(self.status_counts.items())),
+        }
+
+
+def _is_valid_project(project_id: int, config: MockConfig) -> bool:
+    return project_id % config.invalid_id_modulo != 0
+
+
+def _make_etag(project_id: int) -> str:
+    return '"' + hashlib.md5(str(project_id).encode()).hexdigest() + '"'
+
+
+def _make_project_html(project_id: int, config: MockConfig) -> str:
+    if config.record_dir:
+        from utils.io_utils import read_html
+        html = read_html(os.path.join(config.record_dir, str(project_id)))
+        if html is not None:
+            return html
+    rnd = random.Random(project_id)
+    paragraphs = []
+    size = 0
+    while size < config.page_kb * 1024:
+        paragraph = f"<p>{' '.join(rnd.choice(['architecture', 'concrete', 'facade', 'light', 'courtyard', 'timber']) for _ in range(80))}</p>"
+        paragraphs.append(paragraph)
+        size += len(paragraph)
+    return f"""<!DOCTYPE html>
+<html><head><title>Project {project_id}</title></head>
+<body>
+<header class="article-header"><h1>Mock Project {project_id}</h1></header>
+<ul class="gallery-thumbs"><li><a class="gallery-thumbs-link" href="/{project_id}/gallery">gallery</a></li></ul>
+<div class="afd-specs"><ul>
+<li class="afd-specs__item"><span class="afd-specs__key">Year: </span><span class="afd-specs__value">{2000 + project_id % 25}</span></li>
+</ul></div>
+<article>{''.join(paragraphs)}</article>
+</body></html>"""
+
+
+def _make_gallery_html(project_id: int, config: MockConfig) -> str:
+    images = [{f'url_{variant}': f'/images/{project_id}/{index}/{variant}.jpg' for variant in IMAGE_VARIANT_BYTES}
+              for index in range(config.images_per_project)]
+    data_images = json.dumps(images).replace('"', '&quot;')
+    return f'<html><body><div id="gallery-items" class="afd-gal-items" data-images="{data_images}"></div></body></html>'
+
+
+_image_payloads: dict[str, bytes] = {}
+
+
+def _make_image_bytes(project_id: int, index: int, variant: str) -> bytes:
+    # 随机内容只生成一次，每张图片以自己的编号开头，保证内容互不相同
+    size = IMAGE_VARIANT_BYTES.get(variant, IMAGE_VARIANT_BYTES['large'])
+    if variant not in _image_payloads:
+        _image_payloads[variant] = random.Random(size).randbytes(size - 36)
+    return b'\xff\xd8' + f'{project_id}-{index}'.encode().ljust(32) + _image_payloads[variant] + b'\xff\xd9'
+
+
+def create_app(config: MockConfig, stats: MockStats) -> web.Application:
+    rnd = random.Random(config.seed)
+    start_time = time.time()
+    html_cache: dict[int, str] = {}  # 生成合成页面的开销较大，避免模拟服务器本身成为瓶颈
+
+    def _in_burst() -> bool:
+        if config.burst_every <= 0 or config.burst_duration <= 0:
+            return False
+        return (time.time() - start_time) % config.burst_every < config.burst_duration
+
+    @web.middleware
+    async def fault_middleware(request: web.Request, handler):
+        request_start = time.time()
+        latency = max(0.0, rnd.gauss(config.latency_ms, config.latency_jitter_ms)) / 1000
+        await asyncio.sleep(latency)
+        if _in_burst():
+            response = web.Response(status=429, headers={'Retry-After': '1'})
+        elif rnd.random() < config.error_rate:
+            response = web.Response(status=500)
+        else:
+            response = await handler(request)
+        num_bytes = response.content_length or (len(response.body) if getattr(response, 'body', None) else 0)
+        stats.record(response.status, time.time() - request_start, num_bytes)
+        return response
+
+    async def project_page(request: web.Request):
+        project_id = int(request.match_info['project_id'])
+        if not _is_valid_project(project_id, config):
+            return web.Response(status=404)
+        etag = _make_etag(project_id)
+        if request.headers.get('If-None-Match') == etag:
+            return web.Response(status=304, headers={'ETag': etag})
+        if request.method == 'HEAD':
+            return web.Response(status=200, headers={'ETag': etag})
+        if project_id not in html_cache:
+            html_cache[project_id] = _make_project_html(project_id, config)
+        return web.Response(text=html_cache[project_id], content_type='text/html', headers={'ETag': etag})
+
+    async def gallery_page(request: web.Request):
+        project_id = int(request.match_info['project_id'])
+        if not _is_valid_project(project_id, config):
+            return web.Response(status=404)
+        return web.Response(text=_make_gallery_html(project_id, config), content_type='text/html')
+
+    async def image(request: web.Request):
+        data = _make_image_bytes(int(request.match_info['project_id']), int(request.match_info['index']),
+                                 request.match_info['variant'])
+        return web.Response(body=data, content_type='image/jpeg')
+
+    async def search_api(request: web.Request):
+        page = int(request.query.get('page', 1))
+        per_page = 20
+        first_id = config.num_projects - (page - 1) * per_page  # 最新的项目id最大
+        results = [{'document_id': project_id, 'title': f'Mock Project {project_id}'}
+                   for project_id in range(first_id, max(first_id - per_page, 0), -1)]
+        return web.json_response({'results': results})
+
+    async def gooood_api(request: web.Request):
+        page = int(request.query.get('page', 1))
+        per_page = int(request.query.get('per_page', 18))
+        total_pages = (config.num_projects + per_page - 1) // per_page
+        if page > total_pages:
+            return web.json_response([], headers={'X-WP-TotalPages': str(total_pages)})
+        posts = [{'id': post_id, 'slug': f'mock-post-{post_id}', 'title': {'rendered': f'Mock Post {post_id}'}}
+                 for post_id in range((page - 1) * per_page, min(page * per_page, config.num_projects))]
+        return web.json_response(posts, headers={'X-WP-TotalPages': str(total_pages)})
+
+    app = web.Application(middlewares=[fault_middleware])
+    app.router.add_get('/search/api/v1/us/projects', search_api)
+    app.router.add_get('/wp/v2/fetch-posts', gooood_api)
+    app.router.add_get(r'/images/{project_id:\d+}/{index:\d+}/{variant}.jpg', image)
+    app.router.add_get(r'/{project_id:\d+}/gallery', gallery_page)
+    app.router.add_get(r'/{project_id:\d+}', project_page)  # 同时处理HEAD
+    return app
+
+
+class MockServer:
+    """在后台线程中运行的模拟服务器，供benchmark在同一进程中使用"""
+
+    def __init__(self, config: MockConfig, host: str = '127.0.0.1', port: int = 8765):
+        self.config = config
+        self.host = host
+        self.port = port
+        self.stats = MockStats()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._started = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._runner = web.AppRunner(create_app(self.config, self.stats), access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        self._loop.run_until_complete(web.TCPSite(self._runner, self.host, self.port, backlog=4096).start())
+        self._started.set()
+        self._loop.run_forever()
+
+    def reset_stats(self) -> MockStats:
+        self.stats.reset()  # 中间件持有同一个stats对象
+        return self.stats
+
+    def stop(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟的ArchDaily/gooood服务器")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--burst-every', type=float, default=0)
+    parser.add_argument('--burst-duration', type=float, default=0)
+    parser.add_argument('--record-dir', default=None, help="录制的项目文件夹，例如./results/archdaily/projects")
+    args = parser.parse_args()
+    config = MockConfig(latency_ms=args.latency_ms, error_rate=args.error_rate, burst_every=args.burst_every,
+                        burst_duration=args.burst_duration, record_dir=args.record_dir)
+    app = create_app(config, MockStats())
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
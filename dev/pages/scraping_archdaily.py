@@ -18,6 +18,15 @@ def main():
     with tab3:
         _step3_download_images()
 
+    with st.expander("项目状态索引", icon="🗂️"):
+        st.caption("各步骤的扫描直接查询项目状态索引，不再遍历项目文件夹；在流水线之外增删或修改了项目文件后需要重建索引")
+        result = b.template_start_work_with_progress("重建项目状态索引", "Manifest-rebuild",
+                                                     b.archdaily__rebuild_project_manifest,
+                                                     st_show_detail_number=True, st_button_type='secondary',
+                                                     st_button_icon="🗂️")
+        if 'final_msg' in result:
+            st.info(result['final_msg'])
+
     st.divider()
     st.caption("数据来源: www.archdaily.com")
 
@@ -26,10 +35,12 @@ def _step1_download_html():
     st.subheader("步骤1： 下载项目html页面到本地")
 
     st.info(" 首先需要扫描本地文件，确定需要爬取的范围")
-    _plan = st.radio("选择扫描方案", ["**方案1**", "**方案2**"], captions=["从现有文件夹扫描", "手动指定项目id范围"], horizontal=True)
+    _plan = st.radio("选择扫描方案", ["**方案1**", "**方案2**", "**方案3**", "**方案4**"],
+                     captions=["从现有文件夹扫描", "手动指定项目id范围", "刷新已有的html", "从搜索API增量发现"],
+                     horizontal=True)
 
     def _plan1_region():
-        st.caption("此方案将扫描现有项目文件夹中是否存在content.html， 如果没有则补充")
+        st.caption("此方案将从项目状态索引中查询没有content.html的项目（首次使用时遍历一次项目文件夹建立索引）， 并补充下载")
         b.template_start_work_with_progress("扫描需要下载的项目id", "Step1-scan1",
                                             b.archdaily__scan_projects_with_no_content_html,
                                             st_button_type='secondary', st_button_icon="🔍")
@@ -45,20 +56,87 @@ def _step1_download_html():
         b.template_start_work_with_progress("扫描需要下载的项目id", "Step1-scan2",
                                             b.archdaily__scan_valid_project_id_in_range, start_id, end_id,
                                             st_button_type='secondary', st_button_icon="🔍")
+        st.caption("扫描后可以先用HEAD请求探测，只保留有效的项目id，无效的id会被记录，大幅减少需要下载的页面")
+        result = b.template_start_work_with_progress("探测有效的项目id", "Step1-probe",
+                                                     b.archdaily__probe_project_ids,
+                                                     st_show_detail_number=True, st_show_rate_controllers=True,
+                                                     st_button_type='secondary', st_button_icon="📡",
+                                                     ctx_enable_ctx_scope_check=True)
+        if 'final_msg' in result:
+            st.info(result['final_msg'])
+
+
+    def _plan3_region():
+        st.caption("此方案将对已有的content.html发送条件请求(ETag/Last-Modified)，未修改的页面不会重新下载")
+        b.template_start_work_with_progress("扫描已有html的项目id", "Step1-scan3",
+                                            b.archdaily__scan_projects_with_content_html,
+                                            st_button_type='secondary', st_button_icon="🔍")
 
+    def _plan4_region():
+        st.caption("此方案将从最新的项目开始翻阅搜索API，遇到完全已知的一页时停止，新项目会直接写入projects文件夹")
+        max_pages = st.number_input("最多翻阅页数", value=500, min_value=1, step=1)
+        result = b.template_start_work_with_progress("发现新项目", "Step1-discover",
+                                                     b.archdaily__discover_new_projects, max_pages,
+                                                     st_show_detail_number=True, st_button_type='secondary',
+                                                     st_button_icon="🔍", ctx_enable_ctx_scope_check=True)
+        if 'final_msg' in result:
+            st.info(result['final_msg'])
 
     if _plan == "**方案1**":
         _plan1_region()
     elif _plan == "**方案2**":
         _plan2_region()
+    elif _plan == "**方案3**":
+        _plan3_region()
+    elif _plan == "**方案4**":
+        _plan4_region()
+    result = b.template_start_work_with_progress("从抓取日志恢复未完成的项目", "Step1-resume",
+                                                 b.common__resume_from_journal, 'archdaily_html',
+                                                 st_button_type='secondary', st_button_icon="♻️")
+    if 'final_msg' in result:
+        st.info(result['final_msg'])
 
     st.divider()
 
     b.template_project_id_queue_info_box("需要下载的html项目", "Step1-html")
-    b.template_start_work_with_progress("下载项目html页面到本地", "Step1-html",
-                                        b.archdaily__download_projects_html_to_local,
-                                        st_show_detail_number=True, st_show_detail_project_id=True, st_button_icon="📂",
-                                        ctx_enable_ctx_scope_check=True)
+    result = b.template_start_work_with_progress("下载项目html页面到本地", "Step1-html",
+                                                 b.archdaily__download_projects_html_to_local, _plan == "**方案3**",
+                                                 st_show_detail_number=True, st_show_detail_project_id=True,
+                                                 st_show_rate_controllers=True, st_button_icon="📂",
+                                                 ctx_enable_ctx_scope_check=True)
+    if 'final_msg' in result:
+        st.info(result['final_msg'])
+    st.caption("也可以在下载的同时直接解析，一次生成content.html和content.json，无需再进行步骤2的扫描")
+    result = b.template_start_work_with_progress("下载并解析", "Step1-fused",
+                                                 b.archdaily__download_and_parse_htmls,
+                                                 st_show_detail_number=True, st_show_detail_project_id=True,
+                                                 st_show_rate_controllers=True, st_button_type='secondary',
+                                                 st_button_icon="⚡", ctx_enable_ctx_scope_check=True)
+    if 'final_msg' in result:
+        st.info(result['final_msg'])
+
+    with st.expander("html存储格式", icon="🗜️"):
+        st.caption(f"当前新下载的html存储格式: {b.user_settings.archdaily_html_compression}"
+                   f"（user_settings.archdaily_html_compression）")
+        st.caption("压缩后保存为content.html.gz/.zst，可显著减少磁盘占用；流水线中的步骤会自动识别存储格式，"
+                   "但直接打开content.html的外部脚本将无法读取压缩后的文件")
+        compression = st.selectbox("目标存储格式", ["gzip", "zstd", "none"])
+        result = b.template_start_work_with_progress("转换已有html的存储格式", "Step1-compress",
+                                                     b.archdaily__convert_html_storage, compression,
+                                                     st_show_detail_number=True, st_button_type='secondary',
+                                                     st_button_icon="🗜️")
+        if 'final_msg' in result:
+            st.info(result['final_msg'])
+
+    with st.expander("补充gallery.json", icon="🖼️"):
+        st.caption("解析阶段只读取下载时缓存的gallery.json，旧版本下载的项目需要先在这里补充")
+        result = b.template_start_work_with_progress("下载缺少的gallery.json", "Step1-gallery",
+                                                     b.archdaily__download_missing_gallery_json,
+                                                     st_show_detail_number=True, st_show_rate_controllers=True,
+                                                     st_button_type='secondary', st_button_icon="🖼️",
+                                                     ctx_enable_ctx_scope_check=True)
+        if 'final_msg' in result:
+            st.info(result['final_msg'])
 
 
 def _step2_parse_html():
@@ -72,6 +150,11 @@ def _step2_parse_html():
         st.warning(f"{result['num_projects_with_no_content_html']}个项目没有content.html，请注意")
     if 'final_msg' in result:
         st.info(result['final_msg'])
+    result = b.template_start_work_with_progress("从抓取日志恢复未完成的项目", "Step2-resume",
+                                                 b.common__resume_from_journal, 'archdaily_parse',
+                                                 st_button_type='secondary', st_button_icon="♻️")
+    if 'final_msg' in result:
+        st.info(result['final_msg'])
     st.divider()
 
     b.template_flags("archdaily")
@@ -84,20 +167,49 @@ def _step2_parse_html():
 
 def _step3_download_images():
     st.subheader("步骤3： 下载图像")
+    # 嵌入向量及线稿处理会将图片缩小到512px，颜色分类缩小到256px，下载满足分辨率的最小尺寸即可
+    target_options = {"原图(large)": 0, "嵌入向量/线稿(512px)": 512, "颜色分类(256px)": 256}
+    target_label = st.selectbox("图片用途", list(target_options.keys()))
+    target_resolution = target_options[target_label]
+    if target_resolution > 0:
+        st.caption(f"将为每张图片下载不小于{target_resolution}px的最小尺寸，没有合适尺寸时下载large")
     st.info(" 首先需要扫描本地文件")
     result = b.template_start_work_with_progress("开始扫描", "Step3-scan",
                                                  b.archdaily__scan_projects_folder_for_downloading_images,
+                                                 target_resolution,
                                                  st_button_type='secondary', st_button_icon="🔍")
     if 'final_msg' in result:
         st.info(result['final_msg'])
+    result = b.template_start_work_with_progress("检查并修复不完整的图片", "Step3-repair",
+                                                 b.archdaily__scan_projects_folder_for_repairing_images,
+                                                 st_button_type='secondary', st_button_icon="🩹")
+    if 'final_msg' in result:
+        st.info(result['final_msg'])
+    result = b.template_start_work_with_progress("从抓取日志恢复未完成的项目", "Step3-resume",
+                                                 b.common__resume_from_journal, 'archdaily_gallery',
+                                                 st_button_type='secondary', st_button_icon="♻️")
+    if 'final_msg' in result:
+        st.info(result['final_msg'])
 
     st.divider()
 
     b.template_project_id_queue_info_box("需要下载图片的项目", "Step3-download")
     b.template_start_work_with_progress("开始下载Image Gallery", "Step3-download",
-                                        b.archdaily__download_gallery_images,
+                                        b.archdaily__download_gallery_images, target_resolution,
                                         st_show_detail_number=True, st_show_detail_project_id=True,
+                                        st_show_rate_controllers=True,
                                         ctx_enable_ctx_scope_check=True)
 
+    with st.expander("打包为shard", icon="📦"):
+        st.caption(f"当前新下载图片的保存方式: {b.user_settings.image_storage_format}；"
+                   f"打包后的图片按顺序保存在tar格式的shard中，减少小文件数量，遍历全部图片时为顺序读取")
+        remove_source = st.checkbox("打包后删除原图片文件", value=False, key="Step3-shard-remove")
+        result = b.template_start_work_with_progress("将已下载的图片打包为shard", "Step3-shard",
+                                                     b.archdaily__convert_gallery_images_to_shards, remove_source,
+                                                     st_show_detail_number=True, st_button_type='secondary',
+                                                     st_button_icon="📦")
+        if 'final_msg' in result:
+            st.info(result['final_msg'])
+
 
 main()
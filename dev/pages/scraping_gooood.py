@@ -16,6 +16,15 @@ def main():
     with tab4:
         _step4()
 
+    with st.expander("项目状态索引", icon="🗂️"):
+        st.caption("各步骤的扫描直接查询项目状态索引，不再遍历项目文件夹；在流水线之外增删或修改了项目文件后需要重建索引")
+        result = b.template_start_work_with_progress("重建项目状态索引", "GDManifest-rebuild",
+                                                     b.gooood__rebuild_project_manifest,
+                                                     st_show_detail_number=True, st_button_type='secondary',
+                                                     st_button_icon="🗂️")
+        if 'final_msg' in result:
+            st.info(result['final_msg'])
+
     st.divider()
     st.caption("数据来源: www.gooood.cn")
 
@@ -38,6 +47,7 @@ def _step1():
     b.template_start_work_with_progress("下载项目html页面到本地", "GDStep1-page",
                                         b.gooood__scrap_pages, get_all, start_page, end_page, skip_exist,
                                         st_show_detail_number=True, st_show_detail_project_id=True,
+                                        st_show_rate_controllers=True,
                                         ctx_enable_ctx_scope_check=False)
 
 
@@ -57,6 +67,14 @@ def _step3():
                                         b.gooood__parse_projects, b.g.flag_states['gooood'], skip_exist,
                                         st_show_detail_number=True, st_show_detail_project_id=True, st_button_icon="✨",
                                         ctx_enable_ctx_scope_check=False)
+    st.caption("也可以跳过步骤2，直接从pages文件中解析，只生成content.json")
+    result = b.template_start_work_with_progress("从pages文件直接解析", "GDStep3-stream",
+                                                 b.gooood__parse_projects_from_pages, b.g.flag_states['gooood'],
+                                                 skip_exist,
+                                                 st_show_detail_number=True, st_button_type='secondary',
+                                                 st_button_icon="⚡", ctx_enable_ctx_scope_check=False)
+    if 'final_msg' in result:
+        st.info(result['final_msg'])
 
 
 def _step4():
@@ -67,14 +85,36 @@ def _step4():
                                                  st_button_type='secondary', st_button_icon="🔍")
     if 'final_msg' in result:
         st.info(result['final_msg'])
+    result = b.template_start_work_with_progress("检查并修复不完整的图片", "GDStep4-repair",
+                                                 b.gooood__scan_projects_folder_for_repairing_images,
+                                                 st_button_type='secondary', st_button_icon="🩹")
+    if 'final_msg' in result:
+        st.info(result['final_msg'])
+    result = b.template_start_work_with_progress("从抓取日志恢复未完成的项目", "GDStep4-resume",
+                                                 b.common__resume_from_journal, 'gooood_gallery',
+                                                 st_button_type='secondary', st_button_icon="♻️")
+    if 'final_msg' in result:
+        st.info(result['final_msg'])
 
     st.divider()
 
     b.template_project_id_queue_info_box("需要下载图片的项目", "GDStep4-download")
     b.template_start_work_with_progress("开始下载Image Gallery", "GDStep4-download",
                                         b.gooood__download_gallery_images,
-                                        st_show_detail_number=True, st_show_detail_project_id=True, st_button_icon="✨",
+                                        st_show_detail_number=True, st_show_detail_project_id=True,
+                                        st_show_rate_controllers=True, st_button_icon="✨",
                                         ctx_enable_ctx_scope_check=True)
 
+    with st.expander("打包为shard", icon="📦"):
+        st.caption(f"当前新下载图片的保存方式: {b.user_settings.image_storage_format}；"
+                   f"打包后的图片按顺序保存在tar格式的shard中，减少小文件数量，遍历全部图片时为顺序读取")
+        remove_source = st.checkbox("打包后删除原图片文件", value=False, key="GDStep4-shard-remove")
+        result = b.template_start_work_with_progress("将已下载的图片打包为shard", "GDStep4-shard",
+                                                     b.gooood__convert_gallery_images_to_shards, remove_source,
+                                                     st_show_detail_number=True, st_button_type='secondary',
+                                                     st_button_icon="📦")
+        if 'final_msg' in result:
+            st.info(result['final_msg'])
+
 
 main()
@@ -1,9 +1,10 @@
 import os
 import json
 import time
-import requests
 from bs4 import BeautifulSoup
 
+from utils.http_utils import get_session
+
 # ArchDaily 搜索结果 URL
 ARCHDAILY_SEARCH_URL = "https://www.archdaily.com/search/projects?adkq=building&page="
 
@@ -26,7 +27,7 @@ def get_project_links(page=1):
     url = ARCHDAILY_SEARCH_URL + str(page)
     print(f"🔍 爬取搜索页: {url}")
 
-    response = requests.get(url, headers=HEADERS)
+    response = get_session(url).get(url, headers=HEADERS)
     if response.status_code != 200:
         print("❌ 无法访问 ArchDaily，状态码:", response.status_code)
         return []
@@ -49,7 +50,7 @@ def scrape_project_details(project_url):
     """ 获取项目详情，包括标题、介绍和图片 """
     print(f"📡 爬取项目页面: {project_url}")
 
-    response = requests.get(project_url, headers=HEADERS)
+    response = get_session(project_url).get(project_url, headers=HEADERS)
     if response.status_code != 200:
         print(f"❌ 请求失败: {project_url}，状态码: {response.status_code}")
         return None
@@ -88,7 +89,7 @@ def download_image(img_url, title):
     print(f"🌍 下载图片: {img_url}")
 
     try:
-        response = requests.get(img_url, headers=HEADERS, stream=True)
+        response = get_session(img_url).get(img_url, headers=HEADERS, stream=True)
         if response.status_code == 200:
             filename = f"{IMG_FOLDER}/{title.replace(' ', '_')}.jpg"
             with open(filename, "wb") as file:
@@ -1,13 +1,13 @@
 # step1: 爬取ArchDaily大约500个页面上的json数据，保存至results/pages文件夹中
-import json
 import os
 import random
 import time
 
-import requests
 import logging
 from datetime import datetime
 from config import *
+from utils.http_utils import get_session
+from utils.json_utils import dump_json
 # 配置日志
 log_dir = f'./log/step1'
 os.makedirs(log_dir, exist_ok=True)
@@ -52,13 +52,12 @@ pages = [page for page in pages if page not in existing_pages]
 # 爬取每个页码的数据并保存为JSON文件
 for page in pages:
     url = f'{base_url}?page={page}'
-    response = requests.get(url, headers=user_settings.headers, timeout=20)
+    response = get_session(url).get(url, timeout=20)
     if response.status_code == 200:
         data = response.json()
         file_name = f'page_{str(page).zfill(5)}.json'
         file_path = os.path.join(results_dir, file_name)
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+        dump_json(data, file_path)
         logging.info(f'Saved {file_name}')
     else:
         logging.error(f'Failed to fetch page {page}, url={url}, code={response.status_code}')
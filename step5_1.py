@@ -5,6 +5,7 @@ from tqdm import tqdm
 
 from config import *
 from utils.html_utils import request_project_html_archdaily, flush_success_queue
+from utils.io_utils import html_exists
 from utils.logging_utils import init_logger
 
 init_logger('step5_1')
@@ -22,8 +23,7 @@ def main():
     for project_id in tqdm(all_projects):
         folder_path = os.path.join(user_settings.archdaily_projects_dir, project_id)
         if os.path.isdir(folder_path):
-            html_file_path = os.path.join(folder_path, f'content.html')  # 扫描是否有content.html
-            if not os.path.exists(html_file_path):
+            if not html_exists(folder_path):  # 扫描是否有content.html（任意存储格式）
                 project_id_queue.append(project_id)
 
     logging.info(f"共计{len(all_projects)}个项目，其中{len(project_id_queue)}个项目没有content.html文件，需要爬取")
@@ -5,6 +5,7 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 from config import *
 from utils.html_utils import parse_project_content_archdaily, flush_success_queue, ArchdailyFlags
+from utils.io_utils import html_exists
 from utils.logging_utils import init_logger
 
 init_logger('step5_3')
@@ -16,8 +17,7 @@ def main():
     project_id_queue = []
     all_projects = os.listdir(user_settings.archdaily_projects_dir)
     for project_id in all_projects:
-        html_file_path = os.path.join(user_settings.archdaily_projects_dir, project_id, 'content.html')
-        if os.path.exists(html_file_path):
+        if html_exists(os.path.join(user_settings.archdaily_projects_dir, project_id)):
             project_id_queue.append(project_id)
     if len(all_projects) - len(project_id_queue) > 0:
         logging.warning(f"{len(all_projects) - len(project_id_queue)}个项目没有content.html文件，请运行前置代码补充")
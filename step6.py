@@ -1,5 +1,4 @@
 # 根据content.json文件中的信息，爬取ImageGallery相关图片并保存，支持并发下载
-import json
 import logging
 import os
 import random
@@ -7,9 +6,12 @@ import time
 from concurrent.futures import ThreadPoolExecutor, as_completed, Future
 from datetime import datetime
 
-import requests
 from tqdm import tqdm
 
+from utils.html_utils import download_image_file
+from utils.json_utils import load_json
+from utils.manifest_utils import count_downloaded_images, get_project_manifest
+
 # 配置日志
 log_dir = f'./log/step6'
 os.makedirs(log_dir, exist_ok=True)
@@ -57,9 +59,8 @@ for folder_name in tqdm(all_projects):
     if not os.path.exists(image_gallery_folder):
         json_path_queue.append(json_file_path)  # image_gallery_folder does not exist, add to json_path_queue
         continue
-    image_gallery_names = os.listdir(image_gallery_folder)
-    with open(json_file_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    image_gallery_names = [name for name in os.listdir(image_gallery_folder) if name.endswith('.jpg')]
+    data = load_json(json_file_path)
     image_gallery_images = data.get('image_gallery', [])
     if len(image_gallery_names) < len(image_gallery_images):
         json_path_queue.append(json_file_path)
@@ -70,8 +71,7 @@ logging.info("开始下载图像...")
 
 
 def download_image(json_file_path, i):
-    with open(json_file_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    data = load_json(json_file_path)
     folder_path = os.path.dirname(json_file_path)
     project_id = os.path.basename(folder_path)
 
@@ -84,20 +84,21 @@ def download_image(json_file_path, i):
             if not img_url:
                 logging.warning(f'[{i}/{len(json_path_queue)}] No url_{image_size_type} found for project {project_id}')
 
-            response = requests.get(img_url)
-            if response.status_code == 200:
-                with open(img_path, 'wb') as img_file:
-                    img_file.write(response.content)
+            # 流式写入.part临时文件，校验完整后再原子替换，中断时不会留下被截断的图片
+            status_code = download_image_file(img_url, img_path)
+            if status_code == 200:
                 logging.info(
                     f'[{i}/{len(json_path_queue)}][{img_index}/{len(image_gallery_images)}] success for project {project_id}')
             else:
                 logging.warning(f'[{i}/{len(json_path_queue)}][{img_index}/{len(image_gallery_images)}] Failed to '
-                                f'download image for project {project_id}, code {response.status_code}')
+                                f'download image for project {project_id}, code {status_code}')
 
         except Exception as e:
             logging.error(
                 f'[{i}/{len(json_path_queue)}][{img_index}/{len(image_gallery_images)}] project {project_id} error: {str(e)}')
         time.sleep(random.random() * 0.2)
+    # 更新项目状态索引中的已下载图片数量，step7根据索引筛选项目
+    get_project_manifest().update('archdaily', project_id, downloaded_count=count_downloaded_images(folder_path))
 
 
 # 使用ThreadPoolExecutor进行并发下载
@@ -106,3 +107,4 @@ with ThreadPoolExecutor(max_workers=32) as executor:
                              enumerate(json_path_queue)]
     for future in as_completed(futures):
         future.result()
+get_project_manifest().flush()
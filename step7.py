@@ -1,5 +1,4 @@
 # step7：建立初步的database表格
-import json
 import logging
 import os
 from datetime import datetime
@@ -8,6 +7,10 @@ import config
 from config import *
 import pandas as pd
 
+from utils.json_utils import load_json
+from utils.manifest_utils import get_project_manifest
+from utils.shard_utils import gallery_image_exists, list_shard_images
+
 # 配置日志
 log_dir = f'./log/step7'
 os.makedirs(log_dir, exist_ok=True)
@@ -57,18 +60,23 @@ def main(incremental=True):
     # 记录初始项目数量
     initial_count = len(image_database)
     logging.info(f"existing images count: {initial_count}")
-    # 遍历每个项目文件夹
-    for project_folder in os.listdir(projects_dir):
+    # 遍历每个项目文件夹，项目状态索引已建立时只读取已下载图片的项目（索引中的图片数量按large统计）
+    manifest = get_project_manifest()
+    if image_size_type == 'large' and manifest.is_built('archdaily'):
+        project_folders = manifest.query('archdaily', 'has_json = 1 AND downloaded_count > 0')
+    else:
+        project_folders = os.listdir(projects_dir)
+    for project_folder in project_folders:
         project_path = os.path.join(projects_dir, project_folder)
         content_json_path = os.path.join(project_path, 'content.json')
         image_gallery_path = os.path.join(project_path, 'image_gallery', image_size_type)
-        if not os.path.isfile(content_json_path) or not os.path.isdir(image_gallery_path):
+        if not os.path.isfile(content_json_path) or \
+                not (os.path.isdir(image_gallery_path) or image_size_type in list_shard_images(project_path)):
             continue
 
         # 读取content.json文件
-        with open(content_json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            image_gallery_images = data.get('image_gallery', [])
+        data = load_json(content_json_path)
+        image_gallery_images = data.get('image_gallery', [])
         image_missing_count = 0
         # 遍历image_gallery/<image_size_type>下的所有图片文件
         for img_index, image_gallery_image in enumerate(image_gallery_images):
@@ -77,7 +85,7 @@ def main(incremental=True):
                 continue
             img_filename = f"{img_index:05d}.jpg"
             image_path = os.path.join(image_gallery_path, img_filename)
-            if not os.path.isfile(image_path):
+            if not gallery_image_exists(image_path):  # 图片文件或shard中的图片
                 image_missing_count += 1
                 continue
             # 检查路径是否已经存在
@@ -7,10 +7,10 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
 import pandas as pd
-from PIL import Image
 from tqdm import tqdm
 
 import apis.cn_clip_api
+from utils.shard_utils import open_gallery_image, shard_position_key
 
 # 配置日志
 log_dir = f'./log/step8'
@@ -58,6 +58,9 @@ df = pd.read_pickle(pkl_path)
 
 # 筛选出需要处理的行
 rows_to_process = df[df['features'].apply(lambda x: isinstance(x, str))]
+# 按图片在shard中的位置处理，打包为shard的图片为顺序读取
+image_paths = rows_to_process['image_path'].tolist()
+rows_to_process = rows_to_process.iloc[sorted(range(len(image_paths)), key=lambda i: shard_position_key(image_paths[i]))]
 logging.info(f"{len(rows_to_process)} rows need to be processed. total = {len(df)}")
 time.sleep(1)
 
@@ -65,7 +68,7 @@ time.sleep(1)
 def process_row(index, row, df):
     image_path = row['image_path']
     try:
-        image = Image.open(image_path)
+        image = open_gallery_image(image_path)
         feature_vector = get_features_func(image)
         df.at[index, 'features'] = feature_vector
     except Exception as e:
@@ -2,6 +2,7 @@ from pymongo import MongoClient
 from tqdm import tqdm
 
 from config import *
+from utils.json_utils import load_json
 from utils.logging_utils import init_logger
 
 init_logger("step9")
@@ -34,8 +35,7 @@ for project_id in tqdm(all_projects):
         logging.warning(f"project: {project_id} content.json文件不存在")
         continue
 
-    with open(content_json_path, 'r', encoding='utf-8') as f:
-        content_data = json.load(f)
+    content_data = load_json(content_json_path)
 
     # 插入或更新content数据
     content_doc = {'_id': project_id}
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+# @Author  : Yiheng Feng
+# @Time    : 10/19/2026 10:40 AM
+# @Function: 内容寻址的图片存储，按url哈希和内容哈希去重，项目文件夹中的图片为指向blob的硬链接
+import errno
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from typing import Optional
+
+from config import user_settings
+from utils.json_utils import dump_json, load_json
+
+BLOB_INDEX_FILE_NAME = 'blob_index.json'  # 位于<project>/image_gallery/，记录每张图片的url和sha256
+
+
+class ImageBlobStore:
+    """
+    文件布局：
+        <root>/objects/<sha256前两位>/<sha256>.jpg   图片内容
+        <root>/urls/<url哈希前两位>/<url哈希>         该url对应的sha256
+    同一url（或不同url但内容相同）的图片只保存一份，项目中的图片通过硬链接指向blob
+    硬链接与blob共享同一个inode，原地修改项目中的图片会同时修改所有引用该blob的项目，需要修改时先写入新文件再os.replace
+    root与项目文件夹不在同一文件系统（无法创建硬链接）时，新图片只保存在项目文件夹中，不写入blob，避免每张图片保存两份
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.urls_dir = os.path.join(root, 'urls')
+        self._lock = threading.Lock()
+        self._hardlink_supported = True  # 首次遇到跨设备链接失败后置为False
+
+    @staticmethod
+    def hash_url(url: str) -> str:
+        return hashlib.sha1(url.strip().encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def hash_file(file_path: str) -> str:
+        sha256 = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def _blob_path(self, sha256: str) -> str:
+        return os.path.join(self.objects_dir, sha256[:2], f'{sha256}.jpg')
+
+    def _url_path(self, url: str) -> str:
+        url_hash = self.hash_url(url)
+        return os.path.join(self.urls_dir, url_hash[:2], url_hash)
+
+    def lookup_url(self, url: str) -> Optional[str]:
+        """返回url对应的sha256，未下载过或blob已丢失时返回None"""
+        url_path = self._url_path(url)
+        if not os.path.isfile(url_path):
+            return None
+        with open(url_path, 'r', encoding='utf-8') as f:
+            sha256 = f.read().strip()
+        return sha256 if os.path.isfile(self._blob_path(sha256)) else None
+
+    def link(self, sha256: str, dest_path: str):
+        """在dest_path创建指向blob的硬链接"""
+        blob_path = self._blob_path(sha256)
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        tmp_path = dest_path + '.link'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        try:
+            os.link(blob_path, tmp_path)
+        except OSError:
+            shutil.copyfile(blob_path, tmp_path)  # 复制已有的blob代替重新下载
+        os.replace(tmp_path, dest_path)
+
+    def add_file(self, file_path: str, url: Optional[str] = None) -> str:
+        """
+        将已下载的完整图片加入存储，内容已存在时将file_path替换为指向已有blob的硬链接
+        :return: 图片的sha256
+        """
+        sha256 = self.hash_file(file_path)
+        blob_path = self._blob_path(sha256)
+        with self._lock:
+            if os.path.isfile(blob_path):
+                if self._hardlink_supported and not os.path.samefile(blob_path, file_path):
+                    self.link(sha256, file_path)  # 内容重复，释放file_path占用的空间
+            elif self._hardlink_supported:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                try:
+                    os.link(file_path, blob_path)
+                except OSError as e:
+                    # 不复制到blob，图片只保留项目文件夹中的一份
+                    if e.errno == errno.EXDEV:
+                        self._hardlink_supported = False
+                        logging.warning(f"{self.root}与项目文件夹不在同一文件系统，无法创建硬链接，"
+                                        f"之后的图片只保存在项目文件夹中")
+                    else:
+                        logging.warning(f"{file_path} 无法链接到blob, error: {str(e)}")
+        if url:
+            url_path = self._url_path(url)
+            os.makedirs(os.path.dirname(url_path), exist_ok=True)
+            tmp_path = f'{url_path}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(sha256)
+            os.replace(tmp_path, url_path)
+        return sha256
+
+
+def load_blob_index(project_dir: str) -> dict:
+    """读取项目的blob_index.json，{'large/00000.jpg': {'url': ..., 'sha256': ...}}"""
+    index_path = os.path.join(project_dir, 'image_gallery', BLOB_INDEX_FILE_NAME)
+    if not os.path.isfile(index_path):
+        return {}
+    try:
+        return load_json(index_path)
+    except Exception as e:
+        logging.warning(f"{index_path} 读取失败, error: {str(e)}")
+        return {}
+
+
+def save_blob_index(project_dir: str, index: dict):
+    index_path = os.path.join(project_dir, 'image_gallery', BLOB_INDEX_FILE_NAME)
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    dump_json(index, index_path, atomic=True)
+
+
+_blob_store: Optional[ImageBlobStore] = None
+
+
+def get_blob_store() -> Optional[ImageBlobStore]:
+    """user_settings.image_blob_store_enabled为False时返回None，图片直接保存在项目文件夹中"""
+    global _blob_store
+    if not user_settings.image_blob_store_enabled:
+        return None
+    if _blob_store is None or _blob_store.root != user_settings.image_blob_dir:
+        _blob_store = ImageBlobStore(user_settings.image_blob_dir)
+    return _blob_store
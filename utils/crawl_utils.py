@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+# @Author  : Yiheng Feng
+# @Time    : 10/17/2026 10:12 AM
+# @Function: 基于asyncio的并发抓取引擎，少量OS线程即可维持大量在途请求
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Iterable, Optional, Tuple
+
+import aiohttp
+
+from utils.http_utils import get_default_headers
+
+
+def get_async_headers() -> dict:
+    """由user_settings.headers生成aiohttp使用的默认请求头"""
+    headers = get_default_headers()
+    headers['Accept-Encoding'] = 'gzip, deflate'  # aiohttp默认无法解码br/zstd
+    return headers
+
+
+async def _crawl(items: Iterable[Any],
+                 fetch: Callable[[aiohttp.ClientSession, Any, int], Awaitable[Any]],
+                 max_concurrency: int,
+                 timeout: float,
+                 should_stop: Optional[Callable[[], bool]],
+                 on_result: Optional[Callable[[Any, int, Any], None]]):
+    connector = aiohttp.TCPConnector(limit=max_concurrency, limit_per_host=max_concurrency, ttl_dns_cache=300)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    item_iter = iter(enumerate(items))  # 所有worker共享同一个迭代器，避免一次性创建海量task
+
+    async def _worker(session: aiohttp.ClientSession):
+        for i, item in item_iter:
+            if should_stop is not None and should_stop():
+                return
+            try:
+                result = await fetch(session, item, i)
+            except Exception as e:
+                logging.error(f"[{i + 1}] {item} 抓取引擎出现意外错误, error: {str(e)}")
+                result = False
+            if on_result is not None:
+                on_result(item, i, result)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout,
+                                     headers=get_async_headers()) as session:
+        await asyncio.gather(*[_worker(session) for _ in range(max_concurrency)])
+
+
+def run_async_crawl(items: Iterable[Any],
+                    fetch: Callable[[aiohttp.ClientSession, Any, int], Awaitable[Any]],
+                    max_concurrency: int = 512,
+                    timeout: float = 60,
+                    should_stop: Optional[Callable[[], bool]] = None,
+                    on_result: Optional[Callable[[Any, int, Any], None]] = None) -> None:
+    """
+    在当前线程中启动事件循环，并发执行fetch(session, item, i)，阻塞直到全部完成
+    :param items: 需要抓取的对象，例如project_id列表
+    :param fetch: 协程函数，返回值会原样交给on_result
+    :param max_concurrency: 最大在途请求数
+    :param timeout: 单个请求的超时时间（秒）
+    :param should_stop: 返回True时不再领取新的任务
+    :param on_result: 每个任务完成后的回调，在事件循环线程中调用
+    """
+    asyncio.run(_crawl(items, fetch, max(1, max_concurrency), timeout, should_stop, on_result))
+
+
+async def _paginate(fetch_page: Callable[[aiohttp.ClientSession, int], Awaitable[Tuple[Any, Optional[int]]]],
+                    on_page: Callable[[int, Any], bool],
+                    start_page: int,
+                    window: int,
+                    max_page: Optional[int],
+                    timeout: float,
+                    should_stop: Optional[Callable[[], bool]]) -> int:
+    connector = aiohttp.TCPConnector(limit=window, ttl_dns_cache=300)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    last_page = max_page  # 数据的最后一页（包含），未知时为None
+    next_page = start_page  # 下一个需要发出请求的页码
+    deliver_page = start_page  # 下一个需要按顺序交给on_page的页码
+    tasks: dict[int, asyncio.Task] = {}
+    finished: dict[int, Tuple[Any, Optional[int]]] = {}
+
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout,
+                                     headers=get_async_headers()) as session:
+        try:
+            while True:
+                stopped = should_stop is not None and should_stop()
+                while not stopped and len(tasks) + len(finished) < window and \
+                        (last_page is None or next_page <= last_page):
+                    tasks[next_page] = asyncio.create_task(fetch_page(session, next_page))
+                    next_page += 1
+                if stopped or (deliver_page not in tasks and deliver_page not in finished):
+                    break
+                if deliver_page not in finished:
+                    done, _ = await asyncio.wait(tasks.values(), return_when=asyncio.FIRST_COMPLETED)
+                    for page in [page for page, task in tasks.items() if task in done]:
+                        finished[page] = tasks.pop(page).result()  # fetch_page的异常直接终止翻页
+                    continue
+                # 按页码顺序交付结果，保证on_page看到的是连续的页
+                result, total_pages = finished.pop(deliver_page)
+                if total_pages is not None:
+                    last_page = total_pages if last_page is None else min(last_page, total_pages)
+                if not result:
+                    break  # 空页，数据已结束
+                deliver_page += 1
+                if on_page(deliver_page - 1, result):
+                    break
+        finally:
+            # 取消已经超出数据末尾或不再需要的请求
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+    return deliver_page - start_page
+
+
+def run_windowed_pager(fetch_page: Callable[[aiohttp.ClientSession, int], Awaitable[Tuple[Any, Optional[int]]]],
+                       on_page: Callable[[int, Any], bool],
+                       start_page: int = 1,
+                       window: int = 8,
+                       max_page: Optional[int] = None,
+                       timeout: float = 60,
+                       should_stop: Optional[Callable[[], bool]] = None) -> int:
+    """
+    窗口式并发翻页：同时保持window个页面在途，按页码顺序将结果交给on_page
+    遇到空页、超过总页数或on_page返回True时停止，并取消剩余的在途请求
+    :param fetch_page: 协程函数fetch_page(session, page)，返回(页面数据, 总页数)，总页数未知时为None，页面数据为空代表数据结束
+    :param on_page: on_page(page, 页面数据)，返回True时停止翻页
+    :param start_page: 起始页码
+    :param window: 同时在途的页面数量
+    :param max_page: 最大页码（包含）
+    :param timeout: 单个请求的超时时间（秒）
+    :param should_stop: 返回True时停止翻页
+    :return: 交给on_page的页面数量
+    """
+    return asyncio.run(_paginate(fetch_page, on_page, start_page, max(1, window), max_page, timeout, should_stop))
@@ -1,17 +1,29 @@
+import asyncio
+import hashlib
 import logging
 import random
+import re
 import time
 import traceback
 from datetime import datetime
-from typing import Optional
+from typing import Callable, Optional
+from urllib.parse import urljoin, urlparse
 
-import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, FeatureNotFound, SoupStrainer
 
 from config import *
+from utils.blob_utils import get_blob_store, load_blob_index, save_blob_index
+from utils.http_utils import get_session
+from utils.json_utils import dump_json, load_json, loads
+from utils.io_utils import find_html_path, get_min_variant, html_exists, is_image_bytes_complete, \
+    list_gallery_image_paths, read_html, write_html, write_stream_atomic
+from utils.manifest_utils import get_project_manifest
+from utils.rate_utils import AimdController, acquire_async, controlled_get, get_controller
+from utils.shard_utils import gallery_image_exists, get_shard_store, split_gallery_image_path
 
 _success_queues: dict[str: list] = {'content_html': [], 'content_json': []}
 _flush_threshold = 64
+_project_errors: dict[str, str] = {}  # 返回False（错误）的项目最近一次的错误原因，供抓取日志记录
 
 from enum import IntFlag, auto
 
@@ -25,6 +37,17 @@ class ArchdailyFlags(IntFlag):
     FORCE_UPDATE_SPECS = auto()  # 0x00010000
 
 
+# 各extract_*_archdaily的版本，修改提取逻辑（例如选择器）后将对应的版本加1，重新解析时只会重新提取该字段
+ARCHDAILY_EXTRACTOR_VERSIONS = {
+    'main_content': 1,
+    'image_gallery': 1,
+    'title': 1,
+    'specs': 1,
+    'tags': 1,
+}
+PARSE_MANIFEST_FILE_NAME = 'parse_manifest.json'
+
+
 class GoooodFlags(IntFlag):
     NONE = 0
     FORCE_UPDATE_MAIN_CONTENT = auto()  # 0x00000001
@@ -34,6 +57,74 @@ class GoooodFlags(IntFlag):
     FORCE_UPDATE_SPECS = auto()  # 0x00010000
 
 
+HTML_PARSER_BACKENDS = ('html.parser', 'lxml')
+_unavailable_backends: set[str] = set()  # 未安装的解析器，只在当前进程中退回到html.parser，不修改（及保存）user_settings
+
+
+def is_parser_backend_available(backend: str) -> bool:
+    if backend in _unavailable_backends:
+        return False
+    try:
+        BeautifulSoup('', backend)
+        return True
+    except FeatureNotFound:
+        _unavailable_backends.add(backend)
+        return False
+
+
+def make_soup(html_content: str, backend: Optional[str] = None,
+              parse_only: Optional[SoupStrainer] = None) -> BeautifulSoup:
+    """
+    按user_settings.html_parser_backend构建soup，所有extract_*函数只依赖BeautifulSoup的接口，与tree builder无关
+    lxml未安装时退回到html.parser
+    :param parse_only: 只构建匹配的标签及其子孙节点
+    """
+    backend = backend or user_settings.html_parser_backend
+    if backend in _unavailable_backends:
+        backend = 'html.parser'
+    try:
+        return BeautifulSoup(html_content, backend, parse_only=parse_only)
+    except FeatureNotFound:
+        logging.warning(f"html解析器{backend}不可用，使用html.parser")
+        _unavailable_backends.add(backend)
+        return BeautifulSoup(html_content, 'html.parser', parse_only=parse_only)
+
+
+# extract_*_archdaily需要的顶层标签(name, class)，class为None表示不限制
+ARCHDAILY_FIELD_TAGS = {
+    'main_content': ('article', None),
+    'title': ('header', 'article-header'),
+    'tags': ('div', 'afd-tags__container'),
+    'specs': ('li', 'afd-specs__item'),
+}
+
+
+class ArchdailyFieldStrainer(SoupStrainer):
+    """
+    只保留fields对应的标签（及其全部子孙节点），页面中的导航、推荐、脚本等部分在解析时直接丢弃
+    一次解析即可收集所有需要的字段，extract_*只需遍历保留下来的小树
+    """
+
+    def __init__(self, fields):
+        self.targets = [ARCHDAILY_FIELD_TAGS[field] for field in fields]
+        super().__init__(name=sorted({name for name, _ in self.targets}))
+
+    def _match(self, name: str, attrs) -> bool:
+        classes = (attrs or {}).get('class') or []
+        if isinstance(classes, str):
+            classes = classes.split()
+        return any(name == target_name and (target_class is None or target_class in classes)
+                   for target_name, target_class in self.targets)
+
+    def allow_tag_creation(self, nsprefix, name, attrs) -> bool:  # bs4>=4.13
+        return self._match(name, attrs)
+
+    def search_tag(self, markup_name=None, markup_attrs=None):  # bs4<4.13
+        if not isinstance(markup_name, str):
+            return super().search_tag(markup_name, markup_attrs)
+        return markup_name if self._match(markup_name, markup_attrs) else None
+
+
 def _add_to_success_queue(queue_name: str, project_id: str):
     queue = _success_queues[queue_name]
     if _flush_threshold > 0:
@@ -50,8 +141,207 @@ def flush_success_queue(queue_name: str):
         queue.clear()
 
 
+def set_project_error(project_id: str, error: str):
+    _project_errors[str(project_id)] = error
+
+
+def pop_project_error(project_id: str) -> str:
+    """取出项目最近一次的错误原因，没有记录时返回通用的提示"""
+    return _project_errors.pop(str(project_id), "未知错误，详见日志")
+
+
+def _should_request_project_html(project_id: str, invalid_project_ids: set[str], force_update: bool) -> bool:
+    project_dir = os.path.join(user_settings.archdaily_projects_dir, project_id)
+    if not force_update and html_exists(project_dir):
+        return False
+    if project_id in invalid_project_ids:
+        return False
+    return True
+
+
+def _load_html_validators(project_id: str) -> dict:
+    """读取content.html旁的content.meta.json（ETag, Last-Modified等）"""
+    meta_file_path = os.path.join(user_settings.archdaily_projects_dir, project_id, "content.meta.json")
+    if not os.path.isfile(meta_file_path):
+        return {}
+    try:
+        return load_json(meta_file_path)
+    except Exception as e:
+        logging.warning(f"project: {project_id} content.meta.json读取失败, error: {str(e)}")
+        return {}
+
+
+def _save_html_validators(project_id: str, validators: dict):
+    meta_file_path = os.path.join(user_settings.archdaily_projects_dir, project_id, "content.meta.json")
+    os.makedirs(os.path.dirname(meta_file_path), exist_ok=True)
+    dump_json(validators, meta_file_path)
+
+
+def _make_html_validators(url: str, headers, content_length: int, sha256: Optional[str] = None) -> dict:
+    return {'url': url,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'content_length': content_length,
+            'sha256': sha256,
+            'fetched_at': datetime.now().isoformat(timespec='seconds')}
+
+
+def _get_html_sha256(html_content: str) -> str:
+    return hashlib.sha256(html_content.encode('utf-8')).hexdigest()
+
+
+def _is_html_unchanged(project_id: str, sha256: str) -> bool:
+    """与已保存的content.html比较内容哈希，旧版本的content.meta.json没有sha256时读取html计算"""
+    project_dir = os.path.join(user_settings.archdaily_projects_dir, project_id)
+    stored_sha256 = _load_html_validators(project_id).get('sha256')
+    if stored_sha256 is None:
+        html_content = read_html(project_dir)
+        if html_content is None:
+            return False
+        stored_sha256 = _get_html_sha256(html_content)
+    return stored_sha256 == sha256
+
+
+def _on_html_unchanged(project_id: str, validators: dict):
+    """服务器不支持条件请求时返回200但内容未变化，只更新validators，不重写content.html"""
+    _save_html_validators(project_id, validators)
+
+
+def _on_html_not_found(project_id: str, invalid_project_ids: set[str], i: int, total: int):
+    """已下载过html的项目返回404时可能只是临时下线，保留本地文件，不记录为无效id"""
+    if html_exists(os.path.join(user_settings.archdaily_projects_dir, project_id)):
+        logging.warning(f"[{i + 1}/{total}] project: {project_id} 已下载的项目返回404，保留本地html")
+        return
+    invalid_project_ids.add(project_id)
+
+
+def _get_conditional_headers(project_id: str, refresh: bool) -> dict:
+    """refresh模式下根据已保存的validators生成条件请求头"""
+    if not refresh:
+        return {}
+    if not html_exists(os.path.join(user_settings.archdaily_projects_dir, project_id)):
+        return {}
+    validators = _load_html_validators(project_id)
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    return headers
+
+
+def _on_html_not_modified(project_id: str):
+    """304时只更新fetched_at，不重写content.html"""
+    validators = _load_html_validators(project_id)
+    validators['fetched_at'] = datetime.now().isoformat(timespec='seconds')
+    _save_html_validators(project_id, validators)
+
+
+def _save_project_html(project_id: str, html_content: str, validators: Optional[dict] = None):
+    project_dir = os.path.join(user_settings.archdaily_projects_dir, project_id)
+    write_html(project_dir, html_content, user_settings.archdaily_html_compression)
+    if validators is not None:
+        _save_html_validators(project_id, validators)
+    get_project_manifest().update('archdaily', project_id, has_html=True)
+    _add_to_success_queue('content_html', project_id)
+
+
+# 构建soup时class尚未按空格拆分，用正则匹配多class中的一个
+_GALLERY_THUMBS_STRAINER = SoupStrainer('ul', class_=re.compile(r'(^|\s)gallery-thumbs(\s|$)'))
+_GALLERY_ITEMS_STRAINER = SoupStrainer(id='gallery-items')
+
+
+def find_gallery_url_archdaily(html_content: str) -> Optional[str]:
+    """在项目页面中查找gallery页面的链接（ul.gallery-thumbs中的第一个a.gallery-thumbs-link），没有时返回None"""
+    soup = make_soup(html_content, parse_only=_GALLERY_THUMBS_STRAINER)
+    for ul in soup.find_all('ul', class_='gallery-thumbs'):
+        link = ul.find('a', class_='gallery-thumbs-link', href=True)
+        if link is None:
+            continue
+        gallery_url = link['href']
+        if gallery_url.startswith("/"):
+            gallery_url = user_settings.archdaily_base_url + gallery_url[1:]
+        return gallery_url
+    return None
+
+
+def parse_gallery_data_images(gallery_html_content: str) -> list[dict]:
+    """
+    从gallery页面的div#gallery-items中读取data-images，只保留包含url_large的图片
+    页面没有data-images时返回空列表；data-images存在但无法解析时抛出ValueError，此时不应保存gallery.json
+    """
+    soup = make_soup(gallery_html_content, parse_only=_GALLERY_ITEMS_STRAINER)
+    gallery_items = soup.find(id='gallery-items')
+    if gallery_items is None or not gallery_items.get('data-images'):
+        return []
+    try:
+        data_images = loads(gallery_items['data-images'])
+    except Exception as e:
+        raise ValueError(f"data-images解析失败: {str(e)}")
+    if not isinstance(data_images, list):
+        raise ValueError(f"data-images不是列表: {type(data_images).__name__}")
+    return [data_image for data_image in data_images if isinstance(data_image, dict) and 'url_large' in data_image]
+
+
+def _save_gallery_json(project_id: str, gallery_url: Optional[str], data_images: list[dict]):
+    """gallery.json与content.html放在一起，解析时直接读取，不再请求gallery页面"""
+    gallery_file_path = os.path.join(user_settings.archdaily_projects_dir, project_id, "gallery.json")
+    os.makedirs(os.path.dirname(gallery_file_path), exist_ok=True)
+    dump_json({'url': gallery_url,
+               'fetched_at': datetime.now().isoformat(timespec='seconds'),
+               'images': data_images}, gallery_file_path, atomic=True)
+
+
+def fetch_gallery_archdaily(project_id: str, html_content: str, controller: Optional[AimdController] = None) -> bool:
+    """根据项目页面请求gallery页面，将data-images缓存为gallery.json，页面没有gallery时保存空列表"""
+    gallery_url = find_gallery_url_archdaily(html_content)
+    try:
+        data_images = []
+        if gallery_url is not None:
+            response = controlled_get(get_session(gallery_url), gallery_url, controller, timeout=60)
+            if response.status_code != 200:
+                logging.error(f"project: {project_id} gallery请求失败，状态码: {response.status_code}")
+                return False
+            data_images = parse_gallery_data_images(response.text)
+        _save_gallery_json(project_id, gallery_url, data_images)
+        return True
+    except Exception as e:
+        logging.error(f"project: {project_id} gallery请求出现意外情况, error: {str(e)}")
+        return False
+
+
+async def fetch_gallery_archdaily_async(session, project_id: str, html_content: str,
+                                        controller: Optional[AimdController] = None) -> bool:
+    """fetch_gallery_archdaily的asyncio版本"""
+    gallery_url = find_gallery_url_archdaily(html_content)
+    try:
+        data_images = []
+        if gallery_url is not None:
+            await acquire_async(controller)
+            start_time = time.time()
+            status_code, retry_after = None, None
+            try:
+                async with session.get(gallery_url) as response:
+                    status_code, retry_after = response.status, response.headers.get('Retry-After')
+                    if response.status != 200:
+                        logging.error(f"project: {project_id} gallery请求失败，状态码: {response.status}")
+                        return False
+                    gallery_html_content = (await response.read()).decode('utf-8', errors='replace')
+            finally:
+                if controller is not None:
+                    controller.release(status_code, time.time() - start_time, retry_after)
+            data_images = parse_gallery_data_images(gallery_html_content)
+        await asyncio.to_thread(_save_gallery_json, project_id, gallery_url, data_images)
+        return True
+    except Exception as e:
+        logging.error(f"project: {project_id} gallery请求出现意外情况, error: {str(e)}")
+        return False
+
+
 def request_project_html_archdaily(project_id: str, i: int, total: int, invalid_project_ids: set[str],
-                                   force_update: bool = False) -> Optional[bool]:
+                                   force_update: bool = False,
+                                   controller: Optional[AimdController] = None,
+                                   refresh: bool = False) -> Optional[bool]:
     """
     请求project的id并保存到本地
     :param force_update: 强制重新爬取
@@ -59,113 +349,327 @@ def request_project_html_archdaily(project_id: str, i: int, total: int, invalid_
     :param i:
     :param total:
     :param invalid_project_ids:
-    :return: None代表无错误完成， False代表错误， True代表成功
+    :param controller: 可选的AIMD并发控制器
+    :param refresh: 刷新模式，使用If-None-Match/If-Modified-Since条件请求，304或内容哈希未变化时不重写文件
+    :return: None代表无错误完成（包括未修改）， False代表错误， True代表成功
     """
-    url = f"{user_settings.archdaily_base_url}{project_id}"
-    html_file_path = os.path.join(user_settings.archdaily_projects_dir, project_id, "content.html")
-    if os.path.isfile(html_file_path) and not force_update:
-        return None
-    if project_id in invalid_project_ids:
+    if not _should_request_project_html(project_id, invalid_project_ids, force_update or refresh):
         return None
+    url = f"{user_settings.archdaily_base_url}{project_id}"
     try:
-        response = requests.get(url, headers=user_settings.headers, timeout=60)
+        response = controlled_get(get_session(url), url, controller, timeout=60,
+                                  headers=_get_conditional_headers(project_id, refresh))
+        if response.status_code == 304:
+            _on_html_not_modified(project_id)
+            return None
         if response.status_code == 404:
-            invalid_project_ids.add(project_id)
+            _on_html_not_found(project_id, invalid_project_ids, i, total)
             return None
         if response.status_code != 200:
             logging.error(f"[{i + 1}/{total}] project: {project_id} 请求出现意外情况，状态码: {response.status_code}。")
+            set_project_error(project_id, f"状态码: {response.status_code}")
             return False
-        html_content: str = response.text
-        os.makedirs(os.path.dirname(html_file_path), exist_ok=True)
-        with open(html_file_path, 'w', encoding='utf-8') as f:
-            f.write(html_content)
-        _add_to_success_queue('content_html', project_id)
+        sha256 = _get_html_sha256(response.text)
+        validators = _make_html_validators(url, response.headers, len(response.content), sha256)
+        if refresh and _is_html_unchanged(project_id, sha256):
+            _on_html_unchanged(project_id, validators)
+            return None
+        _save_project_html(project_id, response.text, validators)
+        # gallery在下载阶段获取并缓存，解析阶段不再访问网络
+        if not fetch_gallery_archdaily(project_id, response.text, controller):
+            logging.warning(f"[{i + 1}/{total}] project: {project_id} gallery.json未保存，可稍后补充")
+        return True
+    except Exception as e:
+        logging.error(f"[{i + 1}/{total}] project: {project_id} 请求出现意外情况, error: {str(e)}")
+        set_project_error(project_id, str(e))
+        return False
+
+
+async def request_project_html_archdaily_async(session, project_id: str, i: int, total: int,
+                                               invalid_project_ids: set[str],
+                                               force_update: bool = False,
+                                               controller: Optional[AimdController] = None,
+                                               refresh: bool = False,
+                                               on_html: Optional[Callable[[str, str], None]] = None) -> Optional[bool]:
+    """
+    request_project_html_archdaily的asyncio版本，由utils.crawl_utils.run_async_crawl驱动
+    :param session: aiohttp.ClientSession
+    :param controller: 可选的AIMD并发控制器
+    :param refresh: 刷新模式，使用If-None-Match/If-Modified-Since条件请求，304或内容哈希未变化时不重写文件
+    :param on_html: html及gallery.json保存后以(project_id, html_content)调用，用于直接将内存中的html交给解析，
+                    在线程中调用，可以阻塞以限制等待解析的html数量
+    :return: None代表无错误完成（包括未修改）， False代表错误， True代表成功
+    """
+    if not _should_request_project_html(project_id, invalid_project_ids, force_update or refresh):
+        return None
+    url = f"{user_settings.archdaily_base_url}{project_id}"
+    try:
+        await acquire_async(controller)
+        start_time = time.time()
+        status_code, retry_after = None, None
+        try:
+            async with session.get(url, headers=_get_conditional_headers(project_id, refresh)) as response:
+                status_code, retry_after = response.status, response.headers.get('Retry-After')
+                if response.status == 304:
+                    await asyncio.to_thread(_on_html_not_modified, project_id)
+                    return None
+                if response.status == 404:
+                    await asyncio.to_thread(_on_html_not_found, project_id, invalid_project_ids, i, total)
+                    return None
+                if response.status != 200:
+                    logging.error(f"[{i + 1}/{total}] project: {project_id} 请求出现意外情况，状态码: {response.status}。")
+                    set_project_error(project_id, f"状态码: {response.status}")
+                    return False
+                html_bytes: bytes = await response.read()
+                validators = _make_html_validators(url, response.headers, len(html_bytes))
+        finally:
+            if controller is not None:
+                controller.release(status_code, time.time() - start_time, retry_after)
+        html_content = html_bytes.decode('utf-8', errors='replace')
+        validators['sha256'] = _get_html_sha256(html_content)
+        if refresh and await asyncio.to_thread(_is_html_unchanged, project_id, validators['sha256']):
+            await asyncio.to_thread(_on_html_unchanged, project_id, validators)
+            return None
+        await asyncio.to_thread(_save_project_html, project_id, html_content, validators)  # 写文件不阻塞事件循环
+        # gallery在下载阶段获取并缓存，解析阶段不再访问网络
+        if not await fetch_gallery_archdaily_async(session, project_id, html_content, controller):
+            logging.warning(f"[{i + 1}/{total}] project: {project_id} gallery.json未保存，可稍后补充")
+        if on_html is not None:
+            await asyncio.to_thread(on_html, project_id, html_content)
         return True
     except Exception as e:
         logging.error(f"[{i + 1}/{total}] project: {project_id} 请求出现意外情况, error: {str(e)}")
+        set_project_error(project_id, str(e))
         return False
 
 
-def parse_project_content_archdaily(project_id: str, i: int, total: int, flags: ArchdailyFlags = ArchdailyFlags.NONE) -> Optional[bool]:
-    """返回True表示改变， False表示错误， None表示无变化"""
-    html_file_path = os.path.join(user_settings.archdaily_projects_dir, project_id, "content.html")
-    json_file_path = os.path.join(user_settings.archdaily_projects_dir, project_id, "content.json")
-    if not os.path.isfile(html_file_path):
+def _is_project_redirect(project_id: str, location: Optional[str]) -> bool:
+    """重定向到/{project_id}/slug视为有效项目，重定向到首页、搜索页等视为无效"""
+    if not location:
+        return False
+    path = urlparse(urljoin(user_settings.archdaily_base_url, location)).path
+    return path.strip('/').split('/')[0] == project_id
+
+
+async def probe_project_url_archdaily_async(session, project_id: str, i: int, total: int,
+                                            invalid_project_ids: set[str],
+                                            controller: Optional[AimdController] = None) -> Optional[bool]:
+    """
+    使用HEAD请求（不跟随重定向）探测project id是否有效，不下载页面内容
+    HEAD不被支持(405/501)时退回到只读取前1KB的Range请求
+    :return: True代表有效项目， None代表无效（已记录到invalid_project_ids）， False代表无法确定（请求出错等）
+    """
+    url = f"{user_settings.archdaily_base_url}{project_id}"
+    try:
+        await acquire_async(controller)
+        start_time = time.time()
+        status_code, retry_after = None, None
+        try:
+            async with session.head(url, allow_redirects=False) as response:
+                status_code, retry_after = response.status, response.headers.get('Retry-After')
+                location = response.headers.get('Location')
+            if status_code in (405, 501):
+                async with session.get(url, allow_redirects=False, headers={'Range': 'bytes=0-1023'}) as response:
+                    status_code, retry_after = response.status, response.headers.get('Retry-After')
+                    location = response.headers.get('Location')
+        finally:
+            if controller is not None:
+                controller.release(status_code, time.time() - start_time, retry_after)
+        if status_code in (200, 206):
+            return True
+        if status_code in (301, 302, 303, 307, 308):
+            if _is_project_redirect(project_id, location):
+                return True
+            if status_code in (301, 308):  # 只有永久重定向到非项目页面才能确定id无效
+                invalid_project_ids.add(project_id)
+                return None
+            logging.warning(f"[{i + 1}/{total}] project: {project_id} 临时重定向到{location}，探测结果无法确定，"
+                            f"状态码: {status_code}。")
+            return False
+        if status_code in (404, 410):
+            invalid_project_ids.add(project_id)
+            return None
+        logging.warning(f"[{i + 1}/{total}] project: {project_id} 探测结果无法确定，状态码: {status_code}。")
+        return False
+    except Exception as e:
+        logging.error(f"[{i + 1}/{total}] project: {project_id} 探测出现意外情况, error: {str(e)}")
+        return False
+
+
+def _get_file_signature(file_path: Optional[str]) -> Optional[str]:
+    """文件名、大小及修改时间，用于不打开文件判断是否变化"""
+    if file_path is None or not os.path.isfile(file_path):
+        return None
+    stat = os.stat(file_path)
+    return f"{os.path.basename(file_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def load_parse_manifest(project_dir: str) -> dict:
+    """
+    读取项目的parse_manifest.json：
+    {'html': {'signature': ..., 'sha256': ...}, 'fields': {'title': {'version': 1, 'input': <html sha256>}, ...}}
+    """
+    manifest_path = os.path.join(project_dir, PARSE_MANIFEST_FILE_NAME)
+    if not os.path.isfile(manifest_path):
+        return {}
+    try:
+        return load_json(manifest_path)
+    except Exception as e:
+        logging.warning(f"{manifest_path} 读取失败, error: {str(e)}")
+        return {}
+
+
+def _save_parse_manifest(project_dir: str, manifest: dict):
+    dump_json(manifest, os.path.join(project_dir, PARSE_MANIFEST_FILE_NAME), atomic=True)
+
+
+def parse_project_content_archdaily(project_id: str, i: int, total: int, flags: ArchdailyFlags = ArchdailyFlags.NONE,
+                                    html_content: Optional[str] = None) -> Optional[bool]:
+    """
+    返回True表示改变， False表示错误， None表示无变化
+    除缺失的字段及flags强制更新的字段外，parse_manifest.json中记录的输入（html内容哈希、gallery.json）或
+    ARCHDAILY_EXTRACTOR_VERSIONS中的版本发生变化的字段也会重新提取；全部未变化时不读取content.json和html
+    :param html_content: 刚下载的html，不为None时直接解析，不再读取content.html
+    """
+    project_dir = os.path.join(user_settings.archdaily_projects_dir, project_id)
+    json_file_path = os.path.join(project_dir, "content.json")
+    html_file_path = find_html_path(project_dir)
+    if html_content is None and html_file_path is None:
         logging.warning(f"[{i + 1}/{total}] project: {project_id} html文件不存在, 请先获取html文件")
+        set_project_error(project_id, "html文件不存在")
         return False
     soup = None
+    soup_fields = []
+
+    def get_html_content() -> str:
+        nonlocal html_content
+        if html_content is None:
+            html_content = read_html(project_dir)  # 自动识别content.html/.gz/.zst
+        return html_content
 
     def get_soup():
-        """延迟get"""
+        """延迟get，只解析soup_fields需要的部分"""
         nonlocal soup
         if soup is not None:
             return soup
 
-        with open(html_file_path, 'r', encoding='utf-8') as f:
-            html_content = f.read()
-        soup = BeautifulSoup(html_content, 'html.parser')
+        soup = make_soup(get_html_content(), parse_only=ArchdailyFieldStrainer(soup_fields))
         return soup
 
     try:
+        manifest = load_parse_manifest(project_dir)
+        manifest_fields: dict = manifest.setdefault('fields', {})
+        html_signature = _get_file_signature(html_file_path)
+        gallery_signature = _get_file_signature(os.path.join(project_dir, "gallery.json"))
+        html_unchanged = html_content is None and html_signature is not None and \
+            manifest.get('html', {}).get('signature') == html_signature and 'sha256' in manifest['html']
+
+        def get_field_input(field: str) -> Optional[str]:
+            if field == 'image_gallery':
+                return gallery_signature
+            if html_unchanged:
+                return manifest['html']['sha256']  # 文件未变化，沿用记录的哈希，不读取html
+            if 'sha256' not in manifest.get('html', {}) or manifest['html'].get('signature') != html_signature:
+                manifest['html'] = {'signature': html_signature,
+                                    'sha256': hashlib.sha256(get_html_content().encode('utf-8')).hexdigest()}
+            return manifest['html']['sha256']
+
+        def is_stale(field: str) -> bool:
+            """manifest中有记录且版本或输入发生变化；没有记录的旧项目只按字段是否缺失判断"""
+            entry = manifest_fields.get(field)
+            if entry is None:
+                return False
+            return entry.get('version') != ARCHDAILY_EXTRACTOR_VERSIONS[field] or \
+                entry.get('input') != get_field_input(field)
+
+        if not flags and os.path.isfile(json_file_path) and \
+                all(field in manifest_fields for field in ARCHDAILY_EXTRACTOR_VERSIONS) and \
+                html_unchanged and \
+                not any(is_stale(field) for field in ARCHDAILY_EXTRACTOR_VERSIONS):
+            return None
+
         output_data = {}
         if os.path.isfile(json_file_path):
-            with open(json_file_path, 'r', encoding='utf-8') as f:
-                try:
-                    output_data = json.load(f)
-                except Exception as e:
-                    logging.error(f'[{i + 1}/{total}] project {project_id} json文件读取失败 error: {str(e)}')
+            try:
+                output_data = load_json(json_file_path)
+            except Exception as e:
+                logging.error(f'[{i + 1}/{total}] project {project_id} json文件读取失败 error: {str(e)}')
         any_change = False
 
+        def needs(field: str, missing: bool, force_flag: ArchdailyFlags) -> bool:
+            # 缺失的字段如果已用当前版本从相同的输入提取过（提取失败），不再重复尝试
+            return bool(flags & force_flag) or is_stale(field) or (missing and field not in manifest_fields)
+
+        need_main_content = needs('main_content',
+                                  'main_content' not in output_data or len(output_data['main_content']) == 0,
+                                  ArchdailyFlags.FORCE_UPDATE_MAIN_CONTENT)
+        need_image_gallery = needs('image_gallery', 'image_gallery' not in output_data,
+                                   ArchdailyFlags.FORCE_UPDATE_IMAGE_GALLERY)
+        need_title = needs('title', 'title' not in output_data, ArchdailyFlags.FORCE_UPDATE_TITLE)
+        need_specs = needs('specs', 'specs' not in output_data, ArchdailyFlags.FORCE_UPDATE_SPECS)
+        need_tags = needs('tags', 'tags' not in output_data, ArchdailyFlags.FORCE_UPDATE_TAGS)
+        # 先确定需要的字段，再一次性解析这些字段所在的标签
+        soup_fields.extend(field for field, needed in (('main_content', need_main_content), ('title', need_title),
+                                                       ('specs', need_specs), ('tags', need_tags)) if needed)
+
+        def _record_field(field: str):
+            manifest_fields[field] = {'version': ARCHDAILY_EXTRACTOR_VERSIONS[field], 'input': get_field_input(field)}
+
         # 爬取main content
-        if 'main_content' not in output_data or \
-                len(output_data['main_content']) == 0 or \
-                flags & ArchdailyFlags.FORCE_UPDATE_MAIN_CONTENT:
+        if need_main_content:
             success, main_content = extract_main_content_archdaily(project_id, get_soup())
             if success:
                 output_data['main_content'] = main_content
                 any_change |= True
+            _record_field('main_content')
 
         # 爬取image gallery
-        if 'image_gallery' not in output_data or \
-                flags & ArchdailyFlags.FORCE_UPDATE_IMAGE_GALLERY:
-            success, image_gallery = extract_image_gallery_archdaily(project_id, get_soup())
+        if need_image_gallery:
+            success, image_gallery = extract_image_gallery_archdaily(project_id)
             if success:
                 output_data['image_gallery'] = image_gallery
                 any_change |= True
+            _record_field('image_gallery')
         # 爬取title
-        if 'title' not in output_data or \
-                flags & ArchdailyFlags.FORCE_UPDATE_TITLE:
+        if need_title:
             success, title = extract_title_archdaily(project_id, get_soup())
             if success:
                 output_data['title'] = title
                 any_change |= True
+            _record_field('title')
         # 爬取year
-        if 'specs' not in output_data or \
-                flags & ArchdailyFlags.FORCE_UPDATE_SPECS:
+        if need_specs:
             if 'year' in output_data:
                 output_data.pop('year')  # 删除之前由于旧数据格式问题，保留year字段
             success, specs = extract_specs_archdaily(project_id, get_soup())
             if success:
                 output_data['specs'] = specs
                 any_change |= True
+            _record_field('specs')
         # 爬取tags
-        if 'tags' not in output_data or \
-                flags & ArchdailyFlags.FORCE_UPDATE_TAGS:
+        if need_tags:
             success, tags = extract_tags_archdaily(project_id, get_soup())
             if success:
                 output_data['tags'] = tags
                 any_change |= True
+            _record_field('tags')
+
+        # 旧项目已有的字段没有记录，视为由当前版本从当前输入提取，之后只在输入或版本变化时重新提取
+        for field in ARCHDAILY_EXTRACTOR_VERSIONS:
+            if field in output_data and field not in manifest_fields:
+                _record_field(field)
 
         if any_change:
             os.makedirs(os.path.dirname(json_file_path), exist_ok=True)
-            with open(json_file_path, 'w', encoding='utf-8') as f:
-                json.dump(output_data, f, ensure_ascii=False, indent=4)
+            dump_json(output_data, json_file_path)
+            get_project_manifest().update('archdaily', project_id, has_json=True,
+                                          gallery_size=len(output_data.get('image_gallery', [])))
             _add_to_success_queue('content_json', project_id)
-            return True
-        else:
-            return None
+        _save_parse_manifest(project_dir, manifest)
+        return True if any_change else None
     except Exception as e:
         logging.error(f'[{i + 1}/{total}] project {project_id} error: {str(e)}')
+        set_project_error(project_id, str(e))
         return False
 
 
@@ -203,30 +707,14 @@ def extract_main_content_archdaily(project_id: str, soup) -> tuple[bool, list[di
         return False, []
 
 
-def extract_image_gallery_archdaily(project_id, soup) -> tuple[bool, list[dict]]:
+def extract_image_gallery_archdaily(project_id) -> tuple[bool, list[dict]]:
+    """读取下载阶段缓存的gallery.json，不访问网络"""
+    gallery_file_path = os.path.join(user_settings.archdaily_projects_dir, project_id, "gallery.json")
+    if not os.path.isfile(gallery_file_path):
+        logging.warning(f'project {project_id} gallery.json不存在, 请先下载gallery')
+        return False, []
     try:
-        image_gallery = []
-        gallery_thumbs = soup.find('ul', class_='gallery-thumbs')
-        if not gallery_thumbs:
-            return True, []
-        gallery_thumbs_link = gallery_thumbs.find('a', class_='gallery-thumbs-link')
-        if not gallery_thumbs_link:
-            return True, []
-        gallery_url = gallery_thumbs_link['href']
-        if gallery_url.startswith("/"):
-            gallery_url = user_settings.archdaily_base_url + gallery_url[1:]
-        gallery_response = requests.get(gallery_url, headers=user_settings.headers)
-        gallery_html_content = gallery_response.text
-        gallery_soup = BeautifulSoup(gallery_html_content, 'html.parser')
-        gallery_items = gallery_soup.find('div', id='gallery-items', class_='afd-gal-items')
-        if gallery_items and gallery_items.get('data-images'):
-            data_images: str = gallery_items['data-images']
-            data_images: str = data_images.replace('&quot;', '"')  # 替换 &quot; 为双引号
-            data_images: list[dict] = json.loads(data_images)
-            for data_image in data_images:
-                if 'url_large' in data_image:
-                    image_gallery.append(data_image)
-        return True, image_gallery
+        return True, load_json(gallery_file_path).get('images', [])
     except Exception as e:
         logging.error(f'project {project_id} 解析gallery时发生错误, error: {str(e)}')
     return False, []
@@ -300,21 +788,27 @@ def extract_specs_archdaily(project_id: str, soup) -> tuple[bool, dict]:
         return False, result
 
 
-def download_images_archdaily(project_id, i, total, image_size_type="large", img_index_change_callback=None) -> Optional[bool]:
-    return download_images_common(user_settings.archdaily_projects_dir, project_id, i, total, image_size_type, img_index_change_callback)
+def download_images_archdaily(project_id, i, total, image_size_type="large", img_index_change_callback=None,
+                              adaptive_concurrency: Optional[int] = None) -> Optional[bool]:
+    return download_images_common(user_settings.archdaily_projects_dir, project_id, i, total, image_size_type,
+                                  img_index_change_callback, adaptive_concurrency)
 
 
-def parse_project_content_gooood(project_id: str, i: int, total: int, flags: GoooodFlags = GoooodFlags.NONE) -> Optional[bool]:
-    """返回True表示改变， False表示错误， None表示无变化"""
+def parse_project_content_gooood(project_id: str, i: int, total: int, flags: GoooodFlags = GoooodFlags.NONE,
+                                 project_data: Optional[dict] = None) -> Optional[bool]:
+    """
+    返回True表示改变， False表示错误， None表示无变化
+    :param project_data: 直接从page文件中取出的项目数据，不为None时不再读取<project_id>.json
+    """
     data_file_path = os.path.join(user_settings.gooood_projects_dir, project_id, f"{project_id}.json")
     json_file_path = os.path.join(user_settings.gooood_projects_dir, project_id, "content.json")
-    if not os.path.isfile(data_file_path):
+    if project_data is None and not os.path.isfile(data_file_path):
         logging.warning(f"[{i + 1}/{total}] {project_id}.json文件不存在, 请先获取json文件")
         return False
     soup = None
 
-    with open(data_file_path, 'r', encoding='utf-8') as f:
-        project_data = json.load(f)
+    if project_data is None:
+        project_data = load_json(data_file_path)
 
     def get_soup():
         """延迟get"""
@@ -322,17 +816,16 @@ def parse_project_content_gooood(project_id: str, i: int, total: int, flags: Goo
         if soup is not None:
             return soup
         html_content = project_data['content']['rendered']
-        soup = BeautifulSoup(html_content, 'html.parser')
+        soup = make_soup(html_content)
         return soup
 
     try:
         output_data = {}
         if os.path.isfile(json_file_path):
-            with open(json_file_path, 'r', encoding='utf-8') as f:
-                try:
-                    output_data = json.load(f)
-                except Exception as e:
-                    logging.error(f'[{i + 1}/{total}] project {project_id} json文件读取失败 error: {str(e)}')
+            try:
+                output_data = load_json(json_file_path)
+            except Exception as e:
+                logging.error(f'[{i + 1}/{total}] project {project_id} json文件读取失败 error: {str(e)}')
         any_change = False
 
         # 爬取main content
@@ -377,8 +870,9 @@ def parse_project_content_gooood(project_id: str, i: int, total: int, flags: Goo
 
         if any_change:
             os.makedirs(os.path.dirname(json_file_path), exist_ok=True)
-            with open(json_file_path, 'w', encoding='utf-8') as f:
-                json.dump(output_data, f, ensure_ascii=False, indent=4)
+            dump_json(output_data, json_file_path)
+            get_project_manifest().update('gooood', project_id, has_json=True,
+                                          gallery_size=len(output_data.get('image_gallery', [])))
             _add_to_success_queue('content_json', project_id)
             return True
         else:
@@ -388,6 +882,24 @@ def parse_project_content_gooood(project_id: str, i: int, total: int, flags: Goo
         return False
 
 
+def parse_gooood_page_file(page_path: str, flags: GoooodFlags = GoooodFlags.NONE,
+                           skip_exist: bool = False) -> list[tuple[str, Optional[bool]]]:
+    """
+    直接遍历pages/page_XXXXX.json中的项目并生成content.json，不需要先用gooood__init_projects拆分出<project_id>.json
+    :return: [(project_id, changed), ...]，skip_exist时已有content.json的项目记为None
+    """
+    posts = load_json(page_path, use_mmap=True)
+    results = []
+    for i, project_data in enumerate(posts):
+        project_id = str(project_data['id'])
+        if skip_exist and os.path.exists(os.path.join(user_settings.gooood_projects_dir, project_id, "content.json")):
+            results.append((project_id, None))
+            continue
+        results.append((project_id, parse_project_content_gooood(project_id, i, len(posts), flags=flags,
+                                                                 project_data=project_data)))
+    return results
+
+
 def extract_main_content_gooood(project_id: str, soup) -> tuple[bool, list[dict]]:
     try:
         main_content = []  # 用于按顺序存储正文内容
@@ -491,49 +1003,190 @@ def extract_specs_gooood(project_id: str, project_data: dict) -> tuple[bool, dic
         return False, result
 
 
-def download_images_gooood(project_id, i, total, image_size_type="large", img_index_change_callback=None) -> Optional[bool]:
-    return download_images_common(user_settings.gooood_projects_dir, project_id, i, total, image_size_type, img_index_change_callback)
+def download_images_gooood(project_id, i, total, image_size_type="large", img_index_change_callback=None,
+                           adaptive_concurrency: Optional[int] = None) -> Optional[bool]:
+    return download_images_common(user_settings.gooood_projects_dir, project_id, i, total, image_size_type,
+                                  img_index_change_callback, adaptive_concurrency)
+
+
+def download_image_file(img_url: str, img_path: str, controller: Optional[AimdController] = None,
+                        validate: Optional[bool] = None) -> int:
+    """
+    流式下载图片到img_path（先写入.part临时文件，校验后原子替换），不会在内存中缓存整张图片
+    :param validate: 是否检查Content-Length及JPEG结束标记，None时使用user_settings.image_download_validate
+    :return: HTTP状态码，200表示下载成功；校验失败时抛出异常
+    """
+    if validate is None:
+        validate = user_settings.image_download_validate
+    response = controlled_get(get_session(img_url), img_url, controller, timeout=60, stream=True)
+    with response:
+        if response.status_code != 200:
+            return response.status_code
+        content_length = response.headers.get('Content-Length')
+        # 经过gzip等编码的响应，Content-Length与解码后的长度不一致
+        expected_length = int(content_length) if content_length and content_length.isdigit() and \
+            not response.headers.get('Content-Encoding') else None
+        write_stream_atomic(response.iter_content(chunk_size=64 * 1024), img_path, expected_length, validate)
+    return 200
+
+
+def download_image_bytes(img_url: str, controller: Optional[AimdController] = None,
+                         validate: Optional[bool] = None) -> tuple[int, Optional[bytes]]:
+    """
+    下载图片到内存，用于追加到shard
+    :return: (HTTP状态码, 图片数据)，校验失败时抛出异常
+    """
+    if validate is None:
+        validate = user_settings.image_download_validate
+    response = controlled_get(get_session(img_url), img_url, controller, timeout=60)
+    with response:
+        if response.status_code != 200:
+            return response.status_code, None
+        data = response.content
+        content_length = response.headers.get('Content-Length')
+        if validate:
+            if content_length and content_length.isdigit() and not response.headers.get('Content-Encoding') \
+                    and len(data) != int(content_length):
+                raise IOError(f"图片不完整, 期望{content_length}字节, 实际{len(data)}字节")
+            if not is_image_bytes_complete(data):
+                raise IOError("图片不完整, 缺少JPEG结束标记")
+    return 200, data
+
+
+def plan_image_variant(image_gallery_image: dict, target_resolution: int = 0) -> tuple[str, Optional[str]]:
+    """
+    为一张gallery图片选择下载的尺寸：标称尺寸不小于target_resolution的最小variant，没有时回退到url_large
+    :param target_resolution: 使用者需要的长边像素，0表示始终下载large
+    :return: (variant, url)
+    """
+    if target_resolution > 0:
+        candidates = sorted((size, variant) for variant, size in user_settings.image_variant_sizes.items()
+                            if size >= target_resolution and image_gallery_image.get(f'url_{variant}'))
+        if candidates:
+            variant = candidates[0][1]
+            return variant, image_gallery_image[f'url_{variant}']
+    return 'large', image_gallery_image.get('url_large')
 
 
-def download_images_common(projects_dir, project_id, i, total, image_size_type="large", img_index_change_callback=None):
+def list_pending_gallery_images(projects_dir, project_id, i, total, image_size_type="large",
+                                target_resolution: int = 0) -> Optional[list[dict]]:
+    """
+    读取项目的content.json，列出尚未下载的image gallery图片
+    :param image_size_type: target_resolution为0时下载的尺寸
+    :param target_resolution: 大于0时由plan_image_variant为每张图片选择尺寸，已有满足分辨率的图片（包括更大的尺寸）不再下载
+    :return: [{'img_index': 0, 'img_url': ..., 'img_path': ..., 'variant': ...}, ...]，content.json不存在或无法读取时返回None
+    """
     folder_path = os.path.join(projects_dir, project_id)
     json_file_path = os.path.join(projects_dir, project_id, "content.json")
     if not os.path.isfile(json_file_path):
         logging.error(f'[{i}/{total}] project {project_id} content.json not exist')
-        return False
+        return None
     try:
-        with open(json_file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = load_json(json_file_path)
     except Exception as e:
         logging.error(f'[{i}/{total}] project {project_id} cannot load json, error: {str(e)}')
-        return False
+        return None
 
-    image_gallery_images = data.get('image_gallery', [])
-    for img_index, image_gallery_image in enumerate(image_gallery_images):
-        try:
-            if img_index_change_callback:
-                img_index_change_callback(project_id, img_index, len(image_gallery_images))
-            img_path = os.path.join(folder_path, 'image_gallery', image_size_type, f'{str(img_index).zfill(5)}.jpg')
-            os.makedirs(os.path.dirname(img_path), exist_ok=True)
-            if os.path.isfile(img_path):
-                # logging.info(f'[{i}/{total}][{img_index}/{len(image_gallery_images)}] image_gallery image exist for project {project_id}')
+    existing_names = set(list_gallery_image_paths(folder_path, f'image_gallery/{get_min_variant(target_resolution)}',
+                                                  allow_smaller=False)) if target_resolution > 0 else set()
+    pending_images = []
+    for img_index, image_gallery_image in enumerate(data.get('image_gallery', [])):
+        img_name = f'{str(img_index).zfill(5)}.jpg'
+        if target_resolution > 0:
+            if img_name in existing_names:
                 continue
-            img_url = image_gallery_image.get(f'url_{image_size_type}')
-            if not img_url:
-                logging.warning(f'[{i}/{total}] No url_{image_size_type} found for project {project_id}')
-
-            response = requests.get(img_url, timeout=60)
-            if response.status_code == 200:
-                with open(img_path, 'wb') as img_file:
-                    img_file.write(response.content)
-                logging.info(
-                    f'[{i}/{total}][{img_index}/{len(image_gallery_images)}] success for project {project_id}')
-            else:
-                logging.warning(f'[{i}/{total}][{img_index}/{len(image_gallery_images)}] Failed to '
-                                f'download image for project {project_id}, code {response.status_code}')
+            variant, img_url = plan_image_variant(image_gallery_image, target_resolution)
+        else:
+            variant, img_url = image_size_type, image_gallery_image.get(f'url_{image_size_type}')
+        img_path = os.path.join(folder_path, 'image_gallery', variant, img_name)
+        if gallery_image_exists(img_path):
+            continue
+        if not img_url:
+            logging.warning(f'[{i}/{total}] No url_{variant} found for project {project_id}')
+        pending_images.append({'img_index': img_index, 'img_url': img_url, 'img_path': img_path, 'variant': variant})
+    return pending_images
+
+
+def download_gallery_image(img_url: str, img_path: str, adaptive_concurrency: Optional[int] = None) -> tuple[bool, Optional[dict]]:
+    """
+    下载单张gallery图片，启用blob存储时已经下载过的url直接硬链接，不发送请求
+    未启用adaptive_concurrency时，请求之后随机等待一段时间
+    :return: (是否成功, blob_index条目)，未启用blob存储时条目为None
+    """
+    if user_settings.image_storage_format == 'shards':
+        return _download_gallery_image_to_shard(img_url, img_path, adaptive_concurrency)
+    os.makedirs(os.path.dirname(img_path), exist_ok=True)
+    blob_store = get_blob_store()
+    if blob_store is not None and img_url:
+        sha256 = blob_store.lookup_url(img_url)
+        if sha256 is not None:
+            blob_store.link(sha256, img_path)
+            return True, {'url': img_url, 'sha256': sha256}
 
+    controller = get_controller(img_url, adaptive_concurrency) if adaptive_concurrency and img_url else None
+    try:
+        status_code = download_image_file(img_url, img_path, controller)
+        if status_code != 200:
+            logging.warning(f'Failed to download image {img_url}, code {status_code}')
+            return False, None
+        blob_entry = None
+        if blob_store is not None:
+            blob_entry = {'url': img_url, 'sha256': blob_store.add_file(img_path, img_url)}
+        return True, blob_entry
+    finally:
+        if controller is None:
+            time.sleep(random.random() * 0.2)
+
+
+def _download_gallery_image_to_shard(img_url: str, img_path: str,
+                                     adaptive_concurrency: Optional[int] = None) -> tuple[bool, Optional[dict]]:
+    """图片追加到shard而不是写入img_path，shard中已有同一url的图片时不发送请求，返回的条目与blob存储相同"""
+    projects_dir, project_id, variant, name = split_gallery_image_path(img_path)
+    shard_store = get_shard_store(projects_dir, create=True)
+    if img_url:
+        sha256 = shard_store.link_url(project_id, variant, name, img_url)
+        if sha256 is not None:
+            return True, {'url': img_url, 'sha256': sha256}
+
+    controller = get_controller(img_url, adaptive_concurrency) if adaptive_concurrency and img_url else None
+    try:
+        status_code, data = download_image_bytes(img_url, controller)
+        if status_code != 200:
+            logging.warning(f'Failed to download image {img_url}, code {status_code}')
+            return False, None
+        return True, {'url': img_url, 'sha256': shard_store.append(project_id, variant, name, data, img_url)}
+    finally:
+        if controller is None:
+            time.sleep(random.random() * 0.2)
+
+
+def download_images_common(projects_dir, project_id, i, total, image_size_type="large", img_index_change_callback=None,
+                           adaptive_concurrency: Optional[int] = None):
+    """
+    逐张下载一个项目的image gallery
+    adaptive_concurrency不为None时按图片host使用AIMD控制器决定请求节奏（值为并发上限），否则每张图片之间随机等待
+    启用blob存储时，已经下载过的url直接硬链接到项目文件夹，不发送请求
+    """
+    pending_images = list_pending_gallery_images(projects_dir, project_id, i, total, image_size_type)
+    if pending_images is None:
+        return False
+    folder_path = os.path.join(projects_dir, project_id)
+    blob_index = load_blob_index(folder_path)
+    blob_index_changed = False
+    for n, pending_image in enumerate(pending_images):
+        img_index = pending_image['img_index']
+        if img_index_change_callback:
+            img_index_change_callback(project_id, n, len(pending_images))
+        try:
+            success, blob_entry = download_gallery_image(pending_image['img_url'], pending_image['img_path'],
+                                                         adaptive_concurrency)
+            if success:
+                logging.info(f'[{i}/{total}][{img_index}] success for project {project_id}')
+            if blob_entry is not None:
+                blob_index[f'{pending_image["variant"]}/{os.path.basename(pending_image["img_path"])}'] = blob_entry
+                blob_index_changed = True
         except Exception as e:
-            logging.error(
-                f'[{i}/{total}][{img_index}/{len(image_gallery_images)}] project {project_id} error: {str(e)}')
-        time.sleep(random.random() * 0.2)
-    return True
\ No newline at end of file
+            logging.error(f'[{i}/{total}][{img_index}] project {project_id} error: {str(e)}')
+    if blob_index_changed:
+        save_blob_index(folder_path, blob_index)
+    return True
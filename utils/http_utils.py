@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# @Author  : Yiheng Feng
+# @Time    : 10/17/2026 11:05 AM
+# @Function: 按host共享的requests.Session注册表，复用keep-alive连接池，避免每次请求重新进行TCP+TLS握手
+import atexit
+import logging
+import threading
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import user_settings
+
+_sessions: dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+_pool_size = user_settings.http_pool_size
+
+
+def get_default_headers() -> dict:
+    """由user_settings.headers生成默认请求头，Host由requests根据url自动填写"""
+    headers = dict(user_settings.headers)
+    headers.pop('Host', None)
+    return headers
+
+
+def _make_adapter(pool_size: int) -> HTTPAdapter:
+    retry = Retry(total=user_settings.http_max_retries,
+                  backoff_factor=0.5,
+                  status_forcelist=(500, 502, 504),  # 429/503交给调用方处理（限流信号）
+                  allowed_methods=frozenset(['GET', 'HEAD']),
+                  raise_on_status=False)
+    return HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+
+
+def _mount(session: requests.Session, pool_size: int):
+    adapter = _make_adapter(pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+
+def get_session(url: str) -> requests.Session:
+    """获取url所在host对应的共享Session，不存在时创建"""
+    host = urlparse(url).netloc
+    session = _sessions.get(host)
+    if session is not None:
+        return session
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            session.headers.clear()
+            session.headers.update(get_default_headers())
+            _mount(session, _pool_size)
+            _sessions[host] = session
+            logging.info(f"已创建{host}的共享Session, pool_size={_pool_size}")
+    return session
+
+
+def set_pool_size(pool_size: int):
+    """根据并发worker数量调整连接池大小，已经创建的Session也会重新挂载adapter"""
+    global _pool_size
+    with _sessions_lock:
+        if pool_size <= _pool_size:
+            return
+        _pool_size = pool_size
+        for session in _sessions.values():
+            _mount(session, pool_size)
+
+
+def close_all_sessions():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+atexit.register(close_all_sessions)
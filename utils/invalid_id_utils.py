@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# @Author  : Yiheng Feng
+# @Time    : 10/18/2026 2:10 PM
+# @Function: 无效(404)项目id的紧凑存储：有序uint32数组(.npy) + 只追加的日志(.log)，定期合并
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+
+class InvalidProjectIdStore:
+    """
+    兼容原先set[str]的用法（in / add），新增id只追加到日志文件，不再整体重写json
+    文件布局（以invalid_project_ids.json为例）：
+        invalid_project_ids.npy  已合并的有序id数组
+        invalid_project_ids.log  尚未合并的新增id，每行一个
+    """
+
+    def __init__(self, json_path: str, compact_threshold: int = 100000):
+        """
+        :param json_path: user_settings.archdaily_invalid_projects_ids_path，旧版json存在时会自动迁移
+        :param compact_threshold: 日志中的id数量超过该值时，flush会自动合并
+        """
+        stem = os.path.splitext(json_path)[0]
+        self.legacy_json_path = json_path
+        self.base_path = stem + '.npy'
+        self.log_path = stem + '.log'
+        self.compact_threshold = compact_threshold
+
+        self._lock = threading.Lock()
+        self._base = np.zeros(0, dtype=np.uint32)
+        self._pending: set[int] = set()  # 日志中的id（包括尚未写入磁盘的）
+        self._unflushed: list[int] = []
+        self._load()
+
+    def _load(self):
+        if os.path.isfile(self.base_path):
+            self._base = np.load(self.base_path)
+        elif os.path.isfile(self.legacy_json_path):
+            logging.info(f"正在从{self.legacy_json_path}迁移invalid_project_ids")
+            with open(self.legacy_json_path, 'r', encoding='utf-8') as f:
+                legacy_ids = [int(project_id) for project_id in json.load(f) if str(project_id).isdigit()]
+            self._base = np.unique(np.array(legacy_ids, dtype=np.uint32))
+            self._save_base()
+        if os.path.isfile(self.log_path):
+            with open(self.log_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if line.isdigit():
+                        self._pending.add(int(line))
+        logging.info(f"已加载{len(self)}个invalid_project_ids")
+
+    def _save_base(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.base_path)), exist_ok=True)
+        tmp_path = self.base_path + '.tmp.npy'
+        np.save(tmp_path, self._base)
+        os.replace(tmp_path, self.base_path)
+
+    def _in_base(self, project_id: int) -> bool:
+        idx = np.searchsorted(self._base, project_id)
+        return idx < len(self._base) and self._base[idx] == project_id
+
+    def __contains__(self, project_id) -> bool:
+        project_id = str(project_id)
+        if not project_id.isdigit():
+            return False
+        project_id = int(project_id)
+        return project_id in self._pending or self._in_base(project_id)
+
+    def __len__(self) -> int:
+        return len(self._base) + len(self._pending)
+
+    def add(self, project_id):
+        project_id = str(project_id)
+        if not project_id.isdigit():
+            return
+        project_id = int(project_id)
+        with self._lock:
+            if project_id in self._pending or self._in_base(project_id):
+                return
+            self._pending.add(project_id)
+            self._unflushed.append(project_id)
+
+    def flush(self):
+        """将新增的id追加到日志文件，日志过大时自动合并"""
+        with self._lock:
+            if self._unflushed:
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(''.join(f"{project_id}\n" for project_id in self._unflushed))
+                self._unflushed.clear()
+            should_compact = len(self._pending) >= self.compact_threshold
+        if should_compact:
+            self.compact()
+
+    def compact(self):
+        """将日志合并进有序数组并清空日志"""
+        with self._lock:
+            if self._unflushed:
+                self._unflushed.clear()  # 直接合并进数组，无需再写日志
+            if not self._pending:
+                return
+            pending = np.fromiter(self._pending, dtype=np.uint32, count=len(self._pending))
+            self._base = np.union1d(self._base, pending).astype(np.uint32)
+            self._save_base()
+            self._pending.clear()
+            if os.path.isfile(self.log_path):
+                os.remove(self.log_path)
+        logging.info(f"invalid_project_ids已合并, 共{len(self._base)}个")
+
+    def filter_ids(self, project_ids: np.ndarray) -> np.ndarray:
+        """向量化地从project_ids中扣除所有无效id，保持原有顺序"""
+        with self._lock:
+            if self._pending:
+                pending = np.fromiter(self._pending, dtype=np.int64, count=len(self._pending))
+                invalid_ids = np.union1d(self._base.astype(np.int64), pending)
+            else:
+                invalid_ids = self._base.astype(np.int64)
+        return project_ids[~np.isin(project_ids, invalid_ids, assume_unique=False)]
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+# @Author  : Yiheng Feng
+# @Time    : 10/18/2026 9:30 AM
+# @Function: 项目文件读写工具，content.html支持不压缩/gzip/zstd三种存储格式，读取时自动识别；图片流式原子写入及完整性检查
+import gzip
+import logging
+import os
+from typing import Iterable, Optional
+
+from config import user_settings
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+HTML_FILE_NAMES = {
+    'zstd': 'content.html.zst',
+    'gzip': 'content.html.gz',
+    'none': 'content.html',
+}
+
+
+_warned_compressions = set()
+
+
+def _resolve_compression(compression: str) -> str:
+    if compression in HTML_FILE_NAMES and (compression != 'zstd' or zstandard is not None):
+        return compression
+    if compression not in _warned_compressions:
+        _warned_compressions.add(compression)
+        logging.warning(f"html压缩格式{compression}不可用(未知格式或未安装zstandard), 使用gzip代替")
+    return 'gzip'
+
+
+def find_html_path(project_dir: str) -> Optional[str]:
+    """返回项目文件夹中content.html（任意格式）的路径，不存在时返回None"""
+    for file_name in HTML_FILE_NAMES.values():
+        html_file_path = os.path.join(project_dir, file_name)
+        if os.path.isfile(html_file_path):
+            return html_file_path
+    return None
+
+
+def html_exists(project_dir: str) -> bool:
+    return find_html_path(project_dir) is not None
+
+
+def decode_html_bytes(data: bytes, file_name: str) -> str:
+    if file_name.endswith('.zst'):
+        if zstandard is None:
+            raise ImportError(f"读取{file_name}需要安装zstandard")
+        data = zstandard.ZstdDecompressor().decompress(data)
+    elif file_name.endswith('.gz'):
+        data = gzip.decompress(data)
+    return data.decode('utf-8')
+
+
+def read_html(project_dir: str) -> Optional[str]:
+    """读取项目的content.html，自动识别压缩格式，不存在时返回None"""
+    html_file_path = find_html_path(project_dir)
+    if html_file_path is None:
+        return None
+    with open(html_file_path, 'rb') as f:
+        data = f.read()
+    return decode_html_bytes(data, html_file_path)
+
+
+def encode_html(html_content: str, compression: str) -> tuple[str, bytes]:
+    """按照compression编码html，返回(文件名, 数据)"""
+    compression = _resolve_compression(compression)
+    data = html_content.encode('utf-8')
+    if compression == 'zstd':
+        data = zstandard.ZstdCompressor(level=10).compress(data)
+    elif compression == 'gzip':
+        data = gzip.compress(data, compresslevel=6)
+    return HTML_FILE_NAMES[compression], data
+
+
+def write_html(project_dir: str, html_content: str, compression: str = 'none') -> str:
+    """
+    写入content.html，先写临时文件再替换，完成后删除其他格式的旧文件
+    :return: 写入的文件路径
+    """
+    file_name, data = encode_html(html_content, compression)
+    os.makedirs(project_dir, exist_ok=True)
+    html_file_path = os.path.join(project_dir, file_name)
+    tmp_file_path = html_file_path + '.tmp'
+    with open(tmp_file_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_file_path, html_file_path)
+    for other_file_name in HTML_FILE_NAMES.values():
+        if other_file_name != file_name:
+            other_file_path = os.path.join(project_dir, other_file_name)
+            if os.path.isfile(other_file_path):
+                os.remove(other_file_path)
+    return html_file_path
+
+
+def convert_html_storage(project_dir: str, compression: str) -> Optional[bool]:
+    """
+    将项目已有的content.html转换为指定的存储格式
+    :return: True表示已转换， None表示已经是目标格式或不存在html， False表示出错
+    """
+    html_file_path = find_html_path(project_dir)
+    if html_file_path is None:
+        return None
+    if os.path.basename(html_file_path) == HTML_FILE_NAMES[_resolve_compression(compression)]:
+        return None
+    try:
+        html_content = read_html(project_dir)
+        write_html(project_dir, html_content, compression)
+        return True
+    except Exception as e:
+        logging.error(f"{project_dir} html格式转换失败, error: {str(e)}")
+        return False
+
+
+PART_SUFFIX = '.part'
+_JPEG_SOI = b'\xff\xd8'
+_JPEG_EOI = b'\xff\xd9'
+
+
+def is_image_complete(img_path: str) -> bool:
+    """
+    检查图片文件是否完整：非空，且JPEG文件以EOI标记(FFD9)结尾（允许末尾少量填充字节）
+    非JPEG格式的文件只检查是否为空
+    """
+    try:
+        size = os.path.getsize(img_path)
+        if size == 0:
+            return False
+        with open(img_path, 'rb') as f:
+            if f.read(2) != _JPEG_SOI:
+                return True
+            f.seek(max(0, size - 32))
+            return _JPEG_EOI in f.read()
+    except OSError:
+        return False
+
+
+def is_image_bytes_complete(data: bytes) -> bool:
+    """与is_image_complete相同，检查内存中的图片数据"""
+    if not data:
+        return False
+    if data[:2] != _JPEG_SOI:
+        return True
+    return _JPEG_EOI in data[-32:]
+
+
+def write_stream_atomic(chunks: Iterable[bytes], file_path: str, expected_length: Optional[int] = None,
+                        validate: bool = True) -> int:
+    """
+    将数据块流式写入file_path.part，校验通过后原子替换为file_path，失败时删除临时文件并抛出异常
+    :param chunks: 数据块，例如response.iter_content(chunk_size)
+    :param expected_length: 期望的字节数（Content-Length），None表示不检查
+    :param validate: 是否检查长度及JPEG结束标记
+    :return: 写入的字节数
+    """
+    part_path = file_path + PART_SUFFIX
+    written = 0
+    try:
+        with open(part_path, 'wb') as f:
+            for chunk in chunks:
+                if chunk:
+                    f.write(chunk)
+                    written += len(chunk)
+        if validate:
+            if expected_length is not None and written != expected_length:
+                raise IOError(f"文件不完整, 期望{expected_length}字节, 实际{written}字节")
+            if not is_image_complete(part_path):
+                raise IOError("文件不完整, 缺少JPEG结束标记")
+        os.replace(part_path, file_path)
+        return written
+    except BaseException:
+        if os.path.isfile(part_path):
+            os.remove(part_path)
+        raise
+
+
+def get_min_variant(target_resolution: int) -> str:
+    """返回标称尺寸不小于target_resolution的最小variant，target_resolution<=0或没有满足的variant时返回large"""
+    if target_resolution > 0:
+        candidates = sorted((size, variant) for variant, size in user_settings.image_variant_sizes.items()
+                            if size >= target_resolution)
+        if candidates:
+            return candidates[0][1]
+    return 'large'
+
+
+def list_gallery_image_paths(project_dir: str, img_dir: str = 'image_gallery/large',
+                             allow_smaller: bool = True) -> dict[str, str]:
+    """
+    返回项目gallery图片{文件名: 路径}，按文件名排序，包括保存在shard中的图片
+    img_dir为image_gallery/<variant>时，该尺寸中缺失的图片依次从更大、更小的尺寸文件夹中补充
+    （按目标分辨率下载时图片可能保存在较小的尺寸中，也可能回退到了large）
+    :param allow_smaller: False时只从更大的尺寸中补充，用于判断图片是否已经满足分辨率
+    """
+    img_folder = os.path.join(project_dir, img_dir)
+    variant = os.path.basename(os.path.normpath(img_dir))
+    variant_sizes = user_settings.image_variant_sizes
+    img_folders = [img_folder]
+    if variant in variant_sizes:
+        size = variant_sizes[variant]
+        larger_variants = sorted((other_size, other) for other, other_size in variant_sizes.items() if other_size > size)
+        smaller_variants = sorted(((other_size, other) for other, other_size in variant_sizes.items()
+                                   if other_size < size), reverse=True) if allow_smaller else []
+        img_folders += [os.path.join(os.path.dirname(img_folder), other)
+                        for _, other in larger_variants + smaller_variants]
+    from utils.shard_utils import list_shard_images
+    shard_images = list_shard_images(project_dir)  # shard中的图片路径与文件相同，使用shard_utils.open_gallery_image读取
+    img_paths = {}
+    for folder in img_folders:
+        names = os.listdir(folder) if os.path.isdir(folder) else []
+        names += shard_images.get(os.path.basename(folder), [])
+        for name in names:
+            if name.endswith('.jpg') and name not in img_paths:
+                img_paths[name] = os.path.join(folder, name)
+    return dict(sorted(img_paths.items()))
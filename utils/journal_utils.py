@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+# @Author  : Yiheng Feng
+# @Time    : 10/19/2026 4:30 PM
+# @Function: 基于SQLite的抓取任务日志，记录每个项目在各阶段的状态，崩溃或重启后只恢复未完成的项目
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, Optional
+
+from config import user_settings
+
+STATE_QUEUED = 'queued'
+STATE_IN_FLIGHT = 'in_flight'
+STATE_DONE = 'done'
+STATE_FAILED = 'failed'
+
+
+class CrawlJournal:
+    """
+    items表记录(stage, item)的状态、尝试次数及最后一次错误，stage例如archdaily_html、archdaily_gallery、archdaily_parse
+    写入先缓存在事务中，每commit_interval秒或commit_batch次写入提交一次，崩溃时最多丢失最近一次提交之后的进度
+    （这些项目会保持queued/in_flight状态，恢复时重新处理）
+    """
+
+    def __init__(self, db_path: str, commit_interval: float = 1.0, commit_batch: int = 500):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.db_path = db_path
+        self.commit_interval = commit_interval
+        self.commit_batch = commit_batch
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS items (
+                stage TEXT NOT NULL,
+                item TEXT NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (stage, item)
+            )''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_items_stage_state ON items (stage, state)')
+        self._conn.commit()
+        self._uncommitted = 0
+        self._last_commit = time.time()
+
+    def _write(self, sql: str, params_seq: Iterable[tuple]):
+        with self._lock:
+            cursor = self._conn.executemany(sql, params_seq)
+            self._uncommitted += max(cursor.rowcount, 1)
+            if self._uncommitted >= self.commit_batch or time.time() - self._last_commit >= self.commit_interval:
+                self._commit()
+
+    def _commit(self):
+        self._conn.commit()
+        self._uncommitted = 0
+        self._last_commit = time.time()
+
+    def flush(self):
+        with self._lock:
+            self._commit()
+
+    def enqueue(self, stage: str, items: Iterable[str]):
+        """将items标记为queued（已完成或失败的项目重新排队，尝试次数保留）"""
+        now = time.time()
+        self._write('''
+            INSERT INTO items (stage, item, state, attempts, updated_at) VALUES (?, ?, ?, 0, ?)
+            ON CONFLICT (stage, item) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at''',
+                    ((stage, str(item), STATE_QUEUED, now) for item in items))
+        self.flush()
+
+    def mark_in_flight(self, stage: str, item: str):
+        self._write('UPDATE items SET state = ?, attempts = attempts + 1, updated_at = ? WHERE stage = ? AND item = ?',
+                    [(STATE_IN_FLIGHT, time.time(), stage, str(item))])
+
+    def mark_done(self, stage: str, item: str):
+        self._write('UPDATE items SET state = ?, last_error = NULL, updated_at = ? WHERE stage = ? AND item = ?',
+                    [(STATE_DONE, time.time(), stage, str(item))])
+
+    def mark_failed(self, stage: str, item: str, error: Optional[str] = None):
+        self._write('UPDATE items SET state = ?, last_error = ?, updated_at = ? WHERE stage = ? AND item = ?',
+                    [(STATE_FAILED, error, time.time(), stage, str(item))])
+
+    def get_pending(self, stage: str, max_attempts: Optional[int] = None) -> list[str]:
+        """
+        返回stage中未完成的项目（queued、in_flight及failed），in_flight说明上次运行中途退出
+        通过(stage, state)索引查询，耗时只与未完成的项目数量有关
+        :param max_attempts: 不为None时跳过尝试次数已达到该值的失败项目
+        """
+        with self._lock:
+            self._commit()
+            sql = 'SELECT item FROM items WHERE stage = ? AND state IN (?, ?, ?)'
+            params = [stage, STATE_QUEUED, STATE_IN_FLIGHT, STATE_FAILED]
+            if max_attempts is not None:
+                sql += ' AND NOT (state = ? AND attempts >= ?)'
+                params += [STATE_FAILED, max_attempts]
+            return [row[0] for row in self._conn.execute(sql + ' ORDER BY rowid', params)]
+
+    def get_counts(self, stage: str) -> dict[str, int]:
+        with self._lock:
+            self._commit()
+            rows = self._conn.execute('SELECT state, COUNT(*) FROM items WHERE stage = ? GROUP BY state', (stage,))
+            return {state: count for state, count in rows}
+
+    def get_failed(self, stage: str, limit: int = 100) -> list[tuple[str, int, Optional[str]]]:
+        """返回最近失败的项目[(item, attempts, last_error), ...]"""
+        with self._lock:
+            self._commit()
+            return list(self._conn.execute(
+                'SELECT item, attempts, last_error FROM items WHERE stage = ? AND state = ? '
+                'ORDER BY updated_at DESC LIMIT ?', (stage, STATE_FAILED, limit)))
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            self._conn.close()
+
+
+_journal: Optional[CrawlJournal] = None
+_journal_lock = threading.Lock()
+
+
+def get_crawl_journal() -> CrawlJournal:
+    global _journal
+    with _journal_lock:
+        if _journal is None or _journal.db_path != user_settings.crawl_journal_path:
+            _journal = CrawlJournal(user_settings.crawl_journal_path)
+            logging.info(f"已打开抓取日志{user_settings.crawl_journal_path}")
+        return _journal
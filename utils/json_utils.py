@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+# @Author  : Yiheng Feng
+# @Time    : 10/22/2026 3:20 PM
+# @Function: json读写，安装了orjson时使用orjson，默认输出紧凑格式，user_settings.json_pretty为True时缩进便于调试
+import json
+import mmap
+import os
+from typing import Any, Optional, Union
+
+from config import user_settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj: Any, pretty: Optional[bool] = None) -> bytes:
+    """序列化为utf-8编码的json（非ascii字符不转义），pretty为None时使用user_settings.json_pretty"""
+    if pretty is None:
+        pretty = user_settings.json_pretty
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, option=option)
+    if pretty:
+        return json.dumps(obj, ensure_ascii=False, indent=4).encode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def load_json(file_path: str, use_mmap: bool = False) -> Any:
+    """
+    :param use_mmap: 使用内存映射读取，orjson直接解析映射的内存，避免将大文件复制一份到内存中
+    """
+    with open(file_path, 'rb') as f:
+        if use_mmap and orjson is not None and os.fstat(f.fileno()).st_size > 0:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return orjson.loads(memoryview(mm))
+        return loads(f.read())
+
+
+def dump_json(obj: Any, file_path: str, pretty: Optional[bool] = None, atomic: bool = False):
+    """
+    写入json文件
+    :param atomic: 先写入临时文件再替换，读取方不会看到写了一半的文件
+    """
+    data = dumps(obj, pretty)
+    if not atomic:
+        with open(file_path, 'wb') as f:
+            f.write(data)
+        return
+    tmp_path = file_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, file_path)
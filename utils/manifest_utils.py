@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+# @Author  : Yiheng Feng
+# @Time    : 10/23/2026 10:10 AM
+# @Function: 基于SQLite的项目状态索引，记录每个项目的html、原始数据、content.json、图片下载、canny及上传状态，扫描时查询索引代替遍历项目文件夹
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Optional
+
+from config import user_settings
+from utils.io_utils import html_exists, list_gallery_image_paths
+from utils.json_utils import load_json
+
+PROJECT_STATE_FIELDS = ('has_html', 'has_data', 'has_json', 'gallery_size', 'downloaded_count', 'canny_count',
+                        'uploaded', 'embedded')
+DISK_STATE_FIELDS = ('has_html', 'has_data', 'has_json', 'gallery_size', 'downloaded_count', 'canny_count')  # 可以从项目文件夹中重新得到的字段
+
+
+def count_downloaded_images(project_dir: str) -> int:
+    """已下载的gallery图片数量（large或更大尺寸中的图片）"""
+    return len(list_gallery_image_paths(project_dir, 'image_gallery/large', allow_smaller=False))
+
+
+def count_canny_images(project_dir: str) -> int:
+    canny_dir = os.path.join(project_dir, 'image_gallery', 'canny')
+    if not os.path.isdir(canny_dir):
+        return 0
+    return sum(1 for name in os.listdir(canny_dir) if name.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp')))
+
+
+def scan_project_state(site: str, project_dir: str) -> dict:
+    """
+    从项目文件夹中读取DISK_STATE_FIELDS
+    archdaily只有has_html（content.html），gooood只有has_data（<project_id>.json），另一字段恒为False
+    """
+    project_id = os.path.basename(os.path.normpath(project_dir))
+    if site == 'gooood':
+        has_html, has_data = False, os.path.isfile(os.path.join(project_dir, f'{project_id}.json'))
+    else:
+        has_html, has_data = html_exists(project_dir), False
+    json_file_path = os.path.join(project_dir, 'content.json')
+    has_json, gallery_size = False, 0
+    if os.path.isfile(json_file_path):
+        try:
+            gallery_size = len(load_json(json_file_path).get('image_gallery', []))
+            has_json = True
+        except Exception as e:
+            logging.warning(f"project {project_id} content.json读取失败: {e}")
+    return {'has_html': has_html, 'has_data': has_data, 'has_json': has_json, 'gallery_size': gallery_size,
+            'downloaded_count': count_downloaded_images(project_dir), 'canny_count': count_canny_images(project_dir)}
+
+
+class ProjectManifest:
+    """
+    projects表每个(site, project_id)一行，各阶段在处理完项目后更新对应字段，扫描时通过(site, 字段)索引查询
+    sites表记录各网站的索引是否已完整建立（rebuild遍历完成），未建立时查询结果不完整，调用方应先rebuild
+    写入先缓存在事务中，每commit_interval秒或commit_batch次写入提交一次
+    解析进程池中的worker调用defer_updates后只记录更新，随批次结果交给主进程写入，避免多个进程争用SQLite的写锁
+    uploaded和embedded无法从项目文件夹中得到，rebuild时保留原值
+    各字段含义：
+        has_html: archdaily的content.html（任意存储格式）是否存在，gooood恒为0
+        has_data: gooood从pages中拆分出的<project_id>.json是否存在，archdaily恒为0
+        has_json: 解析结果content.json是否存在；gallery_size为其中image_gallery的数量
+        downloaded_count: image_gallery/large（或更大尺寸）中已下载的图片数量；canny_count: canny图片数量
+    """
+
+    def __init__(self, db_path: str, commit_interval: float = 1.0, commit_batch: int = 500):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.db_path = db_path
+        self.pid = os.getpid()
+        self.commit_interval = commit_interval
+        self.commit_batch = commit_batch
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS projects (
+                site TEXT NOT NULL,
+                project_id TEXT NOT NULL,
+                has_html INTEGER NOT NULL DEFAULT 0,
+                has_data INTEGER NOT NULL DEFAULT 0,
+                has_json INTEGER NOT NULL DEFAULT 0,
+                gallery_size INTEGER NOT NULL DEFAULT 0,
+                downloaded_count INTEGER NOT NULL DEFAULT 0,
+                canny_count INTEGER NOT NULL DEFAULT 0,
+                uploaded INTEGER NOT NULL DEFAULT 0,
+                embedded INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (site, project_id)
+            )''')
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(projects)')]
+        if 'has_data' not in columns:
+            # 旧版本索引中gooood的<project_id>.json记录在has_html中
+            self._conn.execute('ALTER TABLE projects ADD COLUMN has_data INTEGER NOT NULL DEFAULT 0')
+            self._conn.execute("UPDATE projects SET has_data = has_html, has_html = 0 WHERE site = 'gooood'")
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_projects_html ON projects (site, has_html, has_json)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_projects_data ON projects (site, has_data, has_json)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_projects_json ON projects (site, has_json)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_projects_downloaded ON projects (site, downloaded_count)')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS sites (
+                site TEXT PRIMARY KEY,
+                projects_dir TEXT NOT NULL,
+                built_at REAL NOT NULL
+            )''')
+        self._conn.commit()
+        self._uncommitted = 0
+        self._last_commit = time.time()
+        self._deferred_updates: Optional[list[tuple[str, list[tuple[str, dict]]]]] = None
+
+    def defer_updates(self):
+        """之后的update只记录在内存中，通过take_deferred_updates取出"""
+        with self._lock:
+            if self._deferred_updates is None:
+                self._deferred_updates = []
+
+    def take_deferred_updates(self) -> list[tuple[str, list[tuple[str, dict]]]]:
+        """返回并清空记录的更新[(site, [(project_id, fields), ...]), ...]"""
+        with self._lock:
+            updates = self._deferred_updates or []
+            if self._deferred_updates is not None:
+                self._deferred_updates = []
+            return updates
+
+    def _write(self, sql: str, params_seq: Iterable[tuple]):
+        with self._lock:
+            cursor = self._conn.executemany(sql, params_seq)
+            self._uncommitted += max(cursor.rowcount, 1)
+            if self._uncommitted >= self.commit_batch or time.time() - self._last_commit >= self.commit_interval:
+                self._commit()
+
+    def _commit(self):
+        self._conn.commit()
+        self._uncommitted = 0
+        self._last_commit = time.time()
+
+    def flush(self):
+        with self._lock:
+            self._commit()
+
+    def update(self, site: str, project_id: str, **fields):
+        """更新项目的部分字段，项目不存在时插入（其余字段为0），bool值保存为0/1"""
+        self.update_many(site, [(project_id, fields)])
+
+    def update_many(self, site: str, items: Iterable[tuple[str, dict]]):
+        """按字段组合分组写入[(project_id, fields), ...]"""
+        if self._deferred_updates is not None:
+            items = [(str(project_id), dict(fields)) for project_id, fields in items]
+            with self._lock:
+                self._deferred_updates.append((site, items))
+            return
+        groups: dict[tuple[str, ...], list[tuple]] = {}
+        now = time.time()
+        for project_id, fields in items:
+            unknown = set(fields) - set(PROJECT_STATE_FIELDS)
+            if unknown:
+                raise ValueError(f"未知的项目状态字段: {unknown}")
+            columns = tuple(sorted(fields))
+            groups.setdefault(columns, []).append(
+                (site, str(project_id), *(int(fields[column]) for column in columns), now))
+        for columns, params_seq in groups.items():
+            placeholders = ', '.join('?' * (len(columns) + 3))
+            updates = ''.join(f'{column} = excluded.{column}, ' for column in columns)
+            self._write(f'''
+                INSERT INTO projects (site, project_id, {''.join(f'{column}, ' for column in columns)}updated_at)
+                VALUES ({placeholders})
+                ON CONFLICT (site, project_id) DO UPDATE SET {updates}updated_at = excluded.updated_at''', params_seq)
+
+    def is_built(self, site: str) -> bool:
+        with self._lock:
+            return self._conn.execute('SELECT 1 FROM sites WHERE site = ?', (site,)).fetchone() is not None
+
+    def query(self, site: str, where: str = '1', params: tuple = ()) -> list[str]:
+        """
+        返回满足where条件的项目id，按project_id排序
+        :param where: 以PROJECT_STATE_FIELDS为列名的SQL条件，例如'has_json = 1 AND downloaded_count < gallery_size'
+        """
+        with self._lock:
+            self._commit()
+            return [row[0] for row in self._conn.execute(
+                f'SELECT project_id FROM projects WHERE site = ? AND ({where}) ORDER BY project_id', (site, *params))]
+
+    def query_states(self, site: str, where: str = '1', params: tuple = ()) -> dict[str, dict]:
+        """返回满足where条件的项目{project_id: {字段: 值}}"""
+        with self._lock:
+            self._commit()
+            rows = self._conn.execute(f'SELECT project_id, {", ".join(PROJECT_STATE_FIELDS)} FROM projects '
+                                      f'WHERE site = ? AND ({where}) ORDER BY project_id', (site, *params))
+            return {row[0]: dict(zip(PROJECT_STATE_FIELDS, row[1:])) for row in rows}
+
+    def count(self, site: str, where: str = '1', params: tuple = ()) -> int:
+        with self._lock:
+            self._commit()
+            return self._conn.execute(f'SELECT COUNT(*) FROM projects WHERE site = ? AND ({where})',
+                                      (site, *params)).fetchone()[0]
+
+    def get_summary(self, site: str) -> dict[str, int]:
+        """各状态的项目数量"""
+        with self._lock:
+            self._commit()
+            row = self._conn.execute('''
+                SELECT COUNT(*), SUM(has_html), SUM(has_data), SUM(has_json),
+                       SUM(has_json AND gallery_size > 0 AND downloaded_count >= gallery_size),
+                       SUM(canny_count > 0), SUM(uploaded), SUM(embedded)
+                FROM projects WHERE site = ?''', (site,)).fetchone()
+        keys = ('total', 'has_html', 'has_data', 'has_json', 'gallery_complete', 'has_canny', 'uploaded', 'embedded')
+        return {key: value or 0 for key, value in zip(keys, row)}
+
+    def rebuild(self, site: str, projects_dir: str, num_workers: int = 16,
+                should_stop: Optional[Callable[[], bool]] = None,
+                on_progress: Optional[Callable[[int], None]] = None) -> bool:
+        """
+        遍历projects_dir，重新读取所有项目的DISK_STATE_FIELDS，删除已不存在的项目，完成后将该网站标记为已建立
+        :param on_progress: 以本次完成的项目数量调用，用于更新进度
+        :return: 中途停止时返回False，此时索引保持未建立状态
+        """
+        with self._lock:
+            self._conn.execute('DELETE FROM sites WHERE site = ?', (site,))
+            self._commit()
+        project_ids = [project_id for project_id in os.listdir(projects_dir)
+                       if os.path.isdir(os.path.join(projects_dir, project_id))]
+
+        def _scan(project_id: str):
+            if should_stop is not None and should_stop():
+                return None
+            return project_id, scan_project_state(site, os.path.join(projects_dir, project_id))
+
+        batch = []
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            for result in executor.map(_scan, project_ids):
+                if result is None:
+                    continue
+                batch.append(result)
+                if len(batch) >= 1000:
+                    self.update_many(site, batch)
+                    batch.clear()
+                if on_progress is not None:
+                    on_progress(1)
+        self.update_many(site, batch)
+        if should_stop is not None and should_stop():
+            self.flush()
+            return False
+        with self._lock:
+            self._conn.execute('CREATE TEMP TABLE IF NOT EXISTS existing_ids (project_id TEXT PRIMARY KEY)')
+            self._conn.execute('DELETE FROM existing_ids')
+            self._conn.executemany('INSERT INTO existing_ids VALUES (?)', ((project_id,) for project_id in project_ids))
+            self._conn.execute('DELETE FROM projects WHERE site = ? AND project_id NOT IN '
+                               '(SELECT project_id FROM existing_ids)', (site,))
+            self._conn.execute('INSERT OR REPLACE INTO sites (site, projects_dir, built_at) VALUES (?, ?, ?)',
+                               (site, os.path.abspath(projects_dir), time.time()))
+            self._commit()
+        logging.info(f"{site}项目状态索引已重建，共{len(project_ids)}个项目")
+        return True
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            self._conn.close()
+
+
+_manifest: Optional[ProjectManifest] = None
+_manifest_lock = threading.Lock()
+
+
+def get_project_manifest() -> ProjectManifest:
+    global _manifest
+    with _manifest_lock:
+        # fork出的子进程不能使用父进程的sqlite连接
+        if _manifest is None or _manifest.db_path != user_settings.project_manifest_path or \
+                _manifest.pid != os.getpid():
+            _manifest = ProjectManifest(user_settings.project_manifest_path)
+            logging.info(f"已打开项目状态索引{user_settings.project_manifest_path}")
+        return _manifest
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+# @Author  : Yiheng Feng
+# @Time    : 10/22/2026 9:40 AM
+# @Function: 多进程解析html，绕开GIL使全量解析的速度随CPU核数增长
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Callable, Optional
+
+from config import user_settings
+
+
+def _init_worker(settings: dict):
+    from utils.manifest_utils import get_project_manifest
+    # spawn方式启动的进程会重新读取user_settings.json，这里同步主进程中的设置
+    user_settings.__dict__.update(settings)
+    # worker中的项目状态更新随批次结果交给主进程写入，worker不持有SQLite写事务
+    get_project_manifest().defer_updates()
+    logging.basicConfig(level=logging.WARNING,
+                        format="%(levelname)-8s %(asctime)-24s %(filename)-24s:%(lineno)-4d | %(message)s")
+
+
+def _parse_chunk(site: str, chunk: list[tuple[int, str]], total: int, flags: int,
+                 skip_exist: bool) -> tuple[list[tuple[str, Optional[bool]]], dict[str, str], list]:
+    """
+    在worker进程中解析一批项目，只返回每个项目的结果（True改变，False错误，None无变化）、
+    archdaily解析失败项目的错误原因{project_id: error}以及需要写入项目状态索引的更新
+    """
+    from utils.html_utils import ArchdailyFlags, GoooodFlags, parse_project_content_archdaily, \
+        parse_project_content_gooood, parse_gooood_page_file, pop_project_error
+    from utils.manifest_utils import get_project_manifest
+    results, errors = [], {}
+    for i, project_id in chunk:
+        if site == 'gooood_pages':  # project_id为page文件名，一个page包含多个项目
+            page_path = os.path.join(user_settings.gooood_results_dir, "pages", project_id)
+            results.extend(parse_gooood_page_file(page_path, GoooodFlags(flags), skip_exist))
+            continue
+        if site == 'archdaily':
+            changed = parse_project_content_archdaily(project_id, i, total, flags=ArchdailyFlags(flags))
+            if changed is False:
+                errors[project_id] = pop_project_error(project_id)
+        else:
+            content_path = os.path.join(user_settings.gooood_projects_dir, project_id, "content.json")
+            if skip_exist and os.path.exists(content_path):
+                changed = None
+            else:
+                changed = parse_project_content_gooood(project_id, i, total, flags=GoooodFlags(flags))
+        results.append((project_id, changed))
+    return results, errors, get_project_manifest().take_deferred_updates()
+
+
+def _on_chunk_done(future, on_chunk_result: Optional[Callable[[list[tuple[str, Optional[bool]]]], None]]):
+    """
+    在主进程中写入worker记录的项目状态更新，并将错误原因转存到主进程，on_chunk_result中可以通过pop_project_error取出
+    """
+    from utils.html_utils import set_project_error
+    from utils.manifest_utils import get_project_manifest
+    results, errors, manifest_updates = future.result()
+    manifest = get_project_manifest()
+    for site, items in manifest_updates:
+        manifest.update_many(site, items)
+    manifest.flush()  # on_chunk_result中可能立即查询索引
+    for project_id, error in errors.items():
+        set_project_error(project_id, error)
+    if on_chunk_result is not None:
+        on_chunk_result(results)
+
+
+def run_parse_pool(site: str, project_ids: list[str], flags: int = 0,
+                   num_workers: int = 0,
+                   chunk_size: int = 32,
+                   skip_exist: bool = False,
+                   should_stop: Optional[Callable[[], bool]] = None,
+                   on_chunk_start: Optional[Callable[[list[str]], None]] = None,
+                   on_chunk_result: Optional[Callable[[list[tuple[str, Optional[bool]]]], None]] = None) -> None:
+    """
+    将project_ids按chunk_size分批交给进程池解析，阻塞直到全部完成
+    :param site: archdaily、gooood或gooood_pages（project_ids为gooood的page文件名）
+    :param flags: ArchdailyFlags或GoooodFlags
+    :param num_workers: 进程数量，0表示使用全部CPU核
+    :param skip_exist: 仅gooood及gooood_pages，跳过已有content.json的项目
+    :param should_stop: 返回True时不再提交新的批次，已提交的批次会完成
+    :param on_chunk_start: 提交批次时在主进程中调用
+    :param on_chunk_result: 批次完成时在主进程中以[(project_id, changed), ...]调用，用于更新进度及汇总日志
+    """
+    num_workers = num_workers or os.cpu_count() or 1
+    total = len(project_ids)
+    chunks = ([(i, project_ids[i]) for i in range(start, min(start + chunk_size, total))]
+              for start in range(0, total, chunk_size))
+    with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker,
+                             initargs=(dict(user_settings.__dict__),)) as executor:
+        pending = set()
+        for chunk in chunks:
+            if should_stop is not None and should_stop():
+                break
+            if len(pending) >= num_workers * 2:  # 限制已提交的批次，停止时能尽快结束
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    _on_chunk_done(future, on_chunk_result)
+            if on_chunk_start is not None:
+                on_chunk_start([project_id for _, project_id in chunk])
+            pending.add(executor.submit(_parse_chunk, site, chunk, total, int(flags), skip_exist))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                _on_chunk_done(future, on_chunk_result)
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+# @Author  : Yiheng Feng
+# @Time    : 10/17/2026 2:20 PM
+# @Function: 按host的AIMD自适应并发控制器，健康时加性提高并发，遇到限流或错误时乘性降低
+import asyncio
+import logging
+import threading
+import time
+from typing import Callable, Optional
+from urllib.parse import urlparse
+
+from config import user_settings
+
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+class AimdController:
+    def __init__(self, host: str,
+                 max_concurrency: int,
+                 min_concurrency: int = 1,
+                 initial_concurrency: Optional[int] = None,
+                 additive_step: float = 1.0,
+                 decrease_factor: float = 0.5,
+                 latency_tolerance: float = 3.0):
+        """
+        :param host: 控制的host，仅用于显示
+        :param max_concurrency: 并发上限，一般等于worker数量
+        :param additive_step: 每完成约limit个健康请求，limit增加的值
+        :param decrease_factor: 限流或错误时limit乘以的系数
+        :param latency_tolerance: 延迟超过基线延迟的倍数时视为不健康，停止增长
+        """
+        self.host = host
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.additive_step = additive_step
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+
+        initial = initial_concurrency if initial_concurrency is not None else min(8, self.max_concurrency)
+        self._limit = float(max(self.min_concurrency, min(initial, self.max_concurrency)))
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._async_waiters: list[asyncio.Future] = []  # 各事件循环中等待名额的acquire_async
+        self._base_latency: Optional[float] = None  # 观察到的最小平滑延迟
+        self._ewma_latency: Optional[float] = None
+        self._last_decrease = 0.0
+        self._cooldown_until = 0.0
+
+        self._success_count = 0
+        self._throttled_count = 0
+        self._error_count = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def try_acquire(self) -> bool:
+        """非阻塞地占用一个并发名额"""
+        with self._cond:
+            if time.time() < self._cooldown_until or self._in_flight >= int(self._limit):
+                return False
+            self._in_flight += 1
+            return True
+
+    def try_acquire_or_wait(self, loop: asyncio.AbstractEventLoop) -> Optional[asyncio.Future]:
+        """
+        占用一个并发名额，成功时返回None；否则返回loop中的future，名额被归还或limit变化时被唤醒
+        检查与登记在同一把锁内完成，不会错过两者之间的唤醒
+        """
+        with self._cond:
+            if time.time() >= self._cooldown_until and self._in_flight < int(self._limit):
+                self._in_flight += 1
+                return None
+            waiter = loop.create_future()
+            self._async_waiters.append(waiter)
+            return waiter
+
+    def discard_waiter(self, waiter: asyncio.Future):
+        with self._cond:
+            if waiter in self._async_waiters:
+                self._async_waiters.remove(waiter)
+
+    def get_cooldown_remaining(self) -> float:
+        return max(0.0, self._cooldown_until - time.time())
+
+    def set_max_concurrency(self, max_concurrency: int):
+        with self._cond:
+            self.max_concurrency = max(1, max_concurrency)
+            self._limit = min(self._limit, self.max_concurrency)
+            self._notify_all()
+
+    def _notify_all(self):
+        """唤醒所有等待者，需在持有self._cond时调用；asyncio的等待者通过call_soon_threadsafe在各自的事件循环中唤醒"""
+        self._cond.notify_all()
+        for waiter in self._async_waiters:
+            try:
+                waiter.get_loop().call_soon_threadsafe(_wake_waiter, waiter)
+            except RuntimeError:  # 事件循环已关闭
+                pass
+        self._async_waiters.clear()
+
+    def acquire(self, should_stop: Optional[Callable[[], bool]] = None) -> bool:
+        """阻塞直到获得并发名额，should_stop返回True时放弃并返回False"""
+        with self._cond:
+            while time.time() < self._cooldown_until or self._in_flight >= int(self._limit):
+                if should_stop is not None and should_stop():
+                    return False
+                self._cond.wait(timeout=0.1)
+            self._in_flight += 1
+            return True
+
+    def release(self, status_code: Optional[int], latency: float, retry_after: Optional[str] = None):
+        """
+        归还并发名额并根据请求结果调整limit
+        :param status_code: HTTP状态码，请求异常（超时、连接错误等）时传入None
+        :param latency: 请求耗时（秒）
+        :param retry_after: 响应头中的Retry-After
+        """
+        now = time.time()
+        with self._cond:
+            self._in_flight = max(0, self._in_flight - 1)
+            if status_code is None or status_code >= 500 or status_code in THROTTLE_STATUS_CODES:
+                if status_code in THROTTLE_STATUS_CODES:
+                    self._throttled_count += 1
+                else:
+                    self._error_count += 1
+                self._decrease(now)
+                if retry_after is not None and retry_after.strip().isdigit():
+                    self._cooldown_until = max(self._cooldown_until, now + int(retry_after.strip()))
+            else:
+                self._success_count += 1
+                self._ewma_latency = latency if self._ewma_latency is None else \
+                    0.8 * self._ewma_latency + 0.2 * latency
+                if self._base_latency is None or self._ewma_latency < self._base_latency:
+                    self._base_latency = self._ewma_latency
+                if self._ewma_latency <= self._base_latency * self.latency_tolerance:
+                    # 类似TCP拥塞避免，每完成limit个请求limit增加additive_step
+                    self._limit = min(self.max_concurrency, self._limit + self.additive_step / self._limit)
+            self._notify_all()
+
+    def cancel(self):
+        """归还并发名额但不调整limit，用于被主动取消的请求"""
+        with self._cond:
+            self._in_flight = max(0, self._in_flight - 1)
+            self._notify_all()
+
+    def _decrease(self, now: float):
+        # 同一批在途请求的失败只降低一次，避免limit瞬间被降到最低
+        backoff_window = max(1.0, self._ewma_latency or 0.0)
+        if now - self._last_decrease < backoff_window:
+            return
+        self._last_decrease = now
+        old_limit = self._limit
+        self._limit = max(self.min_concurrency, self._limit * self.decrease_factor)
+        logging.warning(f"{self.host} 出现限流或错误，并发由{int(old_limit)}降低至{int(self._limit)}")
+
+    def get_status_str(self) -> str:
+        latency = f"{self._ewma_latency:.2f}s" if self._ewma_latency is not None else "-"
+        cooldown = max(0, int(self._cooldown_until - time.time()))
+        status = f"{self.host} 并发: {self._in_flight}/{self.limit} (上限{self.max_concurrency}) 延迟: {latency} " \
+                 f"成功: {self._success_count} 限流: {self._throttled_count} 错误: {self._error_count}"
+        if cooldown > 0:
+            status += f" 冷却中: {cooldown}s"
+        return status
+
+
+def controlled_get(session, url: str, controller: Optional[AimdController] = None, **kwargs):
+    """
+    使用controller限制并发的session.get，controller为None时等价于session.get
+    请求异常会被记录为错误并继续抛出
+    """
+    if controller is None:
+        return session.get(url, **kwargs)
+    controller.acquire()
+    start_time = time.time()
+    status_code, retry_after = None, None
+    try:
+        response = session.get(url, **kwargs)
+        status_code, retry_after = response.status_code, response.headers.get('Retry-After')
+        return response
+    finally:
+        controller.release(status_code, time.time() - start_time, retry_after)
+
+
+def _wake_waiter(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+async def acquire_async(controller: Optional[AimdController]):
+    """asyncio版本的acquire，等待release/cancel唤醒而不阻塞事件循环；冷却期间等到冷却结束再重试"""
+    if controller is None:
+        return
+    loop = asyncio.get_running_loop()
+    while True:
+        waiter = controller.try_acquire_or_wait(loop)
+        if waiter is None:
+            return
+        cooldown = controller.get_cooldown_remaining()
+        try:
+            await asyncio.wait_for(waiter, timeout=cooldown if cooldown > 0 else None)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            controller.discard_waiter(waiter)
+
+
+_controllers: dict[str, AimdController] = {}
+_controllers_lock = threading.Lock()
+
+
+def get_all_controllers() -> list[AimdController]:
+    with _controllers_lock:
+        return list(_controllers.values())
+
+
+def get_controller(url: str, max_concurrency: int) -> Optional[AimdController]:
+    """
+    获取url所在host的AIMD控制器，同一host在多次任务之间共享学习到的limit
+    user_settings.crawl_adaptive_concurrency为False时返回None，调用方退回到固定并发
+    """
+    if not user_settings.crawl_adaptive_concurrency:
+        return None
+    host = urlparse(url).netloc or url
+    with _controllers_lock:
+        controller = _controllers.get(host)
+        if controller is None:
+            controller = AimdController(host, max_concurrency,
+                                        min_concurrency=user_settings.crawl_min_concurrency)
+            _controllers[host] = controller
+        else:
+            controller.set_max_concurrency(max_concurrency)
+        return controller
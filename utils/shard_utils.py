@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+# @Author  : Yiheng Feng
+# @Time    : 10/23/2026 3:40 PM
+# @Function: 将gallery图片打包保存在tar格式的shard中（WebDataset风格），通过偏移量索引随机读取，或按shard顺序读取
+import hashlib
+import io
+import logging
+import os
+import sqlite3
+import tarfile
+import threading
+import time
+from typing import Iterable, Iterator, Optional
+
+from config import user_settings
+
+SHARD_DIR_NAME = 'image_shards'  # 位于projects_dir旁，例如./results/archdaily/image_shards
+SHARD_INDEX_FILE_NAME = 'index.sqlite3'
+_TAR_BLOCK = 512
+_TAR_END = b'\0' * (_TAR_BLOCK * 2)
+
+
+def get_shard_root(projects_dir: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(os.path.normpath(projects_dir))), SHARD_DIR_NAME)
+
+
+def split_gallery_image_path(img_path: str) -> Optional[tuple[str, str, str, str]]:
+    """
+    将<projects_dir>/<project_id>/image_gallery/<variant>/<name>拆分为(projects_dir, project_id, variant, name)
+    不是gallery图片路径时返回None
+    """
+    variant_dir, name = os.path.split(os.path.abspath(os.path.normpath(img_path)))
+    gallery_dir, variant = os.path.split(variant_dir)
+    project_dir, gallery_name = os.path.split(gallery_dir)
+    if gallery_name != 'image_gallery':
+        return None
+    projects_dir, project_id = os.path.split(project_dir)
+    return projects_dir, project_id, variant, name
+
+
+class ImageShardStore:
+    """
+    文件布局：
+        <root>/shard-00000.tar   标准tar文件，成员名为<project_id>/<variant>/<文件名>，可以直接用tar或webdataset读取
+        <root>/index.sqlite3     images表记录每张图片所在的shard、数据偏移量及长度，用于随机读取
+    追加写入时覆盖当前shard末尾的tar结束标记，写入tar头和数据后重新补上结束标记，shard始终是完整的tar文件
+    当前shard超过max_shard_bytes后写入下一个shard；同一url或相同内容的图片只保存一份，多条索引指向同一位置
+    只允许一个进程写入，读取不受限制
+    """
+
+    def __init__(self, root: str, max_shard_bytes: int = 1024 ** 3, commit_interval: float = 1.0):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.max_shard_bytes = max_shard_bytes
+        self.commit_interval = commit_interval
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(root, SHARD_INDEX_FILE_NAME), timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS images (
+                project_id TEXT NOT NULL,
+                variant TEXT NOT NULL,
+                name TEXT NOT NULL,
+                shard INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                url TEXT,
+                PRIMARY KEY (project_id, variant, name)
+            )''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_images_position ON images (shard, offset)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_images_sha256 ON images (sha256)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_images_url ON images (url)')
+        self._conn.commit()
+        self._last_commit = time.time()
+        self._writer: Optional[io.BufferedRandom] = None
+        self._readers: dict[int, io.FileIO] = {}
+        self._reader_lock = threading.Lock()
+        self._shard, self._end = self._resume_position()
+
+    def shard_path(self, shard: int) -> str:
+        return os.path.join(self.root, f'shard-{shard:05d}.tar')
+
+    def _resume_position(self) -> tuple[int, int]:
+        """从索引中得到当前shard及已登记数据的末尾，之后的残留数据（上次写入后未提交索引）会被覆盖"""
+        shard = self._conn.execute('SELECT MAX(shard) FROM images').fetchone()[0]
+        if shard is None:
+            return 0, 0
+        end = self._conn.execute('SELECT MAX(offset + size) FROM images WHERE shard = ?', (shard,)).fetchone()[0]
+        return shard, end + (-end) % _TAR_BLOCK
+
+    def _commit(self, force: bool = False):
+        if force or time.time() - self._last_commit >= self.commit_interval:
+            self._conn.commit()
+            self._last_commit = time.time()
+
+    def flush(self, sync: bool = False):
+        """:param sync: 同时将shard数据写入磁盘(fsync)，删除原图片文件前使用"""
+        with self._lock:
+            if self._writer is not None:
+                self._writer.flush()
+                if sync:
+                    os.fsync(self._writer.fileno())
+            self._commit(force=True)
+
+    def _insert(self, project_id: str, variant: str, name: str, position: tuple[int, int, int], sha256: str,
+                url: Optional[str]):
+        self._conn.execute('INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                           (str(project_id), variant, name, *position, sha256, url))
+        self._commit()
+
+    def _write_member(self, member_name: str, data: bytes) -> tuple[int, int, int]:
+        if self._end > 0 and self._end + len(data) > self.max_shard_bytes:
+            self._close_writer()
+            self._shard, self._end = self._shard + 1, 0
+        if self._writer is None:
+            shard_path = self.shard_path(self._shard)
+            self._writer = open(shard_path, 'r+b' if os.path.isfile(shard_path) else 'w+b')
+        tar_info = tarfile.TarInfo(member_name)
+        tar_info.size = len(data)
+        tar_info.mtime = int(time.time())
+        header = tar_info.tobuf(format=tarfile.GNU_FORMAT)  # 超长的成员名使用GNU扩展头
+        offset = self._end + len(header)
+        self._writer.seek(self._end)
+        self._writer.write(header + data + b'\0' * ((-len(data)) % _TAR_BLOCK) + _TAR_END)
+        self._writer.truncate()
+        self._writer.flush()
+        self._end = offset + len(data) + (-len(data)) % _TAR_BLOCK
+        return self._shard, offset, len(data)
+
+    def _close_writer(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def append(self, project_id: str, variant: str, name: str, data: bytes, url: Optional[str] = None) -> str:
+        """
+        保存一张图片，相同内容的图片只写入一次
+        :return: 图片内容的sha256
+        """
+        sha256 = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            row = self._conn.execute('SELECT shard, offset, size FROM images WHERE sha256 = ? LIMIT 1',
+                                     (sha256,)).fetchone()
+            position = tuple(row) if row is not None else self._write_member(f'{project_id}/{variant}/{name}', data)
+            self._insert(project_id, variant, name, position, sha256, url)
+        return sha256
+
+    def link_url(self, project_id: str, variant: str, name: str, url: str) -> Optional[str]:
+        """url已经保存过时直接为该图片登记索引，不需要重新下载，返回sha256；未保存过时返回None"""
+        with self._lock:
+            row = self._conn.execute('SELECT shard, offset, size, sha256 FROM images WHERE url = ? LIMIT 1',
+                                     (url,)).fetchone()
+            if row is None:
+                return None
+            self._insert(project_id, variant, name, tuple(row[:3]), row[3], url)
+            return row[3]
+
+    def locate(self, project_id: str, variant: str, name: str) -> Optional[tuple[int, int, int]]:
+        """返回图片的(shard, offset, size)，不存在时返回None"""
+        with self._lock:
+            row = self._conn.execute('SELECT shard, offset, size FROM images WHERE project_id = ? AND variant = ? '
+                                     'AND name = ?', (str(project_id), variant, name)).fetchone()
+        return tuple(row) if row is not None else None
+
+    def get_sha256(self, project_id: str, variant: str, name: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute('SELECT sha256 FROM images WHERE project_id = ? AND variant = ? AND name = ?',
+                                     (str(project_id), variant, name)).fetchone()
+        return row[0] if row is not None else None
+
+    def list_project_images(self, project_id: str) -> dict[str, list[str]]:
+        """返回项目保存在shard中的图片{variant: [文件名, ...]}"""
+        with self._lock:
+            rows = self._conn.execute('SELECT variant, name FROM images WHERE project_id = ? ORDER BY name',
+                                      (str(project_id),)).fetchall()
+        images: dict[str, list[str]] = {}
+        for variant, name in rows:
+            images.setdefault(variant, []).append(name)
+        return images
+
+    def _read_at(self, shard: int, offset: int, size: int) -> bytes:
+        with self._reader_lock:
+            reader = self._readers.get(shard)
+            if reader is None:
+                # 不使用缓冲，正在追加的shard也能读到最新写入的数据
+                reader = self._readers[shard] = open(self.shard_path(shard), 'rb', buffering=0)
+        if hasattr(os, 'pread'):
+            return os.pread(reader.fileno(), size, offset)
+        with self._reader_lock:
+            reader.seek(offset)
+            return reader.read(size)
+
+    def read(self, project_id: str, variant: str, name: str) -> Optional[bytes]:
+        position = self.locate(project_id, variant, name)
+        return self._read_at(*position) if position is not None else None
+
+    def iter_images(self, variant: Optional[str] = None,
+                    project_ids: Optional[Iterable[str]] = None) -> Iterator[tuple[str, str, str, bytes]]:
+        """
+        按shard内的存储顺序读取图片，I/O为顺序读取，适合遍历全部图片计算特征
+        :return: (project_id, variant, name, data)
+        """
+        self.flush()
+        project_ids = set(map(str, project_ids)) if project_ids is not None else None
+        with self._lock:
+            sql = 'SELECT project_id, variant, name, shard, offset, size FROM images'
+            params = ()
+            if variant is not None:
+                sql, params = sql + ' WHERE variant = ?', (variant,)
+            rows = self._conn.execute(sql + ' ORDER BY shard, offset', params).fetchall()
+        shard_file, current_shard = None, None
+        try:
+            for project_id, row_variant, name, shard, offset, size in rows:
+                if project_ids is not None and project_id not in project_ids:
+                    continue
+                if shard != current_shard:
+                    if shard_file is not None:
+                        shard_file.close()
+                    shard_file, current_shard = open(self.shard_path(shard), 'rb', buffering=8 * 1024 * 1024), shard
+                shard_file.seek(offset)
+                yield project_id, row_variant, name, shard_file.read(size)
+        finally:
+            if shard_file is not None:
+                shard_file.close()
+
+    def close(self):
+        with self._lock:
+            self._close_writer()
+            self._commit(force=True)
+            self._conn.close()
+        with self._reader_lock:
+            for reader in self._readers.values():
+                reader.close()
+            self._readers.clear()
+
+
+_stores: dict[str, ImageShardStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_shard_store(projects_dir: str, create: bool = False) -> Optional[ImageShardStore]:
+    """返回projects_dir对应的shard存储，尚未创建且create为False时返回None"""
+    root = get_shard_root(projects_dir)
+    with _stores_lock:
+        store = _stores.get(root)
+        if store is None:
+            if not create and not os.path.isfile(os.path.join(root, SHARD_INDEX_FILE_NAME)):
+                return None
+            store = _stores[root] = ImageShardStore(root, user_settings.image_shard_max_bytes)
+            logging.info(f"已打开图片shard存储{root}")
+        return store
+
+
+def list_shard_images(project_dir: str) -> dict[str, list[str]]:
+    """返回项目保存在shard中的图片{variant: [文件名, ...]}，没有shard存储时返回空字典"""
+    projects_dir, project_id = os.path.split(os.path.abspath(os.path.normpath(project_dir)))
+    store = get_shard_store(projects_dir)
+    return store.list_project_images(project_id) if store is not None else {}
+
+
+def _locate_gallery_image(img_path: str) -> Optional[tuple[ImageShardStore, str, str, str]]:
+    parts = split_gallery_image_path(img_path)
+    if parts is None:
+        return None
+    store = get_shard_store(parts[0])
+    return (store, *parts[1:]) if store is not None else None
+
+
+def gallery_image_exists(img_path: str) -> bool:
+    """图片文件存在，或者图片已保存在shard中"""
+    if os.path.isfile(img_path):
+        return True
+    located = _locate_gallery_image(img_path)
+    return located is not None and located[0].locate(*located[1:]) is not None
+
+
+def get_gallery_image_sha256(img_path: str) -> Optional[str]:
+    """图片保存在shard中时返回索引中记录的sha256，否则返回None（单独文件的sha256记录在blob_index.json中）"""
+    located = _locate_gallery_image(img_path)
+    return located[0].get_sha256(*located[1:]) if located is not None else None
+
+
+def read_gallery_image(img_path: str) -> bytes:
+    """读取gallery图片，文件不存在时从shard中读取，均不存在时抛出FileNotFoundError"""
+    if os.path.isfile(img_path):
+        with open(img_path, 'rb') as f:
+            return f.read()
+    located = _locate_gallery_image(img_path)
+    data = located[0].read(*located[1:]) if located is not None else None
+    if data is None:
+        raise FileNotFoundError(img_path)
+    return data
+
+
+def open_gallery_image(img_path: str):
+    """与Image.open(img_path)相同，图片保存在shard中时从shard读取"""
+    from PIL import Image
+    if os.path.isfile(img_path):
+        return Image.open(img_path)
+    return Image.open(io.BytesIO(read_gallery_image(img_path)))
+
+
+def shard_position_key(img_path: str) -> tuple:
+    """排序键，按图片在shard中的位置排序使读取尽量为顺序I/O，不在shard中的图片排在最后"""
+    located = _locate_gallery_image(img_path)
+    position = located[0].locate(*located[1:]) if located is not None else None
+    return (0, *position[:2], '') if position is not None else (1, 0, 0, img_path)